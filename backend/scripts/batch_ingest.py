@@ -0,0 +1,166 @@
+"""
+batch_ingest.py
+
+Ingest a whole supplier drop: many workbooks, and every sheet in them.
+
+`discover_workbooks` expands a directory (every .xlsx/.xlsm below it) or a glob
+pattern into workbook paths and `sheet_tasks` turns them into one task per
+(workbook, sheet). `run_batch` parses the tasks on a process pool: each worker
+streams its sheet (see `workbook_stream.py`), maps and validates the rows (see
+`column_mapping.py`), writes them in COPY text format to a spool file and
+streams the sheet's embedded images out of the zip (see `xlsx_media.py`) into
+the content-addressed store (see `image_store.py`), so parallel workers never
+write the same file twice. The parent process is the only DB writer: it COPYs
+each spool file into one staging table as soon as the worker finishes and merges
+everything into lego_products at the end, so the database sees a single bulk
+load and the drop lands in one transaction.
+
+A product id present in several sheets ends up with the values of the last one,
+in (workbook path, sheet) order, just like an id repeated within one sheet.
+"""
+
+import functools
+import glob
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+from psycopg2 import sql
+
+from bulk_load import PRODUCT_COLUMNS, STAGE_TABLE, copy_text, create_stage, merge_stage
+from column_mapping import REJECT_FIELDS, ColumnMapping, iter_mapped
+from image_store import store_image_stream
+from workbook_stream import WorkbookStream
+from xlsx_media import SheetMedia
+
+WORKBOOK_SUFFIXES = ('.xlsx', '.xlsm')
+# rows of task n are staged with stage_seq (n << SEQ_BITS) + row index, so later sheets win
+SEQ_BITS = 32
+
+
+def is_batch_source(source):
+	"""True when `source` names a directory or a glob pattern rather than one workbook."""
+	return os.path.isdir(source) or any(c in source for c in '*?[')
+
+
+def discover_workbooks(source):
+	if os.path.isdir(source):
+		paths = [p for p in Path(source).rglob('*') if p.suffix.lower() in WORKBOOK_SUFFIXES]
+	else:
+		paths = [Path(p) for p in glob.glob(source, recursive=True)]
+	# Excel leaves ~$name.xlsx lock files next to open workbooks
+	return sorted(p for p in paths if p.is_file() and not p.name.startswith('~$'))
+
+
+def sheet_tasks(workbooks, sheet_name=None, all_sheets=False):
+	"""Return `(tasks, failed)`: an `(index, workbook path, sheet name)` task per sheet
+	to ingest, a None sheet being the active one, and a failed result (shaped like
+	the ones `run_batch` reports) per workbook whose sheet list could not be read."""
+	tasks = []
+	failed = []
+	for path in workbooks:
+		if all_sheets:
+			try:
+				wb = load_workbook(path, read_only=True)
+				try:
+					names = list(wb.sheetnames)
+				finally:
+					wb.close()
+			except Exception as e:
+				failed.append({'workbook': str(path), 'sheet': None, 'error': f'{type(e).__name__}: {e}'})
+				continue
+		else:
+			names = [sheet_name]
+		for name in names:
+			tasks.append((len(tasks), str(path), name))
+	return tasks, failed
+
+
+def parse_sheet(task, id_header, spool_dir, upload_base, dry_run=False):
+	"""Worker: spool one sheet's rows for COPY and store its images."""
+	index, path, sheet_name = task
+	with WorkbookStream(path, sheet_name=sheet_name, id_header=id_header) as stream:
+		mapping = ColumnMapping(stream.headers, id_header=stream.id_header)
+		fd, spool = tempfile.mkstemp(dir=spool_dir, prefix=f'{index:06d}-', suffix='.copy')
+		rejected = []
+		staged = 0
+		with os.fdopen(fd, 'w', encoding='utf-8') as out:
+			for batch, _consumed in iter_mapped(stream, mapping):
+				seq_start = (index << SEQ_BITS) + staged
+				out.write(copy_text(batch.rows.assign(stage_seq=range(seq_start, seq_start + len(batch)))))
+				staged += len(batch)
+				if len(batch.rejected):
+					rejected.append(batch.rejected)
+		result = {
+			'index': index, 'workbook': path, 'sheet': stream.sheet_title, 'spool': spool, 'rows': stream.row_count,
+			'rejected': pd.concat(rejected, ignore_index=True) if rejected else pd.DataFrame(columns=REJECT_FIELDS),
+		}
+		row_ids = stream.row_ids
+	pictures = []
+	errors = []
+	written = 0
+	bytes_written = 0
+	with SheetMedia(path, result['sheet']) as media:
+		for ref in media:
+			product_id = row_ids.get(ref.row) if ref.row is not None else None
+			if product_id is None:
+				errors.append(f'image anchored to row {ref.row} has no product id, skipped')
+				continue
+			try:
+				with media.open(ref) as src:
+					url, is_new, size = store_image_stream(src, product_id, upload_base, dry_run=dry_run, ext=ref.ext)
+			except Exception as e:
+				errors.append(f'failed to extract image bytes for row {ref.row}: {e}')
+				continue
+			pictures.append((product_id, url))
+			written += is_new
+			if is_new and not dry_run:
+				bytes_written += size
+	result.update(pictures=pictures, images_written=written, bytes_written=bytes_written, errors=errors)
+	return result
+
+
+def _copy_spool(cur, spool):
+	columns = sql.SQL(', ').join(map(sql.Identifier, PRODUCT_COLUMNS + ('stage_seq',)))
+	with open(spool, encoding='utf-8') as f:
+		cur.copy_expert(sql.SQL('COPY {} ({}) FROM STDIN').format(sql.Identifier(STAGE_TABLE), columns), f)
+
+
+def run_batch(tasks, upload_base, conn=None, id_header='id', workers=None, dry_run=False, on_result=None):
+	"""Parse `tasks` on `workers` processes, staging their rows on `conn` as they finish.
+
+	Returns `(results, (inserted, updated))` with one result dict per task in task
+	order; a task that failed carries an `error` instead of rows and pictures.
+	`on_result(result)` is called in completion order. Without `conn` rows are
+	parsed but not written. Does not commit."""
+	cur = None
+	if conn is not None:
+		cur = conn.cursor()
+		create_stage(cur)
+	results = {}
+	merged = (0, 0)
+	with tempfile.TemporaryDirectory(prefix='lego-batch-') as spool_dir:
+		parse = functools.partial(parse_sheet, id_header=id_header, spool_dir=spool_dir, upload_base=upload_base, dry_run=dry_run)
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			futures = {pool.submit(parse, task): task for task in tasks}
+			for fut in as_completed(futures):
+				index, path, sheet_name = futures[fut]
+				try:
+					result = fut.result()
+				except Exception as e:
+					result = {'index': index, 'workbook': path, 'sheet': sheet_name, 'error': f'{type(e).__name__}: {e}'}
+				else:
+					if cur is not None:
+						_copy_spool(cur, result['spool'])
+					os.remove(result.pop('spool'))
+				results[index] = result
+				if on_result is not None:
+					on_result(result)
+	if cur is not None:
+		inserted, updated, _deleted = merge_stage(cur)
+		merged = (inserted, updated)
+		cur.close()
+	return [results[index] for index in sorted(results)], merged
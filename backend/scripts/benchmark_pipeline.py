@@ -0,0 +1,258 @@
+"""
+benchmark_pipeline.py
+
+Measure how the import pipeline scales.
+
+For every requested size a synthetic workbook with N rows and M embedded images
+is generated (see synthetic_workbook.py) and each stage is run on its own,
+in pipeline order:
+
+  ingest   combined_script.extract_data_from_excel
+  images   combined_script.extract_images (with the DB picture update)
+  export   combined_script.export_to_json
+  rescan   combined_script.update_db_images_by_name (full scan)
+  import   import_lego_products.import_products, fed the export just written
+
+Wall time, rows/sec, images/sec and peak RSS are reported per stage. On Linux the
+RSS high-water mark is reset before each stage (/proc/self/clear_refs), so the
+peak belongs to that stage; elsewhere it is the process peak so far.
+
+Everything runs against a scratch database (`--database`, dropped afterwards
+unless `--keep-db`) so the real catalog is never touched, on the server from the
+PG_* settings or, with `--embedded`, on a throwaway PostgreSQL started through
+the `pgserver` package. Images and exports go to a temporary directory.
+
+Usage:
+  python backend/scripts/benchmark_pipeline.py --rows 1000,10000 --images 100,1000 [--embedded] [--report bench.json]
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import psycopg2
+
+import db
+from json_stream import read_json_records
+from synthetic_workbook import generate_workbook
+
+ROOT = Path(__file__).resolve().parents[2]
+STAGES = ('ingest', 'images', 'export', 'rescan', 'import')
+DEFAULT_DATABASE = 'lego_store_bench'
+
+
+def parse_counts(value):
+	try:
+		counts = [int(v) for v in value.split(',') if v.strip()]
+	except ValueError:
+		raise argparse.ArgumentTypeError(f'expected comma separated integers, got {value!r}')
+	if not counts or any(c < 0 for c in counts):
+		raise argparse.ArgumentTypeError(f'expected comma separated non-negative integers, got {value!r}')
+	return counts
+
+
+def _reset_peak_rss():
+	try:
+		with open('/proc/self/clear_refs', 'w') as f:
+			f.write('5')
+		return True
+	except OSError:
+		return False
+
+
+def _peak_rss_bytes():
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmHWM:'):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_stage(name, fn, verbose=False):
+	"""Run `fn() -> (rows, images)` and return its measurements."""
+	per_stage = _reset_peak_rss()
+	out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+	started = time.perf_counter()
+	with out:
+		rows, images = fn()
+	elapsed = time.perf_counter() - started
+	return {
+		'stage': name,
+		'seconds': round(elapsed, 4),
+		'rows': rows,
+		'images': images,
+		'rows_per_sec': round(rows / elapsed, 1) if rows and elapsed > 0 else None,
+		'images_per_sec': round(images / elapsed, 1) if images and elapsed > 0 else None,
+		'peak_rss_mb': round(_peak_rss_bytes() / 2 ** 20, 1),
+		'peak_rss_scope': 'stage' if per_stage else 'process',
+	}
+
+
+@contextlib.contextmanager
+def embedded_server(workdir):
+	try:
+		import pgserver
+	except ImportError:
+		raise SystemExit('--embedded needs the pgserver package: pip install pgserver')
+	server = pgserver.get_server(workdir / 'pgdata', cleanup_mode='stop')
+	query = parse_qs(urlparse(server.get_uri()).query)
+	os.environ.update({'PG_HOST': query['host'][0], 'PG_PORT': '5432', 'PG_USER': 'postgres', 'PG_PASSWORD': ''})
+	try:
+		yield
+	finally:
+		server.cleanup()
+
+
+@contextlib.contextmanager
+def scratch_database(name, keep=False):
+	"""Create an empty database `name` and point the db module at it."""
+	config = db.get_db_config()
+	if name == config['database']:
+		raise SystemExit(f'Refusing to benchmark against the configured database {name!r}; pick another --database')
+
+	def _admin(statement):
+		conn = psycopg2.connect(**dict(config, database='postgres'))
+		conn.autocommit = True
+		try:
+			conn.cursor().execute(statement)
+		finally:
+			conn.close()
+
+	_admin(f'DROP DATABASE IF EXISTS "{name}"')
+	_admin(f'CREATE DATABASE "{name}"')
+	previous = os.environ.get('PG_DATABASE')
+	os.environ['PG_DATABASE'] = name
+	db.close_pool()
+	try:
+		yield
+	finally:
+		db.close_pool()
+		if previous is None:
+			os.environ.pop('PG_DATABASE', None)
+		else:
+			os.environ['PG_DATABASE'] = previous
+		if not keep:
+			_admin(f'DROP DATABASE IF EXISTS "{name}"')
+
+
+def _load_importer():
+	spec = importlib.util.spec_from_file_location('import_lego_products', ROOT / 'import_lego_products.py')
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+
+def benchmark_size(rows, images, workdir, workers=1, batch_size=None, verbose=False):
+	import combined_script
+
+	size_dir = workdir / f'{rows}x{images}'
+	uploads = size_dir / 'uploads'
+	uploads.mkdir(parents=True)
+	# keep the benchmark's images out of public/uploads
+	combined_script.UPLOAD_BASE = uploads
+	batch_size = batch_size or combined_script.DEFAULT_BATCH_SIZE
+	xlsx = size_dir / 'catalog.xlsx'
+	export = size_dir / 'export.json'
+
+	started = time.perf_counter()
+	generate_workbook(xlsx, rows, images)
+	result = {
+		'rows': rows,
+		'images': images,
+		'workbook_bytes': xlsx.stat().st_size,
+		'generate_seconds': round(time.perf_counter() - started, 4),
+		'stages': [],
+	}
+
+	def ingest():
+		return combined_script.extract_data_from_excel(xlsx, id_header='name', batch_size=batch_size), 0
+
+	def extract():
+		mapping = combined_script.extract_images(xlsx, id_header='name', update_db=True, workers=workers)
+		return len(mapping), sum(len(urls) for urls in mapping.values())
+
+	def export_json():
+		return combined_script.export_to_json(export), 0
+
+	def rescan():
+		_changed, updates, _unmatched = combined_script.update_db_images_by_name(full=True)
+		return len(updates), sum(len(urls) for _name, urls in updates.values())
+
+	def import_json():
+		importer = _load_importer()
+		with db.connection('import') as conn:
+			return importer.import_products(conn, read_json_records(export), batch_size=batch_size), 0
+
+	for name, fn in zip(STAGES, (ingest, extract, export_json, rescan, import_json)):
+		result['stages'].append(run_stage(name, fn, verbose=verbose))
+	return result
+
+
+def print_result(result):
+	print(f"\n{result['rows']} rows / {result['images']} images "
+		f"(workbook {result['workbook_bytes'] / 2 ** 20:.1f} MB, generated in {result['generate_seconds']:.2f}s)")
+	print(f"  {'stage':<8} {'seconds':>9} {'rows/s':>10} {'images/s':>10} {'peak RSS':>10}")
+	for s in result['stages']:
+		rows_rate = f"{s['rows_per_sec']:.0f}" if s['rows_per_sec'] else '-'
+		image_rate = f"{s['images_per_sec']:.0f}" if s['images_per_sec'] else '-'
+		print(f"  {s['stage']:<8} {s['seconds']:>9.3f} {rows_rate:>10} {image_rate:>10} {s['peak_rss_mb']:>8.1f}MB")
+
+
+def main():
+	p = argparse.ArgumentParser(description='Benchmark the lego_products import pipeline on synthetic workbooks')
+	p.add_argument('--rows', type=parse_counts, default=[1000], help='Comma separated row counts (default: 1000)')
+	p.add_argument('--images', type=parse_counts, default=[100], help='Comma separated image counts, paired with --rows; a single value applies to every size (default: 100)')
+	p.add_argument('--workers', type=int, default=1, help='Image extraction threads (default: 1)')
+	p.add_argument('--batch-size', type=int, default=None, help='Rows per COPY batch (default: the pipeline default)')
+	p.add_argument('--database', default=DEFAULT_DATABASE, help=f'Scratch database to create and drop (default: {DEFAULT_DATABASE})')
+	p.add_argument('--keep-db', action='store_true', help='Keep the scratch database afterwards')
+	p.add_argument('--embedded', action='store_true', help='Run against a throwaway PostgreSQL started with pgserver')
+	p.add_argument('--report', help='Also write the results as JSON to this path')
+	p.add_argument('--verbose', action='store_true', help='Show the output of the stages')
+	args = p.parse_args()
+	images = args.images if len(args.images) > 1 else args.images * len(args.rows)
+	if len(images) != len(args.rows):
+		p.error('--images must have one value or as many values as --rows')
+
+	db.load_env()
+	results = []
+	with tempfile.TemporaryDirectory(prefix='lego-bench-') as tmp:
+		workdir = Path(tmp)
+		server = embedded_server(workdir) if args.embedded else contextlib.nullcontext()
+		with server:
+			for rows, image_count in zip(args.rows, images):
+				# every size starts from an empty catalog
+				with scratch_database(args.database, keep=args.keep_db):
+					result = benchmark_size(rows, image_count, workdir, workers=args.workers, batch_size=args.batch_size, verbose=args.verbose)
+				print_result(result)
+				results.append(result)
+
+	if args.report:
+		report = {
+			'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'database': 'embedded' if args.embedded else 'configured',
+			'runs': results,
+		}
+		with open(args.report, 'w', encoding='utf-8') as f:
+			json.dump(report, f, indent=2)
+		print(f'\nWrote {args.report}')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,192 @@
+"""
+bulk_load.py
+
+COPY-based bulk loading into `lego_products`.
+
+Product tuples (in `PRODUCT_COLUMNS` order) are streamed in batches with
+`COPY FROM STDIN` into a temporary staging table, then merged into
+`lego_products` with a single `INSERT ... SELECT ... ON CONFLICT (id) DO UPDATE`.
+Rows whose content is unchanged are left alone, so they produce no dead tuples
+and keep their `row_version`. With `prune=True` products missing from the
+staged set are deleted in the same transaction, which turns a full catalog
+import into an atomic replace: readers keep seeing the previous catalog until
+the commit and never observe an empty or half-loaded table.
+
+Inserted rows, and updated rows when the picture columns are among the merged
+columns, get their `product_images` rows rebuilt from those columns in the
+same transaction.
+
+Rows come either as tuples or, from the column mapping (see
+`column_mapping.py`), as pandas DataFrames in `PRODUCT_COLUMNS` order; frames
+are serialized to COPY text column by column rather than row by row.
+
+`upsert_in_batches` commits after every batch instead, so an interrupted load
+keeps the batches already merged and can pick up after them (see
+`import_journal.py`).
+"""
+
+import io
+
+from psycopg2 import sql
+
+from product_images import PICTURE_COLUMNS, sync_from_columns
+
+PRODUCT_COLUMNS = (
+	'id', 'name', 'pictures', 'pictures_1', 'pictures_2', 'pictures_3', 'pictures_4',
+	'description', 'price_shipping_included', 'lego_pieces', 'price',
+)
+# columns refreshed from the spreadsheet when a product id already exists
+UPSERT_COLUMNS = ('name', 'description', 'price_shipping_included', 'lego_pieces', 'price')
+DEFAULT_BATCH_SIZE = 5000
+STAGE_TABLE = 'lego_products_stage'
+
+
+_COPY_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+_COPY_TABLE = str.maketrans(dict(_COPY_ESCAPES))
+
+
+def copy_value(value):
+	# COPY text format: \N is NULL, backslash/tab/newline must be escaped
+	if value is None or (isinstance(value, float) and value != value):
+		return '\\N'
+	return str(value).translate(_COPY_TABLE)
+
+
+def copy_batch(cur, table, columns, rows):
+	buf = io.StringIO()
+	for row in rows:
+		buf.write('\t'.join(copy_value(v) for v in row))
+		buf.write('\n')
+	buf.seek(0)
+	cur.copy_expert(
+		sql.SQL('COPY {} ({}) FROM STDIN').format(
+			sql.Identifier(table), sql.SQL(', ').join(map(sql.Identifier, columns))
+		),
+		buf,
+	)
+
+
+def copy_text(frame):
+	"""Render a DataFrame as COPY text, one vectorized pass per column."""
+	if not len(frame):
+		return ''
+	columns = []
+	for name in frame.columns:
+		text = frame[name].astype('string')
+		for raw, escaped in _COPY_ESCAPES:
+			text = text.str.replace(raw, escaped, regex=False)
+		columns.append(text.fillna('\\N'))
+	lines = columns[0].str.cat(columns[1:], sep='\t') if len(columns) > 1 else columns[0]
+	return '\n'.join(lines) + '\n'
+
+
+def copy_frame(cur, table, frame):
+	cur.copy_expert(
+		sql.SQL('COPY {} ({}) FROM STDIN').format(
+			sql.Identifier(table), sql.SQL(', ').join(map(sql.Identifier, frame.columns))
+		),
+		io.StringIO(copy_text(frame)),
+	)
+
+
+def iter_batches(rows, batch_size):
+	batch = []
+	for row in rows:
+		batch.append(row)
+		if len(batch) >= batch_size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+
+def create_stage(cur, columns=PRODUCT_COLUMNS, table=STAGE_TABLE):
+	cur.execute(sql.SQL(
+		'CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM lego_products WITH NO DATA'
+	).format(sql.Identifier(table), sql.SQL(', ').join(map(sql.Identifier, columns))))
+	cur.execute(sql.SQL('ALTER TABLE {} ADD COLUMN stage_seq BIGINT').format(sql.Identifier(table)))
+
+
+def stage_rows(cur, rows, batch_size=DEFAULT_BATCH_SIZE, columns=PRODUCT_COLUMNS, table=STAGE_TABLE, start=0):
+	"""COPY `rows` into the staging table; returns the number of rows staged."""
+	staged = 0
+	for batch in iter_batches(rows, batch_size):
+		copy_batch(cur, table, columns + ('stage_seq',),
+			(row + (start + staged + i,) for i, row in enumerate(batch)))
+		staged += len(batch)
+	return staged
+
+
+def stage_frame(cur, frame, table=STAGE_TABLE, start=0):
+	"""COPY a DataFrame of product rows into the staging table; returns the rows staged."""
+	copy_frame(cur, table, frame.assign(stage_seq=range(start, start + len(frame))))
+	return len(frame)
+
+
+def merge_stage(cur, columns=PRODUCT_COLUMNS, update_columns=UPSERT_COLUMNS, table=STAGE_TABLE, prune=False):
+	"""Merge the staging table into lego_products; returns `(inserted, updated, deleted)`."""
+	stage = sql.Identifier(table)
+	deleted = 0
+	if prune:
+		cur.execute(sql.SQL(
+			'DELETE FROM lego_products p WHERE NOT EXISTS (SELECT 1 FROM {} s WHERE s.id = p.id)'
+		).format(stage))
+		deleted = cur.rowcount
+	column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+	# DISTINCT ON keeps the last occurrence of a duplicated id, like the old per-row upsert did
+	cur.execute(sql.SQL("""
+		INSERT INTO lego_products ({columns})
+		SELECT DISTINCT ON (id) {columns} FROM {stage}
+		ORDER BY id, stage_seq DESC
+		ON CONFLICT (id) DO UPDATE SET {updates}
+		WHERE ({current}) IS DISTINCT FROM ({incoming})
+		RETURNING id, (xmax = 0)
+	""").format(
+		columns=column_list,
+		stage=stage,
+		updates=sql.SQL(', ').join(
+			sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(c)) for c in update_columns
+		),
+		current=sql.SQL(', ').join(sql.SQL('lego_products.{}').format(sql.Identifier(c)) for c in update_columns),
+		incoming=sql.SQL(', ').join(sql.SQL('EXCLUDED.{}').format(sql.Identifier(c)) for c in update_columns),
+	))
+	merged = cur.fetchall()
+	inserted = sum(1 for _id, is_new in merged if is_new)
+	pictures_merged = not set(PICTURE_COLUMNS).isdisjoint(update_columns)
+	sync_from_columns(cur, [pid for pid, is_new in merged if is_new or pictures_merged])
+	return inserted, len(merged) - inserted, deleted
+
+
+def bulk_upsert_frames(conn, frames, update_columns=UPSERT_COLUMNS, prune=False):
+	"""Stream product DataFrames (in PRODUCT_COLUMNS order) into a temp staging
+	table with COPY, then merge them into lego_products with a single
+	INSERT ... SELECT. Does not commit. Returns the number of staged rows."""
+	cur = conn.cursor()
+	create_stage(cur)
+	staged = 0
+	for frame in frames:
+		staged += stage_frame(cur, frame, start=staged)
+	merge_stage(cur, update_columns=update_columns, prune=prune)
+	cur.close()
+	return staged
+
+
+def upsert_in_batches(conn, batches, update_columns=UPSERT_COLUMNS, on_commit=None):
+	"""Stage and merge product DataFrames one at a time, committing each.
+
+	`batches` yields `(frame, checkpoint)`; `on_commit(checkpoint)` is called
+	once the frame is committed (right away for an empty frame). Returns the
+	number of rows merged."""
+	total = 0
+	for frame, checkpoint in batches:
+		if len(frame):
+			cur = conn.cursor()
+			create_stage(cur)
+			stage_frame(cur, frame)
+			merge_stage(cur, update_columns=update_columns)
+			cur.close()
+			conn.commit()
+		total += len(frame)
+		if on_commit is not None:
+			on_commit(checkpoint)
+	return total
@@ -0,0 +1,241 @@
+"""
+catalog_export.py
+
+Constant-memory export of the `lego_products` table.
+
+Rows are read through a server-side (named) cursor `chunk_size` at a time and
+written out as they arrive, so neither the full result set nor a DataFrame nor
+a pretty-printed string is ever held in memory. Supported layouts:
+
+  json    a compact JSON array, one record per line (same records as the old
+          `df.to_json(orient='records')` export)
+  ndjson  one JSON object per line
+
+Either can be gzip-compressed (`.gz` is appended to the output path).
+
+Delta exports: a full export reads the table in a repeatable-read transaction
+and records that transaction's snapshot in a `<export>.state.json` file next to
+the export. `export_delta` then writes the rows whose last writer the recorded
+snapshot did not see (see `schema.py`), plus a `{"id": ..., "_deleted": true}`
+record for every product deleted since, to `<export>.delta-<n>.ndjson`, and
+records its own snapshot. A transaction that was still running during an export
+is therefore picked up by the next delta, whatever `row_version` it took.
+`compact` folds the pending delta files back into the snapshot, dropping the
+deleted products.
+"""
+
+import datetime
+import decimal
+import gzip
+import json
+import os
+from pathlib import Path
+
+from json_stream import read_json_records
+
+EXPORT_FORMATS = ('json', 'ndjson')
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_QUERY = 'SELECT * FROM lego_products ORDER BY id'
+# rows written by transactions the given snapshot (pg_snapshot text) did not see
+DELTA_QUERY = """
+	SELECT * FROM lego_products
+	WHERE row_xid >= pg_snapshot_xmin(%(since)s::pg_snapshot) AND NOT pg_visible_in_snapshot(row_xid, %(since)s::pg_snapshot)
+	ORDER BY row_version
+"""
+DELETED_QUERY = """
+	SELECT d.id, d.deleted_at FROM lego_products_deleted d
+	WHERE d.row_xid >= pg_snapshot_xmin(%(since)s::pg_snapshot) AND NOT pg_visible_in_snapshot(d.row_xid, %(since)s::pg_snapshot)
+	  AND NOT EXISTS (SELECT 1 FROM lego_products p WHERE p.id = d.id)
+	ORDER BY d.id
+"""
+STATE_SUFFIX = '.state.json'
+DELETED_FIELD = '_deleted'
+# bookkeeping columns that are not part of an exported product
+INTERNAL_COLUMNS = ('row_xid',)
+
+
+def _json_default(value):
+	if isinstance(value, decimal.Decimal):
+		return float(value)
+	if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+		return value.isoformat()
+	if isinstance(value, (bytes, memoryview)):
+		return bytes(value).hex()
+	raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps_record(record):
+	return json.dumps(record, default=_json_default, separators=(',', ':'))
+
+
+def output_path(out_path, compress=False):
+	out_path = str(out_path)
+	if compress and not out_path.endswith('.gz'):
+		out_path += '.gz'
+	return out_path
+
+
+def open_output(out_path, compress=False):
+	if compress:
+		return gzip.open(out_path, 'wt', encoding='utf-8', compresslevel=6)
+	return open(out_path, 'w', encoding='utf-8')
+
+
+def iter_records(conn, query=DEFAULT_QUERY, params=None, chunk_size=DEFAULT_CHUNK_SIZE, cursor_name='lego_products_export'):
+	"""Yield rows of `query` as dicts, fetching `chunk_size` rows per round trip."""
+	cur = conn.cursor(name=cursor_name)
+	cur.itersize = chunk_size
+	try:
+		cur.execute(query, params)
+		columns = None
+		for row in cur:
+			if columns is None:
+				columns = [d[0] for d in cur.description]
+				keep = [i for i, c in enumerate(columns) if c not in INTERNAL_COLUMNS]
+				if len(keep) == len(columns):
+					keep = None
+				else:
+					columns = [columns[i] for i in keep]
+			yield dict(zip(columns, row if keep is None else [row[i] for i in keep]))
+	finally:
+		cur.close()
+
+
+def write_records(records, fp, fmt='json'):
+	"""Write `records` to the text stream `fp` incrementally; returns the count."""
+	if fmt not in EXPORT_FORMATS:
+		raise ValueError(f'Unknown export format {fmt!r} (expected one of {EXPORT_FORMATS})')
+	count = 0
+	if fmt == 'ndjson':
+		for record in records:
+			fp.write(dumps_record(record))
+			fp.write('\n')
+			count += 1
+		return count
+	fp.write('[')
+	for record in records:
+		fp.write('\n' if count == 0 else ',\n')
+		fp.write(dumps_record(record))
+		count += 1
+	fp.write('\n]\n' if count else ']\n')
+	return count
+
+
+def begin_snapshot(conn):
+	"""Start a repeatable-read transaction on `conn` and return its snapshot as text.
+
+	Every query of the transaction then reads from that one snapshot, so it is
+	exactly the state an export written in it reflects. Must be called before
+	anything else runs in the transaction."""
+	cur = conn.cursor()
+	cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+	cur.execute('SELECT pg_current_snapshot()::text')
+	snapshot = cur.fetchone()[0]
+	cur.close()
+	return snapshot
+
+
+def _state_path(snapshot_path):
+	return Path(str(snapshot_path) + STATE_SUFFIX)
+
+
+def read_state(snapshot_path):
+	path = _state_path(snapshot_path)
+	if not path.exists():
+		return None
+	with open(path, encoding='utf-8') as f:
+		return json.load(f)
+
+
+def write_state(snapshot_path, state):
+	path = _state_path(snapshot_path)
+	tmp = path.with_name(path.name + '.tmp')
+	with open(tmp, 'w', encoding='utf-8') as f:
+		json.dump(state, f, indent=2)
+	os.replace(tmp, path)
+
+
+def stream_export(conn, out_path, fmt='json', compress=False, chunk_size=DEFAULT_CHUNK_SIZE, query=DEFAULT_QUERY, params=None):
+	"""Export `query` to `out_path`; returns `(path_written, row_count)`.
+
+	A full export of the default query also resets the delta state; it then has
+	to be the first thing run in the transaction (see `begin_snapshot`)."""
+	out_path = output_path(out_path, compress)
+	snapshot = begin_snapshot(conn) if query == DEFAULT_QUERY else None
+	tmp = out_path + '.tmp'
+	with open_output(tmp, compress) as fp:
+		count = write_records(iter_records(conn, query, params, chunk_size=chunk_size), fp, fmt)
+	os.replace(tmp, out_path)
+	if snapshot is not None:
+		write_state(out_path, {'format': fmt, 'snapshot': snapshot, 'delta_seq': 0, 'deltas': []})
+	return out_path, count
+
+
+def _iter_changes(conn, since, chunk_size=DEFAULT_CHUNK_SIZE):
+	yield from iter_records(conn, DELTA_QUERY, {'since': since}, chunk_size=chunk_size, cursor_name='lego_products_delta')
+	for record in iter_records(conn, DELETED_QUERY, {'since': since}, chunk_size=chunk_size, cursor_name='lego_products_deleted'):
+		yield {'id': record['id'], DELETED_FIELD: True, 'deleted_at': record['deleted_at']}
+
+
+def export_delta(conn, snapshot_path, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Write the products changed or deleted since the last export to a new NDJSON delta file.
+
+	Returns `(delta_path or None, record_count)`; no file is written when nothing
+	changed. Like a full export, it has to be the first thing run in the transaction."""
+	state = read_state(snapshot_path)
+	if state is None:
+		raise RuntimeError(f'No export state for {snapshot_path}; run a full export first')
+	if 'snapshot' not in state:
+		raise RuntimeError(f'The export state of {snapshot_path} predates commit-safe delta tracking; run a full export first')
+	snapshot = begin_snapshot(conn)
+	tmp = Path(str(snapshot_path) + '.delta.tmp')
+	with open_output(tmp) as fp:
+		count = write_records(_iter_changes(conn, state['snapshot'], chunk_size=chunk_size), fp, 'ndjson')
+	state['snapshot'] = snapshot
+	if count == 0:
+		tmp.unlink()
+		write_state(snapshot_path, state)
+		return None, 0
+	state['delta_seq'] = state.get('delta_seq', 0) + 1
+	delta_path = Path(f'{snapshot_path}.delta-{state["delta_seq"]:06d}.ndjson')
+	os.replace(tmp, delta_path)
+	state['deltas'].append(delta_path.name)
+	write_state(snapshot_path, state)
+	return str(delta_path), count
+
+
+def compact(snapshot_path):
+	"""Merge the pending delta files into the snapshot, dropping deleted products, and remove them.
+
+	Returns the number of records in the compacted snapshot."""
+	state = read_state(snapshot_path)
+	if state is None:
+		raise RuntimeError(f'No export state for {snapshot_path}; run a full export first')
+	snapshot_path = Path(snapshot_path)
+	changed = {}
+	delta_paths = [snapshot_path.with_name(name) for name in state['deltas']]
+	for delta_path in delta_paths:
+		with open(delta_path, encoding='utf-8') as f:
+			for line in f:
+				if line.strip():
+					record = json.loads(line)
+					changed[record['id']] = record
+
+	def _merged():
+		for record in read_json_records(snapshot_path):
+			record = changed.pop(record['id'], record)
+			if not record.get(DELETED_FIELD):
+				yield record
+		# products created after the snapshot, in delta order
+		yield from (record for record in changed.values() if not record.get(DELETED_FIELD))
+
+	compress = str(snapshot_path).endswith('.gz')
+	tmp = str(snapshot_path) + '.tmp'
+	with open_output(tmp, compress) as fp:
+		count = write_records(_merged(), fp, state['format'])
+	os.replace(tmp, snapshot_path)
+	state['deltas'] = []
+	write_state(snapshot_path, state)
+	for delta_path in delta_paths:
+		delta_path.unlink()
+	return count
@@ -0,0 +1,169 @@
+"""
+catalog_facets.py
+
+Typed prices and precomputed filter facets for the storefront.
+
+`parse_price` turns the free-form `price_shipping_included` text ("50$",
+"$1,299.99", "1.299,00 EUR", "1.299 €", ...) into a `Decimal` that the writers store in
+the indexed NUMERIC `price` column next to the raw text, so price filters and
+sorting no longer parse strings per request.
+
+`refresh_facets` rebuilds `catalog_facets` in one transaction: product counts
+per price bucket, piece-count range, theme (matched on the product name) and
+set number. Readers keep the previous counts until the commit. It also fills
+`price` for rows written by tools that only set the text column.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+
+CENT = Decimal('0.01')
+MAX_PRICE = Decimal('1e10')  # NUMERIC(12, 2)
+PRICE_BUCKETS = (0, 25, 50, 100, 200, 500)
+PIECE_BUCKETS = (0, 250, 500, 1000, 2000, 4000)
+# (facet label, lowercase word(s) looked for in the name); the first match wins
+THEMES = (
+	('Technic', 'technic'),
+	('Star Wars', 'star wars'),
+	('Marvel', 'marvel'),
+	('Harry Potter', 'harry potter'),
+	('Speed Champions', 'speed champions'),
+	('Batman', 'batman'),
+	('Ninjago', 'ninjago'),
+	('Architecture', 'architecture'),
+	('Ideas', 'ideas'),
+	('Icons', 'icons'),
+	('Creator', 'creator'),
+	('City', 'city'),
+	('Friends', 'friends'),
+)
+OTHER_THEME = 'Other'
+# a 4-6 digit standalone number in the name ("LEGO 42143 Ferrari", "GT4 (42176)")
+_SET_NUMBER_SQL = r'\m(\d{4,6})\M'
+
+_NOT_PRICE_CHARS = re.compile(r'[^0-9.,-]')
+# "1.299" / "12.500.000": dots grouping thousands
+_DOT_THOUSANDS = re.compile(r'-?[1-9]\d{0,2}(\.\d{3})+')
+
+UNPARSED_PRICES = """
+	SELECT id, price_shipping_included FROM lego_products
+	WHERE price IS NULL AND price_shipping_included IS NOT NULL
+"""
+UPDATE_PRICES = """
+	UPDATE lego_products AS p SET price = v.price
+	FROM (VALUES %s) AS v(id, price)
+	WHERE p.id = v.id
+"""
+
+RANGE_FACET = """
+	INSERT INTO catalog_facets (facet, bucket, position, lower_bound, upper_bound, product_count)
+	SELECT {facet}, b.bucket, b.position, b.lower_bound, b.upper_bound, count(p.id)
+	FROM unnest(%(buckets)s::text[], %(lower)s::numeric[], %(upper)s::numeric[]) WITH ORDINALITY
+		AS b(bucket, lower_bound, upper_bound, position)
+	LEFT JOIN lego_products p
+		ON p.{column} >= b.lower_bound AND (b.upper_bound IS NULL OR p.{column} < b.upper_bound)
+	GROUP BY b.bucket, b.position, b.lower_bound, b.upper_bound
+"""
+THEME_FACET = r"""
+	INSERT INTO catalog_facets (facet, bucket, position, product_count)
+	SELECT 'theme', theme, row_number() OVER (ORDER BY count(*) DESC, theme), count(*)
+	FROM (
+		SELECT COALESCE((
+			SELECT t.theme
+			FROM unnest(%(themes)s::text[], %(patterns)s::text[]) WITH ORDINALITY AS t(theme, pattern, ord)
+			WHERE lower(p.name) ~ ('\m' || t.pattern || '\M')
+			ORDER BY t.ord LIMIT 1
+		), %(other)s) AS theme
+		FROM lego_products p
+	) themed
+	GROUP BY theme
+"""
+SET_NUMBER_FACET = f"""
+	INSERT INTO catalog_facets (facet, bucket, position, product_count)
+	SELECT 'set_number', set_number, row_number() OVER (ORDER BY set_number), count(*)
+	FROM (SELECT substring(name from '{_SET_NUMBER_SQL}') AS set_number FROM lego_products) numbered
+	WHERE set_number IS NOT NULL
+	GROUP BY set_number
+"""
+
+
+def _decimal_text(text):
+	"""Rewrite the digits and separators of a price string as a plain decimal."""
+	if ',' in text and '.' in text:
+		# whichever separator comes last is the decimal point: 1,299.99 / 1.299,99
+		if text.rfind(',') > text.rfind('.'):
+			return text.replace('.', '').replace(',', '.')
+		return text.replace(',', '')
+	if ',' in text:
+		head, _, tail = text.rpartition(',')
+		# "12,5" / "12,50" are decimals, "1,299" is a thousands separator
+		return f'{head.replace(",", "")}.{tail}' if len(tail) in (1, 2) else text.replace(',', '')
+	if _DOT_THOUSANDS.fullmatch(text):
+		# a dot followed by exactly three digits groups thousands too: "1.299 €"
+		return text.replace('.', '')
+	return text
+
+
+def parse_price(raw):
+	"""Parse a price string (or number) into a 2-decimal `Decimal`; None when it has no usable amount."""
+	if raw is None or isinstance(raw, bool):
+		return None
+	if isinstance(raw, float) and raw != raw:
+		return None
+	if isinstance(raw, (int, float, Decimal)):
+		# numeric cells have no separators to guess about
+		text = str(raw)
+	else:
+		text = _NOT_PRICE_CHARS.sub('', str(raw))
+		if not any(c.isdigit() for c in text):
+			return None
+		text = _decimal_text(text)
+	try:
+		value = Decimal(text)
+	except InvalidOperation:
+		return None
+	if not value.is_finite() or abs(value) >= MAX_PRICE:
+		return None
+	return value.quantize(CENT)
+
+
+def _bucket_labels(edges):
+	labels = [f'{lo}-{hi}' for lo, hi in zip(edges, edges[1:])]
+	labels.append(f'{edges[-1]}+')
+	return labels
+
+
+def backfill_prices(cur):
+	"""Parse `price` for rows that only have the raw text; returns the number of rows filled."""
+	cur.execute(UNPARSED_PRICES)
+	values = [(pid, price) for pid, raw in cur.fetchall() for price in (parse_price(raw),) if price is not None]
+	if values:
+		execute_values(cur, UPDATE_PRICES, values, template='(%s, %s::numeric)', page_size=1000)
+	return len(values)
+
+
+def refresh_facets(conn):
+	"""Recompute catalog_facets (and missing typed prices) and commit; returns `{facet: buckets}`."""
+	cur = conn.cursor()
+	try:
+		backfill_prices(cur)
+		cur.execute('DELETE FROM catalog_facets')
+		for facet, column, edges in (('price', 'price', PRICE_BUCKETS), ('lego_pieces', 'lego_pieces', PIECE_BUCKETS)):
+			cur.execute(
+				sql.SQL(RANGE_FACET).format(facet=sql.Literal(facet), column=sql.Identifier(column)),
+				{'buckets': _bucket_labels(edges), 'lower': list(edges), 'upper': list(edges[1:]) + [None]},
+			)
+		cur.execute(THEME_FACET, {
+			'themes': [t for t, _ in THEMES], 'patterns': [p for _, p in THEMES], 'other': OTHER_THEME,
+		})
+		cur.execute(SET_NUMBER_FACET)
+		cur.execute('SELECT facet, count(*) FROM catalog_facets GROUP BY facet')
+		counts = dict(cur.fetchall())
+		conn.commit()
+	finally:
+		cur.close()
+	return counts
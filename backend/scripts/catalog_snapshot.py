@@ -0,0 +1,189 @@
+"""
+catalog_snapshot.py
+
+Static, pre-compressed catalog snapshots that can be served without touching
+the database.
+
+`write_snapshot` reads `lego_products` once (in id order, through the
+server-side cursor of `catalog_export.iter_records`) and writes a new version
+directory:
+
+  <out>/<version>/pages/page-0001.json      listing pages of `page_size` records
+  <out>/<version>/ids/<xx>.json             {id: record} for the ids whose
+                                            sha256 starts with the hex `xx`
+  <out>/<version>/manifest.json
+  <out>/manifest.json                       the current version's manifest
+
+Every shard is also written as `.gz` and, when the `brotli` module is
+installed, `.br`, so a static file server can hand out the encoding a client
+accepts without compressing anything per request. The manifest lists every file
+with its row count, size and an ETag (a quoted prefix of the sha256 of the
+uncompressed bytes), plus an ETag for the whole catalog. A snapshot whose
+catalog ETag matches the current one is discarded, so an unchanged catalog
+keeps its version and every cached URL stays valid; a new version leaves the
+previous `keep - 1` version directories in place for clients still holding an
+older manifest.
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from catalog_export import DEFAULT_CHUNK_SIZE, dumps_record, iter_records
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_KEEP = 3
+# hex digits of sha256(id) naming the id shard (2 -> up to 256 shards)
+ID_SHARD_CHARS = 2
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_VERSION = 1
+
+
+def etag(data):
+	return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def id_shard(product_id):
+	"""Name of the id shard holding `product_id`."""
+	return hashlib.sha256(str(product_id).encode('utf-8')).hexdigest()[:ID_SHARD_CHARS]
+
+
+def encodings():
+	"""Pre-compressed variants written next to every shard: `{content coding: (suffix, compress)}`."""
+	found = {'gzip': ('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))}
+	if brotli is not None:
+		found['br'] = ('.br', lambda data: brotli.compress(data, quality=11))
+	return found
+
+
+def _write_shard(root, rel_path, data, rows):
+	"""Write `data` and its compressed variants under `root`; returns the manifest entry."""
+	path = root / rel_path
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_bytes(data)
+	entry = {'path': rel_path, 'rows': rows, 'bytes': len(data), 'etag': etag(data), 'encodings': {}}
+	for coding, (suffix, compress) in encodings().items():
+		packed = compress(data)
+		path.with_name(path.name + suffix).write_bytes(packed)
+		entry['encodings'][coding] = {'path': rel_path + suffix, 'bytes': len(packed)}
+	return entry
+
+
+def _write_pages(records, root, page_size, on_record):
+	pages = []
+	batch = []
+
+	def _flush():
+		data = ('[' + ','.join(line for _id, line in batch) + ']\n').encode('utf-8')
+		entry = _write_shard(root, f'pages/page-{len(pages) + 1:04d}.json', data, len(batch))
+		entry.update(first_id=batch[0][0], last_id=batch[-1][0])
+		pages.append(entry)
+
+	for record in records:
+		line = dumps_record(record)
+		on_record(record['id'], line)
+		batch.append((record['id'], line))
+		if len(batch) >= page_size:
+			_flush()
+			batch = []
+	if batch:
+		_flush()
+	return pages
+
+
+def read_manifest(out_dir):
+	path = Path(out_dir) / MANIFEST_NAME
+	if not path.exists():
+		return None
+	with open(path, encoding='utf-8') as f:
+		return json.load(f)
+
+
+def _write_json(path, value):
+	tmp = path.with_name(path.name + '.tmp')
+	with open(tmp, 'w', encoding='utf-8') as f:
+		json.dump(value, f, indent=1)
+	os.replace(tmp, path)
+
+
+def prune_versions(out_dir, keep=DEFAULT_KEEP):
+	"""Remove all but the `keep` newest version directories; returns the names removed."""
+	out_dir = Path(out_dir)
+	versions = sorted(p for p in out_dir.iterdir() if p.is_dir() and not p.name.startswith('.'))
+	removed = versions[:-keep] if keep > 0 else []
+	for path in removed:
+		shutil.rmtree(path)
+	return [p.name for p in removed]
+
+
+def write_snapshot(conn, out_dir, page_size=DEFAULT_PAGE_SIZE, keep=DEFAULT_KEEP, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Write a snapshot of lego_products under `out_dir`; returns its manifest.
+
+	The manifest's `changed` is False when the catalog matched the current
+	snapshot and nothing was written."""
+	out_dir = Path(out_dir)
+	out_dir.mkdir(parents=True, exist_ok=True)
+	generated_at = datetime.datetime.now(datetime.timezone.utc)
+	version = generated_at.strftime('%Y%m%dT%H%M%S%fZ')
+	work = Path(tempfile.mkdtemp(dir=out_dir, prefix='.tmp-'))
+	try:
+		# id shards are spooled as `"id":record` lines while the pages stream past
+		spool = work / '.ids'
+		spool.mkdir()
+		spooled = {}
+		handles = {}
+
+		def _spool(product_id, line):
+			shard = id_shard(product_id)
+			if shard not in handles:
+				handles[shard] = open(spool / shard, 'w', encoding='utf-8')
+			handles[shard].write(json.dumps(str(product_id)) + ':' + line + '\n')
+			spooled[shard] = spooled.get(shard, 0) + 1
+
+		try:
+			pages = _write_pages(iter_records(conn, chunk_size=chunk_size, cursor_name='lego_products_snapshot'), work, page_size, _spool)
+		finally:
+			for handle in handles.values():
+				handle.close()
+		shards = {}
+		for shard in sorted(spooled):
+			with open(spool / shard, encoding='utf-8') as f:
+				data = ('{' + ','.join(line.rstrip('\n') for line in f) + '}\n').encode('utf-8')
+			shards[shard] = _write_shard(work, f'ids/{shard}.json', data, spooled[shard])
+		shutil.rmtree(spool)
+		catalog = hashlib.sha256(f'{page_size}:{",".join(encodings())}:'.encode('ascii'))
+		for entry in pages + list(shards.values()):
+			catalog.update(entry['etag'].encode('ascii'))
+		manifest = {
+			'format': SNAPSHOT_VERSION,
+			'version': version,
+			'generated_at': generated_at.isoformat(),
+			'etag': '"' + catalog.hexdigest()[:32] + '"',
+			'rows': sum(page['rows'] for page in pages),
+			'page_size': page_size,
+			'pages': pages,
+			'id_shards': {'hash': 'sha256', 'prefix_chars': ID_SHARD_CHARS, 'shards': shards},
+			'encodings': sorted(encodings()),
+		}
+		current = read_manifest(out_dir)
+		if current is not None and current.get('etag') == manifest['etag'] and (out_dir / current['version']).is_dir():
+			return dict(current, changed=False)
+		_write_json(work / MANIFEST_NAME, manifest)
+		os.replace(work, out_dir / version)
+	finally:
+		if work.exists():
+			shutil.rmtree(work)
+	# the top-level manifest flips to the new version only once all of its files are in place
+	_write_json(out_dir / MANIFEST_NAME, manifest)
+	prune_versions(out_dir, keep=keep)
+	return dict(manifest, changed=True)
@@ -0,0 +1,173 @@
+"""
+column_mapping.py
+
+Declarative mapping of spreadsheet columns onto `lego_products`.
+
+Supplier sheets spell the same column in different ways (`id`/`ID`, `Name`,
+`price+shipping_included`, `pictures.1` from a repeated `pictures` header, ...).
+`COLUMNS` lists for every target column the headers it may come from, in order
+of preference. `ColumnMapping` resolves them once per sheet from the header row
+and then maps whole chunks of rows with pandas operations instead of a Python
+loop per row:
+
+- the alias columns are coalesced left to right, and blank cells (empty,
+  whitespace only, "nan") count as missing;
+- ids are stringified, and rows without one get a random UUID;
+- `lego_pieces` is coerced to an integer and must be a whole number >= 0;
+- `price` is parsed from the price text with `catalog_facets.parse_price`,
+  once per distinct value in the chunk.
+
+Rows that fail validation are left out of the typed batch and described in its
+`rejected` frame (sheet row, id, column, value, reason); `RejectReport` gathers
+them over a run and writes them out as CSV.
+
+	mapping = ColumnMapping(stream.headers, id_header='Name')
+	for batch in iter_mapped(stream, mapping):
+		load(batch.rows)  # DataFrame in bulk_load.PRODUCT_COLUMNS order
+"""
+
+import uuid
+
+import pandas as pd
+
+from bulk_load import PRODUCT_COLUMNS
+from catalog_facets import parse_price
+from workbook_stream import DEFAULT_CHUNK_SIZE
+
+BLANK_VALUES = ('', 'nan', 'NaN')
+REJECT_FIELDS = ('row', 'id', 'column', 'value', 'reason')
+
+
+class Column:
+	"""A `lego_products` column filled from the first present of `aliases`.
+
+	`kind` is `text` (taken as is), `id` (stringified, UUID when missing) or
+	`count` (a whole number >= 0)."""
+
+	def __init__(self, target, aliases, kind='text'):
+		self.target = target
+		self.aliases = tuple(aliases)
+		self.kind = kind
+
+
+COLUMNS = (
+	Column('id', ('id', 'ID', 'name', 'Name'), kind='id'),
+	Column('name', ('name', 'Name')),
+	Column('pictures', ('pictures', 'Pictures')),
+	Column('pictures_1', ('pictures_1', 'pictures.1')),
+	Column('pictures_2', ('pictures_2', 'pictures.2')),
+	Column('pictures_3', ('pictures_3', 'pictures.3')),
+	Column('pictures_4', ('pictures_4', 'pictures.4')),
+	Column('description', ('description', 'Description')),
+	Column('price_shipping_included', ('price_shipping_included', 'price+shipping_included', 'price', 'Price')),
+	Column('lego_pieces', ('lego_pieces', 'LEGO_pieces', 'pieces'), kind='count'),
+)
+
+
+def blank_to_na(series):
+	values = series.astype(object)
+	text = values.astype(str).str.strip()
+	return values.where(values.notna() & ~text.isin(BLANK_VALUES))
+
+
+class MappedBatch:
+	"""Typed rows (PRODUCT_COLUMNS, indexed by sheet row) plus the rows rejected from them."""
+
+	def __init__(self, rows, rejected):
+		self.rows = rows
+		self.rejected = rejected
+
+	def __len__(self):
+		return len(self.rows)
+
+	def tuples(self):
+		"""The rows as plain tuples with None for missing values."""
+		rows = self.rows.astype(object)
+		return list(rows.where(rows.notna(), None).itertuples(index=False, name=None))
+
+
+class ColumnMapping:
+	def __init__(self, headers, id_header='id', columns=COLUMNS):
+		self.headers = list(headers)
+		self.columns = columns
+		present = set(self.headers)
+		self.sources = {}
+		for column in columns:
+			aliases = column.aliases
+			if column.kind == 'id' and id_header:
+				aliases = (id_header,) + aliases
+			self.sources[column.target] = [a for a in dict.fromkeys(aliases) if a in present]
+
+	def _coalesce(self, frame, target):
+		sources = self.sources[target]
+		if not sources:
+			return pd.Series(None, index=frame.index, dtype=object)
+		values = frame[sources].apply(blank_to_na)
+		return values.bfill(axis=1).iloc[:, 0] if len(sources) > 1 else values.iloc[:, 0]
+
+	def apply(self, frame):
+		"""Map a frame of raw cells (columns = sheet headers) to a `MappedBatch`."""
+		out = pd.DataFrame(index=frame.index)
+		bad = pd.Series(False, index=frame.index)
+		rejects = []
+		given_ids = None
+		for column in self.columns:
+			values = self._coalesce(frame, column.target)
+			if column.kind == 'id':
+				missing = values.isna()
+				values = values.map(str, na_action='ignore').astype(object)
+				given_ids = values.copy()
+				values[missing] = [str(uuid.uuid4()) for _ in range(int(missing.sum()))]
+			elif column.kind == 'count':
+				numbers = pd.to_numeric(values, errors='coerce')
+				invalid = values.notna() & (numbers.isna() | (numbers % 1 != 0) | (numbers < 0))
+				if invalid.any():
+					rejects.append((column.target, values[invalid], 'not a whole number >= 0'))
+					bad |= invalid
+				values = numbers.where(~invalid).astype('Int64')
+			out[column.target] = values
+		raw_prices = out['price_shipping_included']
+		parsed = {raw: parse_price(raw) for raw in raw_prices.dropna().unique()}
+		out['price'] = raw_prices.map(parsed, na_action='ignore').astype(object)
+		rejected = pd.DataFrame(
+			[
+				(row, given_ids.get(row) if given_ids is not None else None, target, value, reason)
+				for target, invalid_values, reason in rejects
+				for row, value in invalid_values.items()
+			],
+			columns=REJECT_FIELDS,
+		)
+		return MappedBatch(out.loc[~bad, list(PRODUCT_COLUMNS)], rejected)
+
+
+def iter_mapped(stream, mapping, chunk_size=DEFAULT_CHUNK_SIZE, skip=0):
+	"""Map a `WorkbookStream` chunk by chunk, leaving out its first `skip` data rows.
+
+	Yields `(batch, consumed)` where `consumed` counts the data rows read so far,
+	skipped and rejected ones included."""
+	consumed = 0
+	for numbers, rows in stream.iter_chunks(chunk_size):
+		start = max(0, min(len(rows), skip - consumed))
+		consumed += len(rows)
+		if start == len(rows):
+			continue
+		frame = pd.DataFrame.from_records(rows[start:], columns=stream.headers, index=numbers[start:])
+		yield mapping.apply(frame), consumed
+
+
+class RejectReport:
+	"""Rejected rows gathered over a run, tagged with their workbook and sheet."""
+
+	def __init__(self):
+		self.frames = []
+		self.count = 0
+
+	def add(self, rejected, workbook=None, sheet=None):
+		if len(rejected):
+			self.frames.append(rejected.assign(workbook=workbook, sheet=sheet))
+			self.count += len(rejected)
+
+	def write(self, path):
+		columns = ['workbook', 'sheet', *REJECT_FIELDS]
+		frame = pd.concat(self.frames, ignore_index=True) if self.frames else pd.DataFrame(columns=columns)
+		frame[columns].to_csv(path, index=False)
@@ -2,317 +2,721 @@
 combined_script.py
 
 This script combines the logic from the project's helper scripts:
-1. Read tabular data from an Excel file and insert rows into the `lego_products` table.
+1. Read tabular data from an Excel file and bulk-load it into the `lego_products` table
+   (rows are streamed with COPY into a temporary staging table and merged with a single
+   `INSERT ... ON CONFLICT`; `--batch-size` sets the rows per COPY batch). Columns are
+   mapped, coerced and validated a batch at a time (see `column_mapping.py`); rows that
+   fail validation are skipped and can be saved with `--rejects-out`. Only the rows
+   that differ from the table are written (see `sync_plan.py`); `--dry-run` prints
+   the plan and `--prune` also deletes products missing from the sheet.
 2. Extract embedded images from the same Excel file and save them to
    `public/uploads/products/<id>/` (or `<name>/` depending on the id header).
+   The pictures are read straight from the xlsx zip (see `xlsx_media.py`) and
+   streamed to disk byte for byte, in the format they were embedded in.
+   The workbook is opened read-only and streamed once (see `workbook_stream.py`):
+   the row upsert records which product id sits on each sheet row and the image
+   extraction places the pictures with that map; `--sheet` applies to both. `--workers N` extracts and writes the images on N threads behind a
+   bounded queue. Images are content-addressed (see `image_store.py`): each blob is
+   written once under `_blobs/` and linked into the product folder under its hash,
+   so reruns leave unchanged images and their URLs untouched. `--variants` also
+   writes resized WebP (and with `--avif`, AVIF) copies next to each image on a
+   process pool (see `image_variants.py`).
 3. Optionally write the first found image paths back into the DB (`--update-db`).
-4. Export the `lego_products` table to `lego_products_export.json`.
+4. Export the `lego_products` table to `lego_products_export.json`, streamed through a
+   server-side cursor in constant memory (`--export-format json|ndjson`, `--export-gzip`;
+   see `catalog_export.py`). Rows carry `updated_at`/`row_version` change tracking
+   and deletes leave tombstones; `--export-mode delta` writes only the products
+   changed or deleted since the last export and `--compact` merges pending deltas
+   back into the snapshot. The `snapshot` stage
+   also writes a versioned static copy of the catalog to `public/catalog/`
+   (`--snapshot-dir`): listing pages and id shards, pre-compressed with gzip (and
+   brotli when installed), plus a manifest of ETags (see `catalog_snapshot.py`).
+   The `search` stage builds a memory-mappable inverted index over product names
+   and descriptions, with prefix and set-number lookup, in
+   `public/catalog/search.idx` (`--search-index`, see `search_index.py`).
 5. Scan `public/uploads/products/` and update DB picture columns by matching folder
-   names to product `name` (case-insensitive).
+   names to product `name` (case-insensitive). Names are resolved against one
+   in-memory index and all updates go out as a single batched statement (see
+   `folder_images.py`). A scan manifest limits the work to folders that changed
+   since the last run (`--full-rescan` ignores it).
+6. Refresh `catalog_facets` (price buckets, piece-count ranges, theme and set-number
+   counts) for the storefront filters. Prices are also parsed into the indexed NUMERIC
+   `price` column on ingest; the raw text stays in `price_shipping_included`
+   (see `catalog_facets.py`).
+
+The steps run as stages of a small dependency-aware scheduler (see
+`stage_scheduler.py`): `ingest`, `images`, `pictures` (3.), `variants`, `rescan`,
+`export`, `compact`, `snapshot`, `search` and `facets`. Stages start as soon as the stages whose data
+they use are done, so e.g. the variants and the facets overlap, and the export
+waits for every write to lego_products. `--only`/`--skip` select stages by name
+and `--stage-workers 1` runs them one at a time.
+
+Every stage is also recorded in a run report (see `run_report.py`): the
+summary printed at the end lists each stage's duration and counters, `--report`
+saves the full report (durations, row/image counts, bytes written, errors
+skipped, per-stage DB statement counts and time) as JSON and `--profile` adds
+cProfile output (`--profile-out`) and tracemalloc peaks; a profiled run executes
+its stages one at a time so that both see every stage on its own.
+
+A workbook import is merged into lego_products in a single transaction. With
+`--resumable` it is checkpointed instead (see `import_journal.py`): the upsert
+commits every `--batch-size` rows and a journal keyed by the workbook's SHA-256
+records the rows committed and the images stored so far. After an interrupted
+run, `--resume` skips that work and carries on where it stopped; the journal is
+removed once a run completes.
+
+`--xlsx` also accepts a directory or a glob pattern (quote it) for a whole
+supplier drop; `--all-sheets` reads every sheet instead of just `--sheet`. The
+workbooks and sheets are then parsed and their images extracted on a process
+pool (`--parse-workers`), and every row goes to lego_products through one bulk
+writer in a single transaction (see `batch_ingest.py`). In batch mode the
+`ingest` stage does both jobs and `images` hands on its picture mapping.
 
 Credentials and configuration are read from environment variables. If a `.env`
 file exists in the repository root and you have `python-dotenv` installed, it
-will be loaded automatically so you can keep credentials there.
+will be loaded automatically so you can keep credentials there. All stages share
+one connection pool with retries and per-stage statement timeouts (see `db.py`).
+
+Single jobs have subcommands with just their own options: `ingest`, `images`
+(plus `--update-db`/`--variants`), `export` (plus `--compact`), `rescan` and
+`import-json` (load an export back, see `import_lego_products.py`). Without a
+subcommand the whole pipeline runs as described above. openpyxl, pandas and
+Pillow are only imported by the stages that read workbooks or encode images, so
+an export or a cron-driven rescan starts without paying for them.
 
 Usage examples:
   python backend/scripts/combined_script.py --xlsx "/workspaces/store/lego spreadsheet.xlsx" --id-header "Name" --update-db
+  python backend/scripts/combined_script.py --xlsx "drops/2024-06/*.xlsx" --all-sheets --update-db
+  python backend/scripts/combined_script.py --only export,facets
+  python backend/scripts/combined_script.py rescan
+  python backend/scripts/combined_script.py export --export-mode delta --compact
+  python backend/scripts/combined_script.py ingest --xlsx catalog.xlsx --resumable
+  python backend/scripts/combined_script.py ingest --xlsx catalog.xlsx --resume
   python backend/scripts/combined_script.py --help
 """
 
-import os
-import io
-import uuid
 import argparse
+import functools
+import importlib.util
 import json
+import os
 import sys
+import time
 from pathlib import Path
 
-try:
-	from dotenv import load_dotenv
-	DOTENV_AVAILABLE = True
-except Exception:
-	DOTENV_AVAILABLE = False
-
-import pandas as pd
-try:
-	from openpyxl import load_workbook
-except Exception:
-	raise SystemExit('Please install openpyxl: pip install openpyxl')
-
-try:
-	from PIL import Image
-except Exception:
-	raise SystemExit('Please install Pillow: pip install pillow')
-
-try:
-	import psycopg2
-	from psycopg2 import sql
-except Exception:
-	raise SystemExit('Please install psycopg2-binary: pip install psycopg2-binary')
+import run_report
+from db import close_pool, connection, load_env, run_with_retry
+from image_store import DEFAULT_WORKERS, map_bounded, store_image_stream
+from schema import create_table_if_not_exists, ensure_schema
+from bulk_load import DEFAULT_BATCH_SIZE, bulk_upsert_frames, upsert_in_batches
+from catalog_facets import refresh_facets
+from folder_images import MANIFEST_NAME, apply_picture_updates, sync_folder_images
+from json_stream import read_json_records
+from catalog_export import (
+	DEFAULT_CHUNK_SIZE as DEFAULT_EXPORT_CHUNK_SIZE, EXPORT_FORMATS, compact, export_delta, output_path, stream_export,
+)
+from catalog_snapshot import DEFAULT_KEEP, DEFAULT_PAGE_SIZE, write_snapshot
+from import_journal import JOURNAL_DIRNAME, ImportJournal
+from sync_plan import SyncPlan
+from search_index import build_from_db
+from stage_scheduler import DEFAULT_STAGE_WORKERS, Stage, parse_stage_list, run_stages, select_stages
 
 # --- repo paths ---
 ROOT = Path(__file__).resolve().parents[2]
 UPLOAD_BASE = ROOT / 'public' / 'uploads' / 'products'
-UPLOAD_BASE.mkdir(parents=True, exist_ok=True)
-
-def load_env():
-	if DOTENV_AVAILABLE:
-		env_path = ROOT / '.env'
-		if env_path.exists():
-			load_dotenv(env_path)
-
-def get_db_config():
-	return {
-		'host': os.getenv('PG_HOST', 'localhost'),
-		'port': os.getenv('PG_PORT', '5432'),
-		'database': os.getenv('PG_DATABASE', 'lego_store'),
-		'user': os.getenv('PG_USER', 'postgres'),
-		'password': os.getenv('PG_PASSWORD', 'Lego@store1234'),
-	}
-
-def create_table_if_not_exists(conn):
-	create_table_query = """
-	CREATE TABLE IF NOT EXISTS lego_products (
-		id TEXT PRIMARY KEY,
-		name TEXT,
-		pictures TEXT,
-		pictures_1 TEXT,
-		pictures_2 TEXT,
-		pictures_3 TEXT,
-		pictures_4 TEXT,
-		description TEXT,
-		price_shipping_included TEXT,
-		lego_pieces INTEGER
-	);
-	"""
-	cur = conn.cursor()
-	cur.execute(create_table_query)
-	conn.commit()
-	cur.close()
-
-def extract_data_from_excel(xlsx_path, id_header='id', skip_db_insert=False, dry_run=False):
-	print(f'Reading spreadsheet: {xlsx_path}')
-	df = pd.read_excel(xlsx_path)
-	df.columns = [str(col).strip().replace(' ', '_').replace('\n', '_') for col in df.columns]
-	id_header_clean = id_header.strip().replace(' ', '_')
-	if id_header_clean not in df.columns:
-		print(f"Warning: id header '{id_header}' not found in spreadsheet columns: {list(df.columns)}")
-	if skip_db_insert:
-		print('skip_db_insert set; skipping DB inserts')
-		return len(df)
-	db_conf = get_db_config()
-	conn = psycopg2.connect(**db_conf)
+
+# openpyxl, pandas and Pillow are imported by the functions that use them, so
+# the subcommands that never touch a workbook or an image start quickly
+
+def _open_stream(source, sheet_name=None, id_header='id'):
 	try:
-		create_table_if_not_exists(conn)
-		cur = conn.cursor()
-		insert_query = sql.SQL("""
-			INSERT INTO lego_products (
-				id, name, pictures, pictures_1, pictures_2, pictures_3, pictures_4,
-				description, price_shipping_included, lego_pieces
-			) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-			ON CONFLICT (id) DO UPDATE SET
-			  name = EXCLUDED.name,
-			  description = EXCLUDED.description,
-			  price_shipping_included = EXCLUDED.price_shipping_included,
-			  lego_pieces = EXCLUDED.lego_pieces
-		""")
-		inserted = 0
-		for _, row in df.iterrows():
-			id_val = None
-			for key in (id_header_clean, 'id', 'ID', 'name', 'Name'):
-				if key in row and pd.notna(row.get(key)):
-					id_val = str(row.get(key))
-					break
-			if not id_val or id_val in ('nan', 'NaN'):
-				id_val = str(uuid.uuid4())
-			name = row.get('name') or row.get('Name') or None
-			description = row.get('description') or row.get('Description') or None
-			price = row.get('price_shipping_included') or row.get('price') or None
-			pieces = None
-			if (row.get('lego_pieces') is not None) and (str(row.get('lego_pieces')).strip() != ''):
-				try:
-					pieces = int(row.get('lego_pieces'))
-				except Exception:
-					pieces = None
-			cur.execute(insert_query, (
-				id_val, name, None, None, None, None, None,
-				description, price, pieces
-			))
-			inserted += 1
-		conn.commit()
-		print(f'Inserted/updated {inserted} rows into lego_products')
-	finally:
-		conn.close()
-	return len(df)
+		from workbook_stream import WorkbookStream
+	except ImportError:
+		raise SystemExit('Please install openpyxl: pip install openpyxl')
+	if isinstance(source, WorkbookStream):
+		return source, False
+	return WorkbookStream(source, sheet_name=sheet_name, id_header=id_header), True
 
-def _image_bytes_from_openpyxl(img_obj):
-	if hasattr(img_obj, '_data'):
-		try:
-			data = img_obj._data()
-			if data:
-				return data
-		except Exception:
-			pass
-	if hasattr(img_obj, 'image') and img_obj.image is not None:
-		bio = io.BytesIO()
-		try:
-			img_obj.image.save(bio, format='PNG')
-			return bio.getvalue()
-		except Exception:
-			pass
-	if hasattr(img_obj, 'path') and img_obj.path:
-		try:
-			with open(img_obj.path, 'rb') as f:
-				return f.read()
-		except Exception:
-			pass
-	raise RuntimeError('Could not extract image bytes from openpyxl image object')
-
-def extract_images(xlsx_path, sheet_name=None, id_header='id', update_db=False, dry_run=False):
-	print(f'Extracting embedded images from {xlsx_path} (sheet={sheet_name})')
-	wb = load_workbook(xlsx_path, data_only=True)
-	ws = wb[sheet_name] if sheet_name else wb.active
-	headers = [cell.value for cell in ws[1]]
-	headers = [h if h is None else str(h).strip().replace(' ', '_').replace('\n', '_') for h in headers]
-	id_header_clean = id_header.strip().replace(' ', '_')
-	if id_header_clean not in headers:
-		print(f"Warning: id header '{id_header}' not found in worksheet headers: {headers}")
-	id_col_idx = None
+def _note_rejects(batches, stream, rejects=None):
+	"""Pass mapped batches through, reporting the rows the column mapping rejected."""
+	for batch, consumed in batches:
+		for rejected in batch.rejected.itertuples(index=False):
+			print(f'Row {rejected.row} rejected: {rejected.column} {rejected.value!r} is {rejected.reason}')
+		if len(batch.rejected):
+			run_report.count('rows_rejected', len(batch.rejected))
+			if rejects is not None:
+				rejects.add(batch.rejected, workbook=stream.path, sheet=stream.sheet_title)
+		yield batch, consumed
+
+def _planned(batches, plan):
+	"""Pass on only the rows `plan` says need writing; rejected ids still count as seen, so --prune keeps them."""
+	for batch, consumed in batches:
+		plan.seen.update(batch.rejected['id'].dropna())
+		yield plan.diff(batch.rows), consumed
+
+def extract_data_from_excel(source, id_header='id', skip_db_insert=False, dry_run=False, batch_size=DEFAULT_BATCH_SIZE, sheet_name=None, journal=None, rejects=None, prune=False):
+	stream, owned = _open_stream(source, sheet_name=sheet_name, id_header=id_header)
+	print(f'Reading spreadsheet: {stream.path} (sheet={stream.sheet_title})')
 	try:
-		id_col_idx = headers.index(id_header_clean) + 1
-	except ValueError:
-		id_col_idx = 1
-	images = list(getattr(ws, '_images', []))
-	if not images:
-		print('No embedded images found in sheet')
-		return {}
+		if skip_db_insert:
+			stream.drain()
+			print('skip_db_insert set; skipping DB inserts')
+			return stream.row_count
+		try:
+			from column_mapping import ColumnMapping, iter_mapped
+		except ImportError:
+			raise SystemExit('Please install pandas: pip install pandas')
+		# aliases are resolved once for the sheet; rows are then mapped a batch at a time
+		mapping = ColumnMapping(stream.headers, id_header=stream.id_header)
+		if journal is not None and journal.is_done('ingest'):
+			stream.drain()
+			print(f'Resuming: all {stream.row_count} rows were committed by an earlier run; skipping the upsert')
+			return stream.row_count
+		with connection('ingest') as conn:
+			if not dry_run:
+				create_table_if_not_exists(conn)
+			started = time.perf_counter()
+			skip = journal.rows_done if journal is not None else 0
+			if skip:
+				print(f'Resuming: skipping the first {skip} rows, committed by an earlier run')
+				run_report.count('rows_resumed', skip)
+				if prune:
+					print('--prune is ignored when resuming: the rows committed earlier are not re-read')
+					prune = False
+			cur = conn.cursor()
+			plan = SyncPlan.load(cur, prune=prune)
+			cur.close()
+			batches = _planned(_note_rejects(iter_mapped(stream, mapping, chunk_size=batch_size, skip=skip), stream, rejects), plan)
+			if dry_run:
+				for _frame, _consumed in batches:
+					pass
+				plan.print()
+				return stream.row_count
+			if journal is None:
+				bulk_upsert_frames(conn, (frame for frame, _consumed in batches))
+			else:
+				# commit batch by batch so an interrupted run keeps what it loaded
+				upsert_in_batches(conn, batches, on_commit=journal.rows_committed)
+			cur = conn.cursor()
+			deleted = plan.apply_deletes(cur)
+			cur.close()
+			conn.commit()
+			if journal is not None:
+				journal.stage_done('ingest')
+			elapsed = time.perf_counter() - started
+			written = len(plan.changes) + deleted
+			rate = written / elapsed if elapsed > 0 else float(written)
+			run_report.count('rows', len(plan.changes) + plan.unchanged)
+			run_report.count('rows_inserted', len(plan.inserts))
+			run_report.count('rows_updated', len(plan.updates))
+			run_report.count('rows_unchanged', plan.unchanged)
+			if prune:
+				run_report.count('rows_deleted', deleted)
+			print(f'Synced lego_products in {elapsed:.2f}s ({plan.summary()}; {rate:.0f} rows written/sec)')
+		return stream.row_count
+	finally:
+		if owned:
+			stream.close()
+
+def ingest_workbook(xlsx_path, sheet_name=None, id_header='id', **options):
+	"""`extract_data_from_excel` on a stream of its own, handing on what the image stage needs.
+
+	Returns `{'rows', 'row_ids', 'sheet_title'}`: with the row -> id map
+	`extract_images` places the pictures without reading the cells again."""
+	stream, _owned = _open_stream(xlsx_path, sheet_name=sheet_name, id_header=id_header)
+	with stream:
+		rows = extract_data_from_excel(stream, **options)
+	return {'rows': rows, 'row_ids': stream.row_ids, 'sheet_title': stream.sheet_title}
+
+def _group_by_product(saved):
+	"""`{product_id: [urls]}` from `(product_id, url)` pairs in sheet order."""
+	# identical bytes anchored twice to one product collapse into a single URL
 	mapping = {}
-	for img in images:
-		row_idx = None
+	for product_id, url in saved:
+		urls = mapping.setdefault(product_id, [])
+		if url not in urls:
+			urls.append(url)
+	return mapping
+
+def extract_images(source, sheet_name=None, id_header='id', update_db=False, dry_run=False, workers=DEFAULT_WORKERS, journal=None, row_ids=None):
+	"""Store the pictures embedded in the sheet; returns `{product_id: [urls]}`.
+
+	`row_ids` ({sheet row: product id}, as recorded by the ingest pass) saves
+	reading the cells; without it the workbook is streamed for the map."""
+	if journal is not None and journal.is_done('images'):
+		print('Resuming: every image was extracted by an earlier run')
+		mapping = _group_by_product(journal.images[job] for job in sorted(journal.images))
+		run_report.count('images_resumed', len(journal.images))
+		if update_db and mapping:
+			update_pictures(mapping)
+		return mapping
+	from xlsx_media import SheetMedia
+	if row_ids is None:
+		stream, owned = _open_stream(source, sheet_name=sheet_name, id_header=id_header)
+		path, sheet_name = stream.path, stream.sheet_title
+	else:
+		stream, owned = None, False
+		path = str(source)
+	# pictures come straight out of the zip; only the row -> id map needs the cells
+	with SheetMedia(path, sheet_name) as media:
+		print(f'Extracting embedded images from {path} (sheet={media.sheet_title})')
 		try:
-			row_idx = int(img.anchor._from.row) + 1
-		except Exception:
-			try:
-				anchor_from = getattr(img.anchor, 'from', None)
-				if anchor_from and hasattr(anchor_from, 'row'):
-					row_idx = int(anchor_from.row) + 1
-				else:
-					raise AttributeError
-			except Exception:
+			refs = list(media)
+			if not refs:
+				print('No embedded images found in sheet')
+				return {}
+			if stream is not None:
+				# the row -> id map is filled while rows stream past; finish the pass if nobody has yet
+				stream.drain()
+				row_ids = dict(stream.row_ids)
+		finally:
+			if owned:
+				stream.close()
+		jobs = []
+		for ref in refs:
+			if ref.row is None:
 				print('Could not determine image anchor row for an image, skipping')
+				run_report.count('errors_skipped')
 				continue
-		id_cell = ws.cell(row=row_idx, column=id_col_idx).value
-		if id_cell is None:
-			print(f'Row {row_idx} has no id cell, skipping image')
-			continue
-		product_id = str(id_cell)
-		try:
-			img_bytes = _image_bytes_from_openpyxl(img)
-		except Exception as e:
-			print(f'Failed to extract image bytes for row {row_idx}: {e}')
-			continue
-		folder = UPLOAD_BASE / product_id
-		folder.mkdir(parents=True, exist_ok=True)
-		fname = f"{uuid.uuid4().hex}.png"
-		out_path = folder / fname
-		if dry_run:
-			print(f'[dry-run] would write image to {out_path}')
-		else:
-			with open(out_path, 'wb') as f:
-				f.write(img_bytes)
-		rel_url = f"/uploads/products/{product_id}/{fname}"
-		mapping.setdefault(product_id, []).append(rel_url)
+			product_id = row_ids.get(ref.row)
+			if product_id is None:
+				print(f'Row {ref.row} has no id cell, skipping image')
+				run_report.count('errors_skipped')
+				continue
+			jobs.append((ref.row, product_id, ref))
+
+		def _save(job):
+			_row_idx, product_id, ref = job
+			# the media part is copied as is: no decoding, no re-encoding
+			with media.open(ref) as src:
+				return store_image_stream(src, product_id, UPLOAD_BASE, dry_run=dry_run, ext=ref.ext)
+
+		# images stored by an interrupted run are taken from the journal as they are
+		saved = {idx: url for idx, (_pid, url) in journal.images.items() if idx < len(jobs)} if journal is not None else {}
+		if saved:
+			print(f'Resuming: {len(saved)} images were stored by an earlier run')
+			run_report.count('images_resumed', len(saved))
+		todo = [idx for idx in range(len(jobs)) if idx not in saved]
+		written = 0
+		failed = 0
+		for n, result, err in map_bounded(_save, [jobs[idx] for idx in todo], workers=workers):
+			idx = todo[n]
+			if err is not None:
+				print(f'Failed to extract image bytes for row {jobs[idx][0]}: {err}')
+				run_report.count('errors_skipped')
+				failed += 1
+				continue
+			saved[idx], is_new, size = result
+			written += is_new
+			if is_new and not dry_run:
+				run_report.count('bytes_written', size)
+			if journal is not None:
+				journal.image_stored(idx, jobs[idx][1], saved[idx])
+	# keep each product's images in sheet order regardless of which worker finished first
+	mapping = _group_by_product((jobs[idx][1], saved[idx]) for idx in sorted(saved))
+	print(f'Images written: {written}, already stored: {len(saved) - written}')
+	run_report.count('images', len(saved))
+	run_report.count('images_written', written)
+	if journal is not None and not failed:
+		journal.stage_done('images')
 	if update_db and mapping and not dry_run:
-		db_conf = get_db_config()
-		conn = psycopg2.connect(**db_conf)
-		try:
-			cur = conn.cursor()
-			for pid, urls in mapping.items():
-				pics = [None]*5
-				for i in range(min(5, len(urls))):
-					pics[i] = urls[i]
-				cur.execute(
-					'UPDATE lego_products SET pictures=%s, pictures_1=%s, pictures_2=%s, pictures_3=%s, pictures_4=%s WHERE id=%s',
-					(*pics, pid)
-				)
-			conn.commit()
-			cur.close()
-		finally:
-			conn.close()
+		update_pictures(mapping)
 	print('Image extraction complete. Products with images:', len(mapping))
 	return mapping
 
-def export_to_json(out_path='lego_products_export.json'):
-	db_conf = get_db_config()
-	conn = psycopg2.connect(**db_conf)
-	try:
-		df = pd.read_sql_query('SELECT * FROM lego_products;', conn)
-		df.to_json(out_path, orient='records', indent=2)
-		print(f'Exported lego_products to {out_path} ({len(df)} rows)')
-	finally:
-		conn.close()
+def ingest_batch(source, sheet_name=None, all_sheets=False, id_header='id', skip_db_insert=False, dry_run=False, workers=None, rejects=None):
+	"""Load every sheet of every workbook matched by `source`; returns the picture mapping."""
+	from batch_ingest import discover_workbooks, run_batch, sheet_tasks
+	workbooks = discover_workbooks(source)
+	if not workbooks:
+		print(f'No workbooks found at {source}')
+		return {}
+	tasks, unreadable = sheet_tasks(workbooks, sheet_name=sheet_name, all_sheets=all_sheets)
+	print(f'Batch ingest: {len(tasks)} sheets from {len(workbooks)} workbooks on {workers or os.cpu_count()} processes')
 
-def update_db_images_by_name(dry_run=False):
-	if not UPLOAD_BASE.exists():
-		print('No uploads directory, skipping update by folder name')
-		return
-	db_conf = get_db_config()
-	conn = psycopg2.connect(**db_conf)
-	try:
+	def _on_result(result):
+		where = f"{result['workbook']} (sheet={result['sheet']})"
+		if 'error' in result:
+			print(f"Failed to read {where}: {result['error']}")
+			run_report.count('errors_skipped')
+			return
+		for err in result['errors']:
+			print(f'{where}: {err}')
+		rejected = result['rejected']
+		print(f"  {where}: {result['rows']} rows ({len(rejected)} rejected), {len(result['pictures'])} images")
+		if len(rejected):
+			run_report.count('rows_rejected', len(rejected))
+			if rejects is not None:
+				rejects.add(rejected, workbook=result['workbook'], sheet=result['sheet'])
+		run_report.count('sheets')
+		run_report.count('rows', result['rows'])
+		run_report.count('images', len(result['pictures']))
+		run_report.count('images_written', result['images_written'])
+		run_report.count('bytes_written', result['bytes_written'])
+		run_report.count('errors_skipped', len(result['errors']))
+
+	for result in unreadable:
+		_on_result(result)
+	started = time.perf_counter()
+	if skip_db_insert or dry_run:
+		results, _merged = run_batch(tasks, UPLOAD_BASE, id_header=id_header, workers=workers, dry_run=dry_run, on_result=_on_result)
+		print('skip_db_insert set; skipping DB inserts' if skip_db_insert else '[dry-run] no rows written to lego_products')
+	else:
+		with connection('ingest') as conn:
+			create_table_if_not_exists(conn)
+			results, (inserted, updated) = run_batch(tasks, UPLOAD_BASE, conn=conn, id_header=id_header, workers=workers, on_result=_on_result)
+			conn.commit()
+		rows = sum(r.get('rows', 0) for r in results)
+		print(f'Inserted {inserted} and updated {updated} products from {rows} rows in {time.perf_counter() - started:.2f}s')
+	failed = sum(1 for r in results if 'error' in r)
+	if failed:
+		print(f'{failed} of {len(tasks)} sheets could not be read')
+	if unreadable:
+		print(f'{len(unreadable)} of {len(workbooks)} workbooks could not be opened')
+	return _group_by_product(pair for r in results for pair in r.get('pictures', ()))
+
+def update_pictures(mapping):
+	"""Point the products in `mapping` ({product_id: urls}) at their extracted images."""
+	if not mapping:
+		return []
+	def _update(conn):
+		ensure_schema(conn)
 		cur = conn.cursor()
-		for folder in sorted(UPLOAD_BASE.iterdir()):
-			if not folder.is_dir():
-				continue
-			product_name = folder.name
-			exts = {'.png', '.jpg', '.jpeg', '.webp', '.gif'}
-			files = [p for p in sorted(folder.iterdir()) if p.suffix.lower() in exts]
-			if not files:
-				continue
-			urls = [f"/uploads/products/{folder.name}/{p.name}" for p in files]
-			cur.execute('SELECT id, name FROM lego_products WHERE name = %s', (product_name,))
-			row = cur.fetchone()
-			if not row:
-				cur.execute('SELECT id, name FROM lego_products WHERE name ILIKE %s LIMIT 1', (product_name,))
-				row = cur.fetchone()
-			if not row:
-				print(f'No product matched folder "{product_name}", skipping')
-				continue
-			product_id = row[0]
-			pics = [None]*5
-			for i in range(min(5, len(urls))):
-				pics[i] = urls[i]
-			if dry_run:
-				print(f'[dry-run] Would update product id={product_id} name={row[1]} with {len(urls)} images')
-			else:
-				cur.execute(
-					'UPDATE lego_products SET pictures=%s, pictures_1=%s, pictures_2=%s, pictures_3=%s, pictures_4=%s WHERE id=%s',
-					(*pics, product_id)
-				)
-				conn.commit()
-				print(f'Updated product id={product_id} name={row[1]} with {min(5,len(urls))} images')
+		changed = apply_picture_updates(cur, mapping)
+		conn.commit()
 		cur.close()
-	finally:
-		conn.close()
+		return changed
+	changed = run_with_retry(_update, stage='images')
+	run_report.count('products_updated', len(changed))
+	print(f'Updated pictures of {len(changed)} products ({len(mapping) - len(changed)} already up to date)')
+	return changed
 
-def main():
-	load_env()
-	parser = argparse.ArgumentParser(description='Combined import/export/image utility')
-	parser.add_argument('--xlsx', required=True, help='Path to xlsx file')
+def build_image_variants(mapping, widths=None, avif=False, workers=None):
+	sources = [ROOT / 'public' / url.lstrip('/') for urls in mapping.values() for url in urls]
+	if not sources:
+		return
+	from image_variants import DEFAULT_WIDTHS, generate_variants, resolve_formats
+	created, skipped = generate_variants(sources, widths=widths or DEFAULT_WIDTHS, formats=resolve_formats(avif), workers=workers)
+	run_report.count('variants_created', created)
+	run_report.count('variants_skipped', skipped)
+	print(f'Image variants created: {created}, already present: {skipped}')
+
+def export_to_json(out_path='lego_products_export.json', fmt='json', compress=False, chunk_size=DEFAULT_EXPORT_CHUNK_SIZE, mode='full'):
+	started = time.perf_counter()
+	if mode == 'delta':
+		snapshot = output_path(out_path, compress)
+		delta_path, count = run_with_retry(lambda conn: export_delta(conn, snapshot, chunk_size=chunk_size), stage='export')
+		elapsed = time.perf_counter() - started
+		if delta_path is None:
+			print(f'No lego_products changes since the last export of {snapshot}')
+		else:
+			print(f'Exported {count} changed or deleted products to {delta_path} ({elapsed:.2f}s)')
+			run_report.count('rows', count)
+			run_report.count('bytes_written', os.path.getsize(delta_path))
+		return count
+	written_path, count = run_with_retry(
+		lambda conn: stream_export(conn, out_path, fmt=fmt, compress=compress, chunk_size=chunk_size), stage='export'
+	)
+	elapsed = time.perf_counter() - started
+	print(f'Exported lego_products to {written_path} ({count} rows, {fmt}{", gzip" if compress else ""}, {elapsed:.2f}s)')
+	run_report.count('rows', count)
+	run_report.count('bytes_written', os.path.getsize(written_path))
+	return count
+
+def write_catalog_snapshot(out_dir, page_size=DEFAULT_PAGE_SIZE, keep=DEFAULT_KEEP):
+	started = time.perf_counter()
+	manifest = run_with_retry(lambda conn: write_snapshot(conn, out_dir, page_size=page_size, keep=keep), stage='export')
+	elapsed = time.perf_counter() - started
+	if not manifest['changed']:
+		print(f'Catalog unchanged; snapshot {manifest["version"]} in {out_dir} is current ({elapsed:.2f}s)')
+		return manifest
+	files = manifest['pages'] + list(manifest['id_shards']['shards'].values())
+	written = sum(entry['bytes'] + sum(e['bytes'] for e in entry['encodings'].values()) for entry in files)
+	print(f'Wrote catalog snapshot {manifest["version"]} to {out_dir}: {manifest["rows"]} rows, '
+		f'{len(manifest["pages"])} pages, {len(manifest["id_shards"]["shards"])} id shards '
+		f'({", ".join(manifest["encodings"])}), {elapsed:.2f}s')
+	run_report.count('rows', manifest['rows'])
+	run_report.count('bytes_written', written)
+	return manifest
+
+def build_search_index(out_path):
+	started = time.perf_counter()
+	documents, terms = run_with_retry(lambda conn: build_from_db(conn, out_path), stage='export')
+	print(f'Built search index {out_path}: {documents} products, {terms} terms ({time.perf_counter() - started:.2f}s)')
+	run_report.count('rows', documents)
+	run_report.count('bytes_written', os.path.getsize(out_path))
+	return documents
+
+def compact_export(out_path='lego_products_export.json', compress=False):
+	snapshot = output_path(out_path, compress)
+	count = compact(snapshot)
+	print(f'Compacted pending deltas into {snapshot} ({count} rows)')
+	run_report.count('rows', count)
+	run_report.count('bytes_written', os.path.getsize(snapshot))
+
+def update_db_images_by_name(dry_run=False, full=False):
+	if not UPLOAD_BASE.exists():
+		print('No uploads directory, skipping update by folder name')
+		return [], {}, []
+	def _sync(conn):
+		ensure_schema(conn)
+		return sync_folder_images(conn, UPLOAD_BASE, dry_run=dry_run, manifest_path=UPLOAD_BASE / MANIFEST_NAME, full=full)
+	changed, updates, unmatched = run_with_retry(_sync, stage='rescan')
+	if not dry_run:
+		print(f'Matched {len(updates)} image folders to products ({len(unmatched)} unmatched); updated {len(changed)} products')
+		run_report.count('folders_matched', len(updates))
+		run_report.count('folders_unmatched', len(unmatched))
+		run_report.count('products_updated', len(changed))
+	return changed, updates, unmatched
+
+def _load_root_script(name):
+	spec = importlib.util.spec_from_file_location(name, ROOT / f'{name}.py')
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+def import_json(input_path=None, batch_size=DEFAULT_BATCH_SIZE):
+	"""Load a catalog export back into lego_products (see import_lego_products.py)."""
+	importer = _load_root_script('import_lego_products')
+	input_path = input_path or importer.DEFAULT_INPUT
+	with connection('import') as conn:
+		count = importer.import_products(conn, read_json_records(input_path), batch_size=batch_size)
+	run_report.count('rows', count)
+	return count
+
+def refresh_catalog_facets():
+	started = time.perf_counter()
+	counts = run_with_retry(refresh_facets, stage='facets')
+	summary = ', '.join(f'{facet}: {n}' for facet, n in sorted(counts.items()))
+	run_report.count('facet_buckets', sum(counts.values()))
+	print(f'Refreshed catalog facets ({summary}) in {time.perf_counter() - started:.2f}s')
+
+STAGE_NAMES = ('ingest', 'images', 'pictures', 'variants', 'rescan', 'export', 'compact', 'snapshot', 'search', 'facets')
+WORKBOOK_STAGES = ('ingest', 'images')
+# subcommand -> the pipeline stages it may run (options decide which are enabled)
+COMMANDS = {
+	'ingest': ('ingest',),
+	'images': ('images', 'pictures', 'variants'),
+	'export': ('export', 'compact', 'snapshot', 'search'),
+	'rescan': ('rescan',),
+	'import-json': ('import',),
+}
+
+def pipeline_stages(args):
+	"""The stages enabled by `args`, each listing the stages whose data it consumes.
+
+	The image extraction places its pictures with the row -> id map recorded by the
+	row upsert, so the workbook is read once; the picture update needs both, the
+	folder rescan follows it, and the export, snapshot and search index wait for
+	every write to lego_products (including the prices `facets` parses into it)."""
+	xlsx_path = Path(args.xlsx) if args.xlsx else None
+	writes = not args.dry_run
+	stages = []
+	if args.batch:
+		stages.append(Stage('ingest', lambda results: ingest_batch(
+			args.xlsx, sheet_name=args.sheet, all_sheets=args.all_sheets, id_header=args.id_header,
+			skip_db_insert=args.skip_db_insert, dry_run=args.dry_run, workers=args.parse_workers, rejects=args.rejects)))
+		# the batch workers extract the images along with the rows
+		stages.append(Stage('images', lambda results: results.get('ingest') or {}, deps=('ingest',)))
+	elif args.skip_db_insert:
+		print('skip_db_insert set; skipping DB inserts')
+	else:
+		stages.append(Stage('ingest', lambda results: ingest_workbook(
+			xlsx_path, sheet_name=args.sheet, id_header=args.id_header, dry_run=args.dry_run, batch_size=args.batch_size,
+			journal=args.journal, rejects=args.rejects, prune=args.prune)))
+	if not args.batch:
+		def _images(results):
+			# with the ingest stage in the run the sheet's cells are read once, by it
+			ingested = results.get('ingest') or {}
+			return extract_images(
+				xlsx_path, sheet_name=ingested.get('sheet_title', args.sheet), id_header=args.id_header, dry_run=args.dry_run,
+				workers=args.workers, journal=args.journal, row_ids=ingested.get('row_ids'))
+		stages.append(Stage('images', _images, deps=('ingest',)))
+	if args.update_db and writes:
+		stages.append(Stage('pictures', lambda results: update_pictures(results.get('images') or {}), deps=('ingest', 'images')))
+	if args.variants and writes:
+		stages.append(Stage('variants', lambda results: build_image_variants(
+			results.get('images') or {}, widths=args.variant_widths, avif=args.avif, workers=args.variant_workers), deps=('images',)))
+	stages.append(Stage('rescan', lambda results: update_db_images_by_name(dry_run=args.dry_run, full=args.full_rescan),
+		deps=('ingest', 'images', 'pictures')))
+	if writes:
+		stages.append(Stage('export', lambda results: export_to_json(
+			args.export_path, fmt=args.export_format, compress=args.export_gzip, mode=args.export_mode), deps=('ingest', 'pictures', 'rescan', 'facets')))
+		if args.compact:
+			stages.append(Stage('compact', lambda results: compact_export(args.export_path, compress=args.export_gzip), deps=('export',)))
+		stages.append(Stage('snapshot', lambda results: write_catalog_snapshot(
+			args.snapshot_dir, page_size=args.snapshot_page_size, keep=args.snapshot_keep), deps=('ingest', 'pictures', 'rescan', 'facets')))
+		stages.append(Stage('search', lambda results: build_search_index(args.search_index), deps=('ingest', 'pictures', 'rescan', 'facets')))
+		stages.append(Stage('facets', lambda results: refresh_catalog_facets(), deps=('ingest',)))
+	if args.command == 'import-json':
+		stages.append(Stage('import', lambda results: import_json(args.input, batch_size=args.batch_size)))
+	return stages
+
+def _variant_widths(value):
+	from image_variants import parse_widths
+	return parse_widths(value)
+
+def _is_batch_source(source):
+	from batch_ingest import is_batch_source
+	return is_batch_source(source)
+
+def _add_workbook_args(parser):
+	parser.add_argument('--xlsx', help='Path to xlsx file, or a directory / glob of workbooks to ingest in batch (needed by the ingest and images stages)')
 	parser.add_argument('--sheet', help='Optional sheet name (defaults to active)')
 	parser.add_argument('--id-header', default='id', help='Name of header column that holds product id (default: id)')
+	parser.add_argument('--resumable', action='store_true', help='Commit the import batch by batch and checkpoint it so an interrupted run can be continued with --resume')
+	parser.add_argument('--resume', action='store_true', help='Skip the rows and images an interrupted --resumable run of the same workbook already committed (implies --resumable)')
+	parser.add_argument('--journal-dir', default=str(ROOT / JOURNAL_DIRNAME), help=f'Where import checkpoints are kept (default: {JOURNAL_DIRNAME}/ in the repo root)')
+
+def _add_ingest_args(parser):
+	parser.add_argument('--all-sheets', action='store_true', help='Ingest every sheet of every workbook (batch mode)')
+	parser.add_argument('--parse-workers', type=int, default=None, help='Processes parsing workbooks in batch mode (default: CPU count)')
+	parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help=f'Rows per COPY batch when loading the spreadsheet (default: {DEFAULT_BATCH_SIZE})')
+	parser.add_argument('--rejects-out', help='Write the spreadsheet rows rejected by validation to this CSV file')
+	parser.add_argument('--prune', action='store_true', help='Delete products that are not in the spreadsheet (single workbook only)')
+
+def _add_image_args(parser):
+	parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Threads used to extract and write embedded images (default: 1)')
 	parser.add_argument('--update-db', action='store_true', help='Update postgres lego_products table to reference saved images')
+	parser.add_argument('--variants', action='store_true', help='Generate resized WebP variants of the extracted images')
+	parser.add_argument('--variant-widths', type=_variant_widths, default=None, help='Comma separated variant widths in px (default: 280,800)')
+	parser.add_argument('--avif', action='store_true', help='Also write AVIF variants when Pillow supports it')
+	parser.add_argument('--variant-workers', type=int, default=None, help='Processes used to encode variants (default: CPU count)')
+
+def _add_export_args(parser):
+	parser.add_argument('--export-path', default='lego_products_export.json', help='Where to write the catalog export (default: lego_products_export.json)')
+	parser.add_argument('--export-format', choices=EXPORT_FORMATS, default='json', help='json (compact array) or ndjson (one record per line)')
+	parser.add_argument('--export-gzip', action='store_true', help='gzip-compress the export (appends .gz)')
+	parser.add_argument('--export-mode', choices=('full', 'delta'), default='full', help='full snapshot, or only products changed or deleted since the last export (default: full)')
+	parser.add_argument('--compact', action='store_true', help='After exporting, merge pending delta files into the snapshot')
+	parser.add_argument('--snapshot-dir', default=str(ROOT / 'public' / 'catalog'), help='Where the static catalog snapshots go (default: public/catalog)')
+	parser.add_argument('--snapshot-page-size', type=int, default=DEFAULT_PAGE_SIZE, help=f'Products per snapshot listing page (default: {DEFAULT_PAGE_SIZE})')
+	parser.add_argument('--snapshot-keep', type=int, default=DEFAULT_KEEP, help=f'Snapshot versions kept for clients holding an older manifest (default: {DEFAULT_KEEP})')
+	parser.add_argument('--search-index', default=str(ROOT / 'public' / 'catalog' / 'search.idx'), help='Where the product search index is written (default: public/catalog/search.idx)')
+
+def _add_rescan_args(parser):
+	parser.add_argument('--full-rescan', action='store_true', help='Re-process every uploads folder, ignoring the scan manifest')
+
+def _add_run_args(parser, dry_run=True):
+	if dry_run:
+		parser.add_argument('--dry-run', action='store_true', help='Do not write to DB or disk; just simulate')
+	parser.add_argument('--report', help='Write a JSON run report (per-stage timings, counters, DB statement stats) to this path')
+	parser.add_argument('--profile', action='store_true', help='Profile the run with cProfile and tracemalloc (adds memory peaks to the report; runs the stages one at a time)')
+	parser.add_argument('--profile-out', default='combined_script.prof', help='Where --profile writes the cProfile stats (default: combined_script.prof)')
+
+def _add_import_args(parser):
+	parser.add_argument('--input', default=None, help='JSON array or NDJSON export to import, .gz allowed (default: lego_products_export.json)')
+	parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help=f'Rows per COPY batch (default: {DEFAULT_BATCH_SIZE})')
+
+def _subcommand_options(*adders):
+	"""Parent parser declaring a subcommand's options without defaults.
+
+	The root parser has already filled in every default (or the value given
+	before the subcommand), so the subcommand only sets the options given after
+	it: `--xlsx X ingest` and `ingest --xlsx X` mean the same."""
+	parent = argparse.ArgumentParser(add_help=False)
+	for add in adders:
+		add(parent)
+	for action in parent._actions:
+		action.default = argparse.SUPPRESS
+	return parent
+
+def build_parser():
+	parser = argparse.ArgumentParser(description='Combined import/export/image utility (runs the whole pipeline unless a subcommand is given)')
+	_add_workbook_args(parser)
+	_add_ingest_args(parser)
 	parser.add_argument('--skip-db-insert', action='store_true', help='Skip inserting rows into DB (only extract images)')
-	parser.add_argument('--dry-run', action='store_true', help='Do not write to DB or disk; just simulate')
+	_add_image_args(parser)
+	_add_export_args(parser)
+	_add_rescan_args(parser)
+	_add_run_args(parser)
+	parser.add_argument('--only', type=parse_stage_list, help=f'Comma separated stages to run, out of: {", ".join(STAGE_NAMES)}')
+	parser.add_argument('--skip', type=parse_stage_list, help='Comma separated stages to leave out')
+	parser.add_argument('--stage-workers', type=int, default=DEFAULT_STAGE_WORKERS, help=f'Stages allowed to run at the same time (default: {DEFAULT_STAGE_WORKERS}; 1 runs them one by one)')
+	parser.set_defaults(command=None, input=None, journal=None, rejects=None)
+
+	commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+	commands.add_parser('ingest', help='Load spreadsheet rows into lego_products',
+		parents=[_subcommand_options(_add_workbook_args, _add_ingest_args, _add_run_args)])
+	commands.add_parser('images', help='Extract the images embedded in a spreadsheet',
+		parents=[_subcommand_options(_add_workbook_args, _add_image_args, _add_run_args)])
+	commands.add_parser('export', help='Export lego_products to JSON',
+		parents=[_subcommand_options(_add_export_args, functools.partial(_add_run_args, dry_run=False))])
+	commands.add_parser('rescan', help='Match uploads folders to products and update their pictures',
+		parents=[_subcommand_options(_add_rescan_args, _add_run_args)])
+	commands.add_parser('import-json', help='Replace lego_products with the contents of an export',
+		parents=[_subcommand_options(_add_import_args, functools.partial(_add_run_args, dry_run=False))])
+	return parser
+
+def main():
+	parser = build_parser()
 	args = parser.parse_args()
-	xlsx_path = Path(args.xlsx)
-	if not xlsx_path.exists():
-		print('Specified xlsx path does not exist:', xlsx_path)
-		sys.exit(2)
-	extract_data_from_excel(str(xlsx_path), id_header=args.id_header, skip_db_insert=args.skip_db_insert, dry_run=args.dry_run)
-	mapping = extract_images(str(xlsx_path), sheet_name=args.sheet, id_header=args.id_header, update_db=args.update_db and not args.dry_run, dry_run=args.dry_run)
-	if not args.dry_run:
-		export_to_json()
-	update_db_images_by_name(dry_run=args.dry_run)
+	load_env()
+	args.batch = bool(args.xlsx) and (args.all_sheets or _is_batch_source(args.xlsx))
+	if args.command:
+		if args.command in ('export', 'import-json') and args.dry_run:
+			parser.error(f'{args.command} has no --dry-run')
+		if args.command == 'images' and args.batch:
+			parser.error('images reads a single workbook; ingest extracts the images of a directory or glob of workbooks')
+		stages = [stage for stage in pipeline_stages(args) if stage.name in COMMANDS[args.command]]
+	else:
+		try:
+			stages = select_stages(pipeline_stages(args), only=args.only, skip=args.skip, names=STAGE_NAMES)
+		except ValueError as e:
+			parser.error(str(e))
+	if any(stage.name in WORKBOOK_STAGES for stage in stages):
+		if not args.xlsx and args.command:
+			parser.error(f'{args.command} needs --xlsx: the workbook to read')
+		if not args.xlsx:
+			parser.error(f'--xlsx is required for the {"/".join(WORKBOOK_STAGES)} stages (use --only/--skip to run without them)')
+		if args.batch:
+			if args.resumable or args.resume:
+				print('--resumable/--resume are not supported in batch mode; the batch is loaded in one transaction')
+			if args.prune:
+				print('--prune is not supported in batch mode; products missing from the batch are kept')
+		elif not Path(args.xlsx).exists():
+			print('Specified xlsx path does not exist:', args.xlsx)
+			sys.exit(2)
+		elif (args.resumable or args.resume) and not args.dry_run:
+			args.journal = ImportJournal.for_workbook(
+				Path(args.xlsx), Path(args.journal_dir), sheet=args.sheet, id_header=args.id_header, resume=args.resume)
+			if args.journal.resumed:
+				print(f'Resuming from {args.journal.path}: {args.journal.rows_done} rows and {len(args.journal.images)} images already done')
+			elif args.resume:
+				print('Nothing to resume for this workbook; starting from the beginning')
+	if any(stage.name == 'ingest' for stage in stages):
+		from column_mapping import RejectReport
+		args.rejects = RejectReport()
+	if args.profile and args.stage_workers > 1:
+		# cProfile and the tracemalloc stage peaks only see stages run on this thread
+		print('--profile runs the stages one at a time')
+		args.stage_workers = 1
+	report = run_report.RunReport(profile=args.profile)
+	try:
+		with report.activate():
+			run_stages(stages, workers=args.stage_workers)
+	finally:
+		# every stage above borrowed from the same pool; release the connections once
+		close_pool()
+		if args.journal is not None:
+			if report.status == 'ok':
+				# nothing left to resume
+				args.journal.remove()
+			else:
+				args.journal.close()
+		print(f'\nRun {report.status} in {report.seconds:.2f}s:')
+		print(report.summary())
+		if args.rejects is not None and args.rejects.count:
+			print(f'{args.rejects.count} spreadsheet rows were rejected')
+		if args.rejects_out and args.rejects is not None:
+			args.rejects.write(args.rejects_out)
+			print(f'Rejected rows written to {args.rejects_out}')
+		if args.report:
+			report.write(args.report)
+			print(f'Run report written to {args.report}')
+		if args.profile:
+			report.write_profile(args.profile_out)
+			print(f'cProfile stats written to {args.profile_out}')
 
 if __name__ == '__main__':
-	main()
\ No newline at end of file
+	main()
@@ -0,0 +1,314 @@
+"""
+db.py
+
+Shared PostgreSQL access for the Python scripts.
+
+Every script used to carry its own `DB_CONFIG` and open a fresh
+`psycopg2.connect` per stage. This module owns the configuration (environment
+variables, optionally loaded from the repository `.env`), a lazily created
+thread-safe connection pool reused by every stage of a run, retry with
+exponential backoff on transient failures, per-stage statement timeouts and
+per-connection prepared statements.
+
+  with db.connection('ingest') as conn:
+      ...                                   # conn goes back to the pool afterwards
+
+  db.run_with_retry(fn, stage='rescan')     # fn(conn) is retried on transient errors
+
+Statement timeouts default to `STAGE_TIMEOUTS` and can be overridden with
+`PG_STATEMENT_TIMEOUT_<STAGE>` (any Postgres interval, e.g. `90s`; `0` disables).
+
+The pool holds up to `PG_POOL_SIZE` connections. When all of them are borrowed,
+`connection` waits for one to come back (up to `PG_POOL_TIMEOUT` seconds)
+instead of failing, so running more stages or workers than there are
+connections only queues them.
+
+Every cursor reports `(statement class, seconds)` for each statement it runs to
+the observer installed with `set_statement_observer` (see run_report.py).
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+	import psycopg2
+	import psycopg2.extensions
+	from psycopg2 import errorcodes, errors, sql
+	from psycopg2.pool import PoolError, ThreadedConnectionPool
+except ImportError:
+	raise SystemExit('Please install psycopg2-binary: pip install psycopg2-binary')
+
+try:
+	from dotenv import load_dotenv
+	DOTENV_AVAILABLE = True
+except Exception:
+	DOTENV_AVAILABLE = False
+
+ROOT = Path(__file__).resolve().parents[2]
+
+STAGE_TIMEOUTS = {
+	'ingest': '30min',
+	'images': '5min',
+	'export': '30min',
+	'rescan': '2min',
+	'import': '30min',
+	'facets': '5min',
+}
+DEFAULT_POOL_SIZE = 4
+DEFAULT_POOL_TIMEOUT = 600
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+# SQLSTATEs worth retrying: the server asked us to (serialization/deadlock) or is starting/stopping
+_TRANSIENT_SQLSTATES = {
+	errorcodes.SERIALIZATION_FAILURE,
+	errorcodes.DEADLOCK_DETECTED,
+	errorcodes.CANNOT_CONNECT_NOW,
+	errorcodes.ADMIN_SHUTDOWN,
+	errorcodes.CRASH_SHUTDOWN,
+	errorcodes.TOO_MANY_CONNECTIONS,
+}
+_TRANSIENT_ERRORS = tuple(errors.lookup(code) for code in _TRANSIENT_SQLSTATES)
+
+_env_loaded = False
+_pool = None
+_pool_lock = threading.Lock()
+_statement_observer = None
+
+
+def load_env():
+	global _env_loaded
+	if _env_loaded:
+		return
+	_env_loaded = True
+	if DOTENV_AVAILABLE:
+		env_path = ROOT / '.env'
+		if env_path.exists():
+			load_dotenv(env_path)
+
+
+def get_db_config():
+	load_env()
+	return {
+		'host': os.getenv('PG_HOST', 'localhost'),
+		'port': os.getenv('PG_PORT', '5432'),
+		'database': os.getenv('PG_DATABASE', 'lego_store'),
+		'user': os.getenv('PG_USER', 'postgres'),
+		'password': os.getenv('PG_PASSWORD', 'Lego@store1234'),
+	}
+
+
+def set_statement_observer(observer):
+	"""Install `observer(statement_class, seconds)`, called after every statement (None removes it)."""
+	global _statement_observer
+	_statement_observer = observer
+
+
+def statement_class(query):
+	"""`SELECT`, `INSERT`, `COPY`, ... or `EXECUTE <name>` for a query string."""
+	if isinstance(query, bytes):
+		query = query[:200].decode('utf-8', 'replace')
+	words = query.lstrip(' \t\r\n(').split(None, 2)
+	if not words:
+		return 'EMPTY'
+	kind = words[0].upper()
+	if kind in ('EXECUTE', 'PREPARE') and len(words) > 1:
+		kind = f'{kind} {words[1].split("(")[0]}'
+	return kind
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+	"""Cursor that reports each statement's class and duration to the statement observer."""
+
+	def _timed(self, run, query):
+		observer = _statement_observer
+		if observer is None:
+			return run()
+		started = time.perf_counter()
+		try:
+			return run()
+		finally:
+			if isinstance(query, sql.Composable):
+				query = query.as_string(self.connection)
+			observer(statement_class(query), time.perf_counter() - started)
+
+	def execute(self, query, vars=None):
+		return self._timed(lambda: super(TimedCursor, self).execute(query, vars), query)
+
+	def executemany(self, query, vars_list):
+		return self._timed(lambda: super(TimedCursor, self).executemany(query, vars_list), query)
+
+	def copy_expert(self, query, file, size=8192):
+		return self._timed(lambda: super(TimedCursor, self).copy_expert(query, file, size), query)
+
+
+class Connection(psycopg2.extensions.connection):
+	"""psycopg2 connection that remembers which statements it has PREPAREd
+	and hands out statement-timing cursors."""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.prepared = set()
+		self.cursor_factory = TimedCursor
+
+
+def is_transient(exc):
+	"""True for the SQLSTATEs above and for lost or refused connections, nothing else.
+
+	Server errors such as QueryCanceled (a statement timeout) or DiskFull are
+	OperationalErrors too, but would only fail again."""
+	if isinstance(exc, _TRANSIENT_ERRORS) or getattr(exc, 'pgcode', None) in _TRANSIENT_SQLSTATES:
+		return True
+	# connection failures are raised by libpq as the plain classes, without a SQLSTATE
+	return type(exc) in (psycopg2.OperationalError, psycopg2.InterfaceError) and getattr(exc, 'pgcode', None) is None
+
+
+def _backoff(attempt, base_delay=RETRY_BASE_DELAY):
+	return base_delay * (2 ** (attempt - 1)) * (1 + random.random())
+
+
+def stage_timeout(stage):
+	if stage is None:
+		return None
+	override = os.getenv(f'PG_STATEMENT_TIMEOUT_{stage.upper()}')
+	return override if override is not None else STAGE_TIMEOUTS.get(stage)
+
+
+def _set_timeout(conn, timeout):
+	cur = conn.cursor()
+	if timeout is None:
+		cur.execute('RESET statement_timeout')
+	else:
+		cur.execute('SET statement_timeout = %s', (str(timeout),))
+	cur.close()
+	conn.commit()
+
+
+def _retrying(fn, what, attempts=RETRY_ATTEMPTS):
+	for attempt in range(1, attempts + 1):
+		try:
+			return fn()
+		except psycopg2.Error as e:
+			if attempt == attempts or not is_transient(e):
+				raise
+			delay = _backoff(attempt)
+			print(f'{what} failed ({str(e).strip() or type(e).__name__}); retrying in {delay:.1f}s ({attempt}/{attempts - 1})')
+			time.sleep(delay)
+
+
+def connect(stage=None):
+	"""Open a dedicated (unpooled) connection, retrying transient failures.
+
+	Meant for long-running loops such as the uploads watcher."""
+	conn = _retrying(lambda: psycopg2.connect(connection_factory=Connection, **get_db_config()), 'Connecting to PostgreSQL')
+	_set_timeout(conn, stage_timeout(stage))
+	return conn
+
+
+class BlockingPool(ThreadedConnectionPool):
+	"""ThreadedConnectionPool whose `getconn` waits for a free connection instead of raising PoolError."""
+
+	def __init__(self, minconn, maxconn, *args, timeout=DEFAULT_POOL_TIMEOUT, **kwargs):
+		self._slots = threading.BoundedSemaphore(maxconn)
+		self.timeout = timeout
+		super().__init__(minconn, maxconn, *args, **kwargs)
+
+	def getconn(self, key=None):
+		if not self._slots.acquire(timeout=self.timeout):
+			raise PoolError(f'no pooled connection came free within {self.timeout}s; all {self.maxconn} are in use (PG_POOL_SIZE)')
+		try:
+			return super().getconn(key)
+		except BaseException:
+			self._slots.release()
+			raise
+
+	def putconn(self, conn=None, key=None, close=False):
+		super().putconn(conn, key, close)
+		self._slots.release()
+
+
+def get_pool():
+	global _pool
+	with _pool_lock:
+		if _pool is None or _pool.closed:
+			size = int(os.getenv('PG_POOL_SIZE', DEFAULT_POOL_SIZE))
+			timeout = float(os.getenv('PG_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT))
+			_pool = _retrying(
+				lambda: BlockingPool(1, size, timeout=timeout, connection_factory=Connection, **get_db_config()),
+				'Connecting to PostgreSQL',
+			)
+		return _pool
+
+
+def close_pool():
+	global _pool
+	with _pool_lock:
+		if _pool is not None and not _pool.closed:
+			_pool.closeall()
+		_pool = None
+
+
+def _checkout(pool):
+	conn = pool.getconn()
+	try:
+		# a pooled connection may have died while idle; probe it before handing it out
+		cur = conn.cursor()
+		cur.execute('SELECT 1')
+		cur.close()
+		conn.rollback()
+	except psycopg2.Error:
+		pool.putconn(conn, close=True)
+		raise psycopg2.OperationalError('pooled connection was closed by the server')
+	return conn
+
+
+@contextmanager
+def connection(stage=None, timeout=None):
+	"""Borrow a pooled connection with the stage's statement timeout applied.
+
+	Any open transaction is rolled back (and broken connections discarded) when
+	the block exits, so the next borrower always starts clean."""
+	pool = get_pool()
+	conn = _retrying(lambda: _checkout(pool), 'Checking out a DB connection')
+	timeout = timeout if timeout is not None else stage_timeout(stage)
+	try:
+		if timeout is not None:
+			_set_timeout(conn, timeout)
+		yield conn
+	finally:
+		discard = bool(conn.closed)
+		if not discard:
+			try:
+				conn.rollback()
+				if timeout is not None:
+					_set_timeout(conn, None)
+			except psycopg2.Error:
+				discard = True
+		pool.putconn(conn, close=discard)
+
+
+def run_with_retry(fn, stage=None, attempts=RETRY_ATTEMPTS):
+	"""Run `fn(conn)` on a pooled connection, retrying on transient errors.
+
+	`fn` must be safe to repeat (it is re-run from the start in a new transaction)."""
+	def _attempt():
+		with connection(stage) as conn:
+			return fn(conn)
+	return _retrying(_attempt, f'{stage or "DB"} stage', attempts=attempts)
+
+
+def prepare(conn, name, statement):
+	"""PREPARE `statement` (written with $1, $2, ... placeholders) once per connection."""
+	if name in conn.prepared:
+		return
+	cur = conn.cursor()
+	cur.execute(f'PREPARE {name} AS {statement}')
+	cur.close()
+	conn.prepared.add(name)
+
+
+def execute_prepared(cur, name, params):
+	cur.execute(f'EXECUTE {name} ({", ".join(["%s"] * len(params))})', params)
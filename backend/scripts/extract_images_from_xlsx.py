@@ -2,168 +2,119 @@
 Extract embedded images from an XLSX file and save them to disk.
 
 Usage:
-  python extract_images_from_xlsx.py --xlsx path/to/file.xlsx [--sheet Sheet1] [--id-header id]
+  python extract_images_from_xlsx.py --xlsx path/to/file.xlsx [--sheet Sheet1] [--id-header id] [--workers 8]
 
 The script expects the first row of the sheet to be headers. It will locate the column whose header matches
 `--id-header` (default: 'id') and use that cell in the same row as the image anchor to determine which product
 the image belongs to.
 
-It saves images to: public/uploads/products/<product_id>/ and prints a summary.
-Optionally you can pass --update-db to write the first found image paths back into the `lego_products` table
-(`pictures`, `pictures_1`, ... up to 5 slots). The script uses psycopg2 and requires DB env vars or the constants
-in this script (you can update them).
+It saves images to: public/uploads/products/<product_id>/ and prints a summary. The images are read straight
+from the xlsx zip and copied byte for byte in their original format (see xlsx_media.py); the workbook cells
+are only streamed once to map rows to ids. With --workers N the copies run on N threads behind a bounded queue. Files are named by content hash and
+backed by a shared `_blobs/` store, so re-running on the same spreadsheet writes nothing new.
+Optionally you can pass --update-db to write the image paths back into the `product_images` table and the first
+five into the `lego_products` table (`pictures`, `pictures_1`, ... up to 5 slots). DB settings come from the PG_* environment variables (or the
+repository .env) through the shared pool in db.py.
 
 Dependencies:
-  pip install openpyxl pillow psycopg2-binary
+  pip install openpyxl pandas psycopg2-binary
 
 """
-import os
-import io
-import uuid
 import argparse
 from pathlib import Path
 
 try:
-    from openpyxl import load_workbook
+    from workbook_stream import WorkbookStream
 except ImportError:
     raise SystemExit("Please install openpyxl: pip install openpyxl")
 
-try:
-    from PIL import Image
-except ImportError:
-    raise SystemExit("Please install Pillow: pip install pillow")
-
-try:
-    import psycopg2
-except ImportError:
-    psycopg2 = None
-
 import pandas as pd
-from psycopg2 import sql
 
-# DB config (update or let environment variables override)
-DB_CONFIG = {
-    'host': os.environ.get('PG_HOST', 'localhost'),
-    'port': os.environ.get('PG_PORT', '5432'),
-    'database': os.environ.get('PG_DATABASE', 'lego_store'),
-    'user': os.environ.get('PG_USER', 'postgres'),
-    'password': os.environ.get('PG_PASSWORD', 'your_password'),
-}
+from column_mapping import ColumnMapping
+from db import close_pool, connection, execute_prepared, prepare
+from image_store import DEFAULT_WORKERS, map_bounded, store_image_stream
+from product_images import sync_from_columns, sync_product_images
+from schema import ensure_schema
+from xlsx_media import SheetMedia
+
+# Hot per-row statements, PREPAREd once per pooled connection
+UPDATE_PICTURES = """
+    UPDATE lego_products SET pictures=$1, pictures_1=$2, pictures_2=$3, pictures_3=$4, pictures_4=$5
+    WHERE id=$6 AND (pictures, pictures_1, pictures_2, pictures_3, pictures_4) IS DISTINCT FROM ($1, $2, $3, $4, $5)
+"""
+INSERT_PRODUCT = """
+    INSERT INTO lego_products (
+        name, pictures, pictures_1, pictures_2, pictures_3, pictures_4,
+        description, price_shipping_included, lego_pieces, price
+    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+    RETURNING id
+"""
 
 OUT_BASE = Path(__file__).resolve().parents[2] / 'public' / 'uploads' / 'products'
-OUT_BASE.mkdir(parents=True, exist_ok=True)
-
-
-def _get_image_bytes(img_obj):
-    """Return image bytes (PNG) for an openpyxl Image object."""
-    # openpyxl image objects may have ._data() that returns bytes OR .image (PIL Image)
-    data = None
-    if hasattr(img_obj, '_data'):
-        try:
-            data = img_obj._data()
-        except Exception:
-            data = None
-    if data:
-        return data
-
-    if hasattr(img_obj, 'image') and img_obj.image is not None:
-        pil = img_obj.image
-        bio = io.BytesIO()
-        pil.save(bio, format='PNG')
-        return bio.getvalue()
-
-    # Fallback: try to access .ref or .path (unlikely for embedded)
-    if hasattr(img_obj, 'path') and img_obj.path:
-        with open(img_obj.path, 'rb') as f:
-            return f.read()
-
-    raise RuntimeError('Could not extract image bytes from openpyxl image object')
-
-
-def extract_images(xlsx_path, sheet_name=None, id_header='id', update_db=False):
-    wb = load_workbook(xlsx_path, data_only=True)
-    ws = wb[sheet_name] if sheet_name else wb.active
-
-    # Find header row (assume first row)
-    headers = [cell.value for cell in ws[1]]
-    if id_header not in headers:
-        raise SystemExit(f"Header '{id_header}' not found in sheet headers: {headers}")
-    id_col_idx = headers.index(id_header) + 1  # openpyxl is 1-indexed for columns
-
-    images = list(getattr(ws, '_images', []))
-    if not images:
-        print('No embedded images found in sheet')
-        return
-
-    mapping = {}  # product_id -> list of saved paths
-
-    for img in images:
-        # Determine anchor row. Different openpyxl versions expose anchor differently.
-        row = None
-        try:
-            # Many anchors expose .anchor._from.row (0-based)
-            row = getattr(img.anchor, '_from').row + 1
-        except Exception:
-            # Try parsing anchor as a string like 'A5'
-            try:
-                coord = img.anchor._from
-                row = coord.row + 1
-            except Exception:
-                # Last resort: try img.anchor._from.row
-                try:
-                    row = img.anchor.row
-                except Exception:
-                    print('Could not determine anchor row for an image; skipping')
-                    continue
-
-        # Read product id from the id column at that row
-        product_id = ws.cell(row=row, column=id_col_idx).value
-        if not product_id:
-            print(f'Row {row} has no value in id column; skipping image')
-            continue
-
-        # Build output dir
-        dest_dir = OUT_BASE / str(product_id)
-        dest_dir.mkdir(parents=True, exist_ok=True)
-
-        # Extract image bytes
-        try:
-            img_bytes = _get_image_bytes(img)
-        except Exception as e:
-            print('Failed to get image bytes for row', row, 'error:', e)
-            continue
-
-        # Save as PNG with uuid
-        filename = f"{uuid.uuid4().hex}.png"
-        out_path = dest_dir / filename
-        with open(out_path, 'wb') as f:
-            f.write(img_bytes)
-
-        rel_url = f"/uploads/products/{product_id}/{filename}"
-        mapping.setdefault(product_id, []).append(rel_url)
-        print(f'Saved image for product {product_id} -> {rel_url}')
+
+
+def extract_images(xlsx_path, sheet_name=None, id_header='id', update_db=False, workers=DEFAULT_WORKERS):
+    # Product ids come from a read-only pass over the cells; the pictures straight from the zip
+    with WorkbookStream(xlsx_path, sheet_name=sheet_name, id_header=id_header) as stream:
+        if stream.id_header not in stream.headers:
+            raise SystemExit(f"Header '{id_header}' not found in sheet headers: {stream.headers}")
+        sheet_title = stream.sheet_title
+        stream.drain()
+        row_ids = stream.row_ids
+
+    saved = {}
+    jobs = []  # (row, product_id, media ref) in sheet order
+    with SheetMedia(xlsx_path, sheet_title) as media:
+        for ref in media:
+            if ref.row is None:
+                print('Could not determine anchor row for an image; skipping')
+                continue
+            product_id = row_ids.get(ref.row)
+            if not product_id:
+                print(f'Row {ref.row} has no value in id column; skipping image')
+                continue
+            jobs.append((ref.row, product_id, ref))
+        if not jobs:
+            print('No embedded images found in sheet')
+            return
+
+        def save_image(job):
+            row, product_id, ref = job
+            # Copy the embedded bytes as they are (no re-encoding) and store them by content hash
+            with media.open(ref) as src:
+                rel_url, _written, _size = store_image_stream(src, product_id, OUT_BASE, ext=ref.ext)
+            return rel_url
+
+        for idx, rel_url, err in map_bounded(save_image, jobs, workers=workers):
+            row, product_id, _ = jobs[idx]
+            if err is not None:
+                print('Failed to get image bytes for row', row, 'error:', err)
+                continue
+            saved[idx] = rel_url
+            print(f'Saved image for product {product_id} -> {rel_url}')
+
+    mapping = {}  # product_id -> list of saved paths, in sheet order
+    for idx in sorted(saved):
+        urls = mapping.setdefault(jobs[idx][1], [])
+        if saved[idx] not in urls:
+            urls.append(saved[idx])
 
     # Optionally update DB: write up to 5 images into pictures..pictures_4
     if update_db:
-        if psycopg2 is None:
-            raise SystemExit('psycopg2 is required to update the DB (pip install psycopg2-binary)')
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        for pid, urls in mapping.items():
-            fields = [None] * 5
-            for i in range(min(5, len(urls))):
-                fields[i] = urls[i]
-            cur.execute(
-                """
-                UPDATE lego_products SET pictures=%s, pictures_1=%s, pictures_2=%s, pictures_3=%s, pictures_4=%s
-                WHERE id=%s
-                """,
-                (*fields, pid)
-            )
-            print(f'Updated DB product {pid} with {len(urls)} image(s)')
-        conn.commit()
-        cur.close()
-        conn.close()
+        with connection('images') as conn:
+            ensure_schema(conn)
+            prepare(conn, 'update_product_pictures', UPDATE_PICTURES)
+            cur = conn.cursor()
+            for pid, urls in mapping.items():
+                fields = [None] * 5
+                for i in range(min(5, len(urls))):
+                    fields[i] = urls[i]
+                execute_prepared(cur, 'update_product_pictures', (*fields, str(pid)))
+                print(f'Updated DB product {pid} with {len(urls)} image(s)')
+            # every image (not just the first five) goes to product_images in one bulk write
+            sync_product_images(cur, {str(pid): urls for pid, urls in mapping.items()})
+            conn.commit()
+            cur.close()
 
     print('\nSummary:')
     for pid, urls in mapping.items():
@@ -174,17 +125,17 @@ def extract_images(xlsx_path, sheet_name=None, id_header='id', update_db=False):
 def extract_data_from_excel(xlsx_path):
     df = pd.read_excel(xlsx_path)
 
-    # Clean up column names (remove spaces/newlines)
+    # Clean up column names (remove spaces/newlines); index rows by their sheet row number
     df.columns = [col.strip().replace(" ", "_").replace("\n", "_") for col in df.columns]
+    df.index = df.index + 2
+
+    # === Step 2: Connect to PostgreSQL (shared pool, see db.py) ===
+    with connection('ingest') as conn:
+        _insert_rows(conn, df)
 
-    # === Step 2: Connect to PostgreSQL ===
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        print("Connected to PostgreSQL successfully.")
-    except Exception as e:
-        print("Database connection failed:", e)
-        exit()
+
+def _insert_rows(conn, df):
+    cursor = conn.cursor()
 
     # === Step 3: Create table (if not exists) ===
     create_table_query = """
@@ -203,36 +154,30 @@ def extract_data_from_excel(xlsx_path):
     """
     cursor.execute(create_table_query)
     conn.commit()
+    ensure_schema(conn)
     print("lego_products table is ready.")
 
-    # === Step 4: Insert data ===
-    insert_query = sql.SQL("""
-        INSERT INTO lego_products (
-            name, pictures, pictures_1, pictures_2, pictures_3, pictures_4,
-            description, price_shipping_included, lego_pieces
-        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s);
-    """)
-
-    for _, row in df.iterrows():
-        cursor.execute(insert_query, (
-            row.get("Name"),
-            row.get("pictures"),
-            row.get("pictures.1"),
-            row.get("pictures.2"),
-            row.get("pictures.3"),
-            row.get("pictures.4"),
-            row.get("description"),
-            row.get("price+shipping_included"),
-            int(row.get("lego_pieces")) if not pd.isna(row.get("lego_pieces")) else None
-        ))
+    # === Step 4: Map, coerce and validate the columns for the whole sheet at once ===
+    batch = ColumnMapping(df.columns).apply(df)
+    for rejected in batch.rejected.itertuples(index=False):
+        print(f"Row {rejected.row} rejected: {rejected.column} {rejected.value!r} is {rejected.reason}")
+
+    # === Step 5: Insert data ===
+    prepare(conn, 'insert_product', INSERT_PRODUCT)
+
+    inserted = []
+    for row in batch.tuples():
+        # the table assigns the id; the rest is in INSERT_PRODUCT order
+        execute_prepared(cursor, 'insert_product', row[1:])
+        inserted.append(cursor.fetchone()[0])
+    # the new products' picture columns go to product_images in the same transaction
+    sync_from_columns(cursor, inserted)
 
     conn.commit()
-    print(f"Inserted {len(df)} rows into lego_products table.")
+    print(f"Inserted {len(batch)} rows into lego_products table ({len(batch.rejected)} rejected).")
 
-    # === Step 5: Close connection ===
+    # === Step 6: Release the cursor (the connection goes back to the pool) ===
     cursor.close()
-    conn.close()
-    print("PostgreSQL connection closed successfully.")
 
 
 if __name__ == '__main__':
@@ -241,10 +186,14 @@ if __name__ == '__main__':
     p.add_argument('--sheet', help='Optional sheet name (defaults to active)')
     p.add_argument('--id-header', default='id', help='Name of header column that holds product id (default: id)')
     p.add_argument('--update-db', action='store_true', help='Update postgres lego_products table to reference saved images')
+    p.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Threads used to extract and write images (default: 1)')
     args = p.parse_args()
 
-    # Extract data from Excel
-    extract_data_from_excel(args.xlsx)
+    try:
+        # Extract data from Excel
+        extract_data_from_excel(args.xlsx)
 
-    # Existing image extraction logic
-    extract_images(args.xlsx, sheet_name=args.sheet, id_header=args.id_header, update_db=args.update_db)
+        # Existing image extraction logic
+        extract_images(args.xlsx, sheet_name=args.sheet, id_header=args.id_header, update_db=args.update_db, workers=args.workers)
+    finally:
+        close_pool()
@@ -0,0 +1,320 @@
+"""
+folder_images.py
+
+Match image folders under `public/uploads/products/<product name>/` to rows in
+`lego_products` and write their URLs into the picture columns.
+
+The candidate products for the scanned folders are fetched with one query
+through the `lower(name)` index into an in-memory index (exact name first, then
+a case-folded fallback, mirroring the old `name = %s` / `ILIKE` lookups), every
+folder is resolved locally, and the picture updates are applied with a single
+`UPDATE ... FROM (VALUES ...)` statement plus one bulk `product_images` write
+in one transaction. The same query reads each candidate's current picture
+columns and `product_images` URLs, so the sync plan (see `sync_plan.py`) drops
+products whose pictures are already correct before any statement is sent.
+
+Incremental scans: a manifest (`.scan-manifest.json` in the uploads directory;
+dotfiles are not served by express.static) records each matched folder's mtime,
+file list and a hash of it, plus the product it matched and the `row_hash` of
+the pictures that product got. Later scans only list folders whose mtime moved
+and only re-process those whose file list actually changed; folders that matched
+no product, and folders whose product no longer holds those pictures (deleted
+and re-created by an import, or edited elsewhere), are retried every time.
+`watch_folder_images` keeps doing this in a loop, woken by filesystem events
+when `watchdog` is installed and by polling otherwise.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from image_store import BLOB_DIRNAME
+from product_images import PICTURE_COLUMNS, sync_product_images
+from sync_plan import SyncPlan, row_hash
+
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.webp', '.gif'}
+PICTURE_SLOTS = 5
+MANIFEST_NAME = '.scan-manifest.json'
+DEFAULT_WATCH_INTERVAL = 30.0
+
+UPDATE_PICTURES_BATCH = """
+	UPDATE lego_products AS p SET
+		pictures = v.pictures, pictures_1 = v.pictures_1, pictures_2 = v.pictures_2,
+		pictures_3 = v.pictures_3, pictures_4 = v.pictures_4
+	FROM (VALUES %s) AS v(id, pictures, pictures_1, pictures_2, pictures_3, pictures_4)
+	WHERE p.id = v.id
+	  AND (p.pictures, p.pictures_1, p.pictures_2, p.pictures_3, p.pictures_4)
+	      IS DISTINCT FROM (v.pictures, v.pictures_1, v.pictures_2, v.pictures_3, v.pictures_4)
+	RETURNING p.id
+"""
+_VALUES_TEMPLATE = '(%s, %s::text, %s::text, %s::text, %s::text, %s::text)'
+
+
+def picture_slots(urls):
+	pics = [None] * PICTURE_SLOTS
+	for i in range(min(PICTURE_SLOTS, len(urls))):
+		pics[i] = urls[i]
+	return pics
+
+
+def picture_values(urls):
+	"""What a product's picture columns and product_images hold once it has `urls`."""
+	return [*picture_slots(urls), *urls]
+
+
+def folder_urls(folder):
+	files = [p for p in sorted(folder.iterdir()) if p.is_file() and p.suffix.lower() in IMAGE_EXTS]
+	return [f"/uploads/products/{folder.name}/{p.name}" for p in files]
+
+
+_INDEX_QUERY = f"""
+	SELECT p.id, p.name, {', '.join('p.' + c for c in PICTURE_COLUMNS)},
+		ARRAY(SELECT i.url FROM product_images i WHERE i.product_id = p.id ORDER BY i.position)
+	FROM lego_products p
+"""
+
+
+class NameIndex:
+	"""In-memory `name -> (id, name)` lookup built from one SELECT.
+
+	`pictures` maps each loaded id to the `row_hash` of its current picture
+	columns and image URLs, the state the folder sync plan diffs against."""
+
+	def __init__(self, rows):
+		self.exact = {}
+		self.folded = {}
+		self.pictures = {}
+		for product_id, name, *pictures in rows:
+			if pictures:
+				columns, images = pictures[:-1], pictures[-1]
+				self.pictures[product_id] = row_hash([*columns, *images])
+			if name is None:
+				continue
+			self.exact.setdefault(name, (product_id, name))
+			self.folded.setdefault(name.casefold(), (product_id, name))
+
+	@classmethod
+	def load(cls, cur, names=None):
+		"""Load every product, or with `names` only those whose lowercased name matches one."""
+		if names is None:
+			cur.execute(_INDEX_QUERY + ' ORDER BY p.id')
+		else:
+			cur.execute(
+				_INDEX_QUERY + ' WHERE lower(p.name) = ANY(%s) ORDER BY p.id',
+				([n.lower() for n in names],),
+			)
+		return cls(cur.fetchall())
+
+	def resolve(self, folder_name):
+		return self.exact.get(folder_name) or self.folded.get(folder_name.casefold())
+
+
+def plan_updates(folders, index):
+	"""Resolve folders against `index`; returns `(updates, unmatched)`.
+
+	`updates` maps product id -> (product name, urls); when several folders resolve
+	to the same product the last one in sorted order wins, as it did before."""
+	updates = {}
+	unmatched = []
+	for folder_name, urls in folders:
+		match = index.resolve(folder_name)
+		if match is None:
+			unmatched.append(folder_name)
+			continue
+		product_id, name = match
+		updates[product_id] = (name, urls)
+	return updates, unmatched
+
+
+def apply_picture_updates(cur, updates):
+	"""Write `{product_id: urls}` into product_images (every url) and the legacy
+	picture columns (the first five), one statement each.
+
+	Returns the ids of the products whose images actually changed."""
+	if not updates:
+		return []
+	values = [(pid, *picture_slots(urls)) for pid, urls in updates.items()]
+	rows = execute_values(cur, UPDATE_PICTURES_BATCH, values, template=_VALUES_TEMPLATE, page_size=len(values), fetch=True)
+	changed = [r[0] for r in rows]
+	seen = set(changed)
+	changed.extend(pid for pid in sync_product_images(cur, updates) if pid not in seen)
+	return changed
+
+
+def _files_hash(urls):
+	return hashlib.sha256('\n'.join(urls).encode('utf-8')).hexdigest()
+
+
+def load_manifest(path):
+	if path is None or not path.exists():
+		return {}
+	try:
+		with open(path, encoding='utf-8') as f:
+			return json.load(f).get('folders', {})
+	except (OSError, ValueError):
+		print(f'Ignoring unreadable scan manifest {path}')
+		return {}
+
+
+def save_manifest(path, folders):
+	tmp = path.with_name(path.name + '.tmp')
+	with open(tmp, 'w', encoding='utf-8') as f:
+		json.dump({'version': 1, 'folders': folders}, f, indent=1, sort_keys=True)
+	os.replace(tmp, path)
+
+
+def forget_stale_matches(cur, manifest):
+	"""Drop the product of every manifest entry whose pictures in the DB are no longer
+	the ones the scan wrote (product deleted, re-created or edited); returns the count.
+
+	Those folders then count as unmatched, so the next scan resolves them again."""
+	ids = sorted({entry['product_id'] for entry in manifest.values() if entry.get('product_id')})
+	if not ids:
+		return 0
+	cur.execute(_INDEX_QUERY + ' WHERE p.id = ANY(%s)', (ids,))
+	current = NameIndex(cur.fetchall()).pictures
+	stale = 0
+	for entry in manifest.values():
+		product_id = entry.get('product_id')
+		if product_id and current.get(product_id) != entry.get('pictures'):
+			del entry['product_id']
+			stale += 1
+	return stale
+
+
+def scan_changed_folders(upload_base, manifest):
+	"""Return `(changed, seen)` where `changed` is `[(folder_name, urls, stamp)]` for
+	folders that are new, modified or previously unmatched, and `seen` is the set of
+	folder names currently on disk."""
+	changed = []
+	seen = set()
+	for folder in sorted(upload_base.iterdir()):
+		if not folder.is_dir() or folder.name == BLOB_DIRNAME:
+			continue
+		seen.add(folder.name)
+		mtime_ns = folder.stat().st_mtime_ns
+		entry = manifest.get(folder.name)
+		if entry and entry.get('product_id') and entry.get('mtime_ns') == mtime_ns:
+			continue
+		urls = folder_urls(folder)
+		if not urls:
+			continue
+		digest = _files_hash(urls)
+		stamp = {'mtime_ns': mtime_ns, 'files': [u.rsplit('/', 1)[1] for u in urls], 'hash': digest}
+		if entry and entry.get('product_id') and entry.get('hash') == digest:
+			# touched but same file list (e.g. a temp file came and went); just refresh the stamp
+			entry['mtime_ns'] = mtime_ns
+			continue
+		changed.append((folder.name, urls, stamp))
+	return changed, seen
+
+
+def sync_folder_images(conn, upload_base, dry_run=False, manifest_path=None, full=False):
+	"""Scan `upload_base`, resolve folders to products and update their pictures.
+
+	With `manifest_path` only folders changed since the last recorded scan are
+	processed (`full=True` ignores the recorded state), plus those whose product
+	no longer holds the pictures recorded for it. Returns
+	`(changed_ids, updates, unmatched)`."""
+	manifest = {} if full else load_manifest(manifest_path)
+	if manifest:
+		cur = conn.cursor()
+		try:
+			forget_stale_matches(cur, manifest)
+			conn.rollback()
+		finally:
+			cur.close()
+	changed_folders, seen = scan_changed_folders(upload_base, manifest)
+	for name in set(manifest) - seen:
+		del manifest[name]
+	updates, unmatched, changed = {}, [], []
+	if changed_folders:
+		cur = conn.cursor()
+		try:
+			index = NameIndex.load(cur, [name for name, _urls, _stamp in changed_folders])
+			updates, unmatched = plan_updates([(name, urls) for name, urls, _ in changed_folders], index)
+			for folder_name in unmatched:
+				print(f'No product matched folder "{folder_name}", skipping')
+			plan = SyncPlan(index.pictures)
+			pending = {pid: urls for pid, (_name, urls) in updates.items() if plan.plan(pid, picture_values(urls))}
+			if dry_run:
+				for pid, urls in pending.items():
+					print(f'[dry-run] Would update product id={pid} name={updates[pid][0]} with {len(urls)} images')
+				print(f'[dry-run] Sync plan: {plan.summary()}')
+				conn.rollback()
+				return [], updates, unmatched
+			changed = apply_picture_updates(cur, pending)
+			conn.commit()
+		finally:
+			cur.close()
+	if manifest_path is not None and not dry_run:
+		unmatched_names = set(unmatched)
+		for name, urls, stamp in changed_folders:
+			if name in unmatched_names:
+				manifest.pop(name, None)
+				continue
+			product_id = index.resolve(name)[0]
+			# what the product holds now; with several folders per product, the last folder's images
+			manifest[name] = dict(stamp, product_id=product_id, pictures=row_hash(picture_values(updates[product_id][1])))
+		save_manifest(manifest_path, manifest)
+	return changed, updates, unmatched
+
+
+def _start_observer(upload_base, wake):
+	"""Wake the watch loop on filesystem events if `watchdog` is available."""
+	try:
+		from watchdog.events import FileSystemEventHandler
+		from watchdog.observers import Observer
+	except ImportError:
+		return None
+
+	class _Handler(FileSystemEventHandler):
+		def on_any_event(self, event):
+			if not str(getattr(event, 'src_path', '')).endswith(MANIFEST_NAME):
+				wake.set()
+
+	observer = Observer()
+	observer.schedule(_Handler(), str(upload_base), recursive=True)
+	observer.start()
+	return observer
+
+
+def watch_folder_images(connect, upload_base, interval=DEFAULT_WATCH_INTERVAL, manifest_path=None, settle=1.0):
+	"""Keep the DB in sync with `upload_base` until interrupted.
+
+	`connect` returns a new DB connection; it is reopened after connection errors."""
+	manifest_path = manifest_path or upload_base / MANIFEST_NAME
+	wake = threading.Event()
+	observer = _start_observer(upload_base, wake)
+	print(f'Watching {upload_base} ({"filesystem events" if observer else f"polling every {interval:.0f}s"}); Ctrl+C to stop')
+	conn = None
+	try:
+		while True:
+			try:
+				if conn is None or conn.closed:
+					conn = connect()
+				changed, updates, _unmatched = sync_folder_images(conn, upload_base, manifest_path=manifest_path)
+				if updates:
+					print(f'Synced {len(updates)} changed folder(s); {len(changed)} product(s) updated')
+			except Exception as e:
+				print(f'Folder sync failed, retrying next cycle: {e}')
+				if conn is not None:
+					conn.close()
+				conn = None
+			wake.wait(interval)
+			if wake.is_set():
+				# let a burst of writes (a whole folder being copied in) finish first
+				time.sleep(settle)
+				wake.clear()
+	except KeyboardInterrupt:
+		print('Stopped watching')
+	finally:
+		if observer is not None:
+			observer.stop()
+			observer.join()
+		if conn is not None:
+			conn.close()
@@ -0,0 +1,157 @@
+"""
+image_store.py
+
+Helpers shared by the scripts that write product images under
+`public/uploads/products/`.
+
+`map_bounded` runs the per-image work (streaming the bytes out of the
+workbook, creating folders and writing files) on a thread pool. Items are
+pulled from the input lazily and at most `max_pending` of them are in flight at
+once, so a catalog with thousands of embedded images never queues all of their
+bytes in memory.
+
+`store_image_stream` keeps images content-addressed: the bytes of a file object
+(e.g. a media part read straight from the xlsx zip, see `xlsx_media.py`) are
+copied to disk in chunks while they are hashed, written once to a shared blob
+directory (`_blobs/<xx>/<hash><ext>`), and each product folder gets a hard link
+(or a copy where links are unsupported) named after the same hash. The bytes
+are kept exactly as they came, and the extension is taken from them when they
+are a known image format, else from the name they came under. Re-importing a
+spreadsheet therefore rewrites nothing for unchanged images and every URL
+stays stable, so it can be cached forever.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_WORKERS = 1
+COPY_CHUNK_SIZE = 1 << 16
+BLOB_DIRNAME = '_blobs'
+# hex digits of the sha256 used in file names (same length as the old uuid4 names)
+HASH_NAME_LEN = 32
+
+_MAGIC = (
+	(b'\x89PNG\r\n\x1a\n', '.png'),
+	(b'\xff\xd8\xff', '.jpg'),
+	(b'GIF87a', '.gif'),
+	(b'GIF89a', '.gif'),
+	(b'BM', '.bmp'),
+	(b'II*\x00', '.tif'),
+	(b'MM\x00*', '.tif'),
+)
+
+
+def map_bounded(fn, items, workers=DEFAULT_WORKERS, max_pending=None):
+	"""Apply `fn` to every item and yield `(index, result, error)` in completion order.
+
+	`error` is the exception raised by `fn` (and `result` is None) so callers can
+	report and skip bad images the way the sequential loops always did. With
+	`workers <= 1` everything runs inline on the calling thread."""
+	if workers <= 1:
+		for idx, item in enumerate(items):
+			try:
+				yield idx, fn(item), None
+			except Exception as e:
+				yield idx, None, e
+		return
+	max_pending = max_pending or workers * 4
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		pending = {}
+
+		def _collect(done):
+			for fut in done:
+				idx = pending.pop(fut)
+				err = fut.exception()
+				yield idx, (None if err else fut.result()), err
+
+		for idx, item in enumerate(items):
+			if len(pending) >= max_pending:
+				done, _ = wait(pending, return_when=FIRST_COMPLETED)
+				yield from _collect(done)
+			pending[pool.submit(fn, item)] = idx
+		while pending:
+			done, _ = wait(pending, return_when=FIRST_COMPLETED)
+			yield from _collect(done)
+
+
+def sniff_extension(data, default='.bin'):
+	"""Guess a file extension from the leading bytes of an image (`default` if unknown)."""
+	for magic, ext in _MAGIC:
+		if data.startswith(magic):
+			return ext
+	if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+		return '.webp'
+	return default
+
+
+def link_or_copy(src, dest):
+	dest.parent.mkdir(parents=True, exist_ok=True)
+	try:
+		os.link(src, dest)
+	except FileExistsError:
+		pass
+	except OSError:
+		# no hard links (other device / filesystem); fall back to a private copy
+		fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix='.tmp-')
+		os.close(fd)
+		try:
+			shutil.copyfile(src, tmp)
+			os.replace(tmp, dest)
+		except BaseException:
+			if os.path.exists(tmp):
+				os.unlink(tmp)
+			raise
+
+
+def blob_path(upload_base, digest, ext):
+	return upload_base / BLOB_DIRNAME / digest[:2] / f'{digest[:HASH_NAME_LEN]}{ext}'
+
+
+def store_image_stream(src, product_id, upload_base, dry_run=False, ext=None, chunk_size=COPY_CHUNK_SIZE):
+	"""Store the bytes of the binary file object `src` for `product_id`; returns `(rel_url, written, size)`.
+
+	`written` is False when the bytes were already in the blob store and the
+	product already referenced them, i.e. the call changed nothing on disk.
+	`ext` (e.g. the suffix of the zip part) names formats the leading bytes do
+	not identify, such as EMF or SVG. The bytes are hashed while they are copied
+	to a temporary file next to the blobs, which then becomes the blob, so the
+	image is never held in memory whole."""
+	blob_dir = upload_base / BLOB_DIRNAME
+	tmp = None
+	if not dry_run:
+		blob_dir.mkdir(parents=True, exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=blob_dir, prefix='.tmp-')
+	try:
+		h = hashlib.sha256()
+		head = b''
+		size = 0
+		with (os.fdopen(fd, 'wb') if tmp else nullcontext()) as out:
+			for chunk in iter(lambda: src.read(chunk_size), b''):
+				if len(head) < 16:
+					head += chunk[:16 - len(head)]
+				h.update(chunk)
+				size += len(chunk)
+				if out is not None:
+					out.write(chunk)
+		digest = h.hexdigest()
+		blob = blob_path(upload_base, digest, sniff_extension(head, default=ext or '.bin'))
+		ref = upload_base / str(product_id) / blob.name
+		rel_url = f'/uploads/products/{product_id}/{blob.name}'
+		if ref.exists():
+			return rel_url, False, size
+		if dry_run:
+			print(f'[dry-run] would write image to {ref}')
+			return rel_url, True, size
+		if not blob.exists():
+			blob.parent.mkdir(parents=True, exist_ok=True)
+			os.replace(tmp, blob)
+			tmp = None
+		link_or_copy(blob, ref)
+		return rel_url, True, size
+	finally:
+		if tmp is not None and os.path.exists(tmp):
+			os.unlink(tmp)
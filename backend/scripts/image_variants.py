@@ -0,0 +1,182 @@
+"""
+image_variants.py
+
+Generate resized, web-friendly variants of product images.
+
+The storefront used to serve the raw embedded PNGs from `/uploads/products/`.
+For every source image this writes downscaled copies (by default 280px wide for
+product cards and 800px for the detail page) as WebP, and optionally AVIF,
+next to the original:
+
+  public/uploads/products/<id>/<name>.png
+  public/uploads/products/<id>/_variants/<stem>_280w.webp
+  public/uploads/products/<id>/_variants/<stem>_800w.webp
+
+so a variant URL can be derived from a picture URL without a lookup. Decoding
+and encoding run on a process pool. Variants that already exist are skipped,
+and because a content-addressed image is named after the hash of its bytes, an
+image shared by several products is encoded once and hard-linked into the other
+product folders. Any other file (e.g. a `front.png` dropped into a folder by
+hand) is encoded on its own.
+
+Usage (regenerate variants for everything already under uploads):
+  python backend/scripts/image_variants.py [--widths 280,800] [--avif] [--workers 4]
+"""
+
+import argparse
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+	from PIL import Image
+except ImportError:
+	raise SystemExit('Please install Pillow: pip install pillow')
+
+from image_store import BLOB_DIRNAME, HASH_NAME_LEN, link_or_copy
+
+VARIANT_DIRNAME = '_variants'
+DEFAULT_WIDTHS = (280, 800)
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.webp', '.gif'}
+_SAVE_OPTIONS = {
+	'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+	'avif': {'format': 'AVIF', 'quality': 60},
+}
+
+_HASH_STEM = re.compile(f'[0-9a-f]{{{HASH_NAME_LEN}}}')
+
+UPLOAD_BASE = Path(__file__).resolve().parents[2] / 'public' / 'uploads' / 'products'
+
+
+def avif_supported():
+	try:
+		import pillow_avif  # noqa: F401  (registers the AVIF plugin on older Pillow)
+	except ImportError:
+		pass
+	from PIL import features
+	try:
+		return bool(features.check('avif'))
+	except ValueError:
+		return '.avif' in Image.registered_extensions()
+
+
+def variant_path(source, width, fmt):
+	source = Path(source)
+	return source.parent / VARIANT_DIRNAME / f'{source.stem}_{width}w.{fmt}'
+
+
+def _content_key(source):
+	"""Grouping key for `source`: its name when that is a content hash, else its path."""
+	if _HASH_STEM.fullmatch(source.stem):
+		return source.name
+	return str(source.resolve())
+
+
+def _render(job):
+	"""Decode one source image and write all of its missing variants (runs in a worker process)."""
+	src, outputs = job
+	written = 0
+	with Image.open(src) as im:
+		im.load()
+		if im.mode not in ('RGB', 'RGBA'):
+			im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA', 'P') else 'RGB')
+		for width, fmt, dest in outputs:
+			out = im
+			if im.width > width:
+				out = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+			dest = Path(dest)
+			dest.parent.mkdir(parents=True, exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix='.tmp-')
+			os.close(fd)
+			try:
+				out.save(tmp, **_SAVE_OPTIONS[fmt])
+				os.replace(tmp, dest)
+			except BaseException:
+				if os.path.exists(tmp):
+					os.unlink(tmp)
+				raise
+			written += 1
+	return written
+
+
+def generate_variants(sources, widths=DEFAULT_WIDTHS, formats=('webp',), workers=None):
+	"""Create the missing variants for `sources` (paths to original images).
+
+	Returns `(created, skipped)` counts of variant files."""
+	groups = {}
+	for src in sources:
+		src = Path(src)
+		groups.setdefault(_content_key(src), []).append(src)
+	jobs = []
+	skipped = 0
+	for paths in groups.values():
+		primary = paths[0]
+		outputs = []
+		for width in widths:
+			for fmt in formats:
+				dest = variant_path(primary, width, fmt)
+				if dest.exists():
+					skipped += 1
+				else:
+					outputs.append((width, fmt, str(dest)))
+		if outputs:
+			jobs.append((str(primary), outputs))
+	created = 0
+	if jobs:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			for result in pool.map(_render, jobs, chunksize=4):
+				created += result
+	# identical images referenced from several products share one encoded variant
+	for paths in groups.values():
+		for other in paths[1:]:
+			for width in widths:
+				for fmt in formats:
+					src_variant = variant_path(paths[0], width, fmt)
+					dest = variant_path(other, width, fmt)
+					if src_variant.exists() and not dest.exists():
+						link_or_copy(src_variant, dest)
+	return created, skipped
+
+
+def iter_upload_images(upload_base=UPLOAD_BASE):
+	for folder in sorted(upload_base.iterdir()):
+		if not folder.is_dir() or folder.name == BLOB_DIRNAME:
+			continue
+		for p in sorted(folder.iterdir()):
+			if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
+				yield p
+
+
+def parse_widths(value):
+	return tuple(int(w) for w in str(value).split(',') if w.strip())
+
+
+def resolve_formats(avif=False):
+	formats = ['webp']
+	if avif:
+		if avif_supported():
+			formats.append('avif')
+		else:
+			print('AVIF requested but not supported by this Pillow build (pip install pillow-avif-plugin); writing WebP only')
+	return tuple(formats)
+
+
+def main():
+	p = argparse.ArgumentParser(description='Generate resized WebP/AVIF variants for uploaded product images')
+	p.add_argument('--widths', default=','.join(map(str, DEFAULT_WIDTHS)), help='Comma separated variant widths in px (default: 280,800)')
+	p.add_argument('--avif', action='store_true', help='Also write AVIF variants when supported')
+	p.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+	args = p.parse_args()
+	if not UPLOAD_BASE.exists():
+		print('No uploads found at', UPLOAD_BASE)
+		return
+	created, skipped = generate_variants(
+		iter_upload_images(), widths=parse_widths(args.widths), formats=resolve_formats(args.avif), workers=args.workers
+	)
+	print(f'Image variants created: {created}, already present: {skipped}')
+
+
+if __name__ == '__main__':
+	main()
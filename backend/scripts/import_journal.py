@@ -0,0 +1,131 @@
+"""
+import_journal.py
+
+Checkpoint journal that lets an interrupted spreadsheet import resume.
+
+A journal is an append-only JSON-lines file in `.import-journal/` whose name is
+derived from the SHA-256 of the workbook, the sheet and the id header, so it
+only ever applies to the exact same input. The ingest stage commits its upsert
+batch by batch and records the number of rows committed after each commit; the
+image stage records every image it has stored (job index, product id, URL);
+finished stages are marked done.
+
+Journals are only kept for `--resumable` imports. A rerun with `--resume` reads
+the journal back and skips the committed rows, the stored images and the stages
+already done. Without `--resume` the journal is started over, and a run that
+completes removes it. Work repeated because a crash hit between a commit (or a file
+write) and its journal entry is harmless: the upsert is idempotent and images
+are content-addressed.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+JOURNAL_DIRNAME = '.import-journal'
+JOURNAL_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1 << 20):
+	h = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for chunk in iter(lambda: f.read(chunk_size), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+def journal_name(workbook_hash, sheet, id_header):
+	key = '\0'.join((workbook_hash, sheet or '', id_header or ''))
+	return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.jsonl'
+
+
+class ImportJournal:
+	"""Checkpoints of one workbook import; safe to share between stage threads."""
+
+	def __init__(self, path, header, resume=False):
+		self.path = path
+		self.header = header
+		self.rows_done = 0
+		self.images = {}
+		self.done = set()
+		self._lock = threading.Lock()
+		path.parent.mkdir(parents=True, exist_ok=True)
+		self.resumed = bool(resume and path.exists() and self._load())
+		if not self.resumed:
+			with open(path, 'w', encoding='utf-8') as f:
+				f.write(json.dumps(dict(header, event='start', version=JOURNAL_VERSION)) + '\n')
+		self._fp = open(path, 'a', encoding='utf-8')
+
+	@classmethod
+	def for_workbook(cls, xlsx_path, journal_dir, sheet=None, id_header='id', resume=False):
+		digest = file_sha256(xlsx_path)
+		header = {
+			'workbook': str(xlsx_path),
+			'sha256': digest,
+			'sheet': sheet,
+			'id_header': id_header,
+			'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+		}
+		return cls(journal_dir / journal_name(digest, sheet, id_header), header, resume=resume)
+
+	def _load(self):
+		good = 0
+		with open(self.path, 'rb') as f:
+			for line in f:
+				try:
+					rec = json.loads(line)
+				except ValueError:
+					break
+				if not line.endswith(b'\n'):
+					break
+				good += len(line)
+				event = rec.get('event')
+				if event == 'start' and rec.get('sha256') != self.header['sha256']:
+					return False
+				if event == 'rows':
+					self.rows_done = rec['done']
+				elif event == 'image':
+					self.images[rec['job']] = (rec['product'], rec['url'])
+				elif event == 'stage_done':
+					self.done.add(rec['stage'])
+		if good < self.path.stat().st_size:
+			# drop the torn last line left by the interrupted run before appending
+			os.truncate(self.path, good)
+		return True
+
+	def _append(self, rec, sync=False):
+		with self._lock:
+			self._fp.write(json.dumps(rec) + '\n')
+			self._fp.flush()
+			if sync:
+				os.fsync(self._fp.fileno())
+
+	def rows_committed(self, total):
+		"""Record that the first `total` data rows are committed."""
+		self.rows_done = total
+		self._append({'event': 'rows', 'done': total}, sync=True)
+
+	def image_stored(self, job, product_id, url):
+		self.images[job] = (product_id, url)
+		self._append({'event': 'image', 'job': job, 'product': product_id, 'url': url})
+
+	def stage_done(self, stage):
+		self.done.add(stage)
+		self._append({'event': 'stage_done', 'stage': stage}, sync=True)
+
+	def is_done(self, stage):
+		return stage in self.done
+
+	def close(self):
+		with self._lock:
+			self._fp.close()
+
+	def remove(self):
+		"""Close the journal and delete its file."""
+		self.close()
+		try:
+			os.remove(self.path)
+		except FileNotFoundError:
+			pass
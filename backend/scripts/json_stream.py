@@ -0,0 +1,158 @@
+"""
+json_stream.py
+
+Incremental reader for catalog exports.
+
+`read_json_records` yields the records of a JSON array export (compact or
+pretty-printed, as written by `catalog_export` or the old `df.to_json` export)
+or of an NDJSON export one at a time. The file is read in fixed-size chunks and
+each record is decoded as soon as it is complete, so memory is bounded by the
+largest single record rather than by the file size and consumers can start
+writing before the end of the file has been read. The layout is detected from
+the first non-blank character; `.gz` files are decompressed on the fly.
+
+Records are decoded straight from the buffer. When that fails, the reader reads
+on to the end of the record, tracking strings and bracket depth, and decodes it
+once more: a record cut off at a chunk edge costs one extra scan, and a
+malformed one fails as soon as it has been read instead of buffering the rest
+of the file. A number or literal is only decoded once the delimiter after it
+has been read.
+"""
+
+import gzip
+import json
+import re
+
+DEFAULT_READ_SIZE = 1 << 16
+_WHITESPACE = ' \t\r\n'
+_STRUCTURE = re.compile(r'[][{}"]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[^\w+\-.]')
+
+
+def open_text(path):
+	if str(path).endswith('.gz'):
+		return gzip.open(path, 'rt', encoding='utf-8')
+	return open(path, encoding='utf-8')
+
+
+class _ChunkReader:
+	"""Sliding text buffer over `fp` that only keeps the undecoded tail."""
+
+	def __init__(self, fp, read_size):
+		self.fp = fp
+		self.read_size = read_size
+		self.buf = ''
+		self.pos = 0
+
+	def fill(self):
+		"""Append the next chunk, dropping consumed text; returns False at end of input."""
+		chunk = self.fp.read(self.read_size)
+		if not chunk:
+			return False
+		self.buf = self.buf[self.pos:] + chunk
+		self.pos = 0
+		return True
+
+	def peek(self):
+		"""Return the next non-blank character without consuming it ('' at end of input)."""
+		while True:
+			while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+				self.pos += 1
+			if self.pos < len(self.buf):
+				return self.buf[self.pos]
+			if not self.fill():
+				return ''
+
+	def _extent(self):
+		"""Offset just past the value starting at `pos`, reading more input until it is complete.
+
+		Only string and bracket boundaries are tracked; whether the value is valid
+		JSON is left to the decoder. At end of input the end of the buffer is returned."""
+		scalar = self.buf[self.pos] not in '[{"'
+		depth = 0
+		in_string = False
+		i = self.pos
+		while True:
+			buf = self.buf
+			while i < len(buf):
+				if scalar:
+					m = _SCALAR_END.search(buf, i)
+					if m is not None:
+						return m.start()
+					i = len(buf)
+				elif in_string:
+					m = _STRING_END.search(buf, i)
+					if m is None:
+						i = len(buf)
+					elif m.group() == '\\':
+						# skip the escaped character, which may still be in the next chunk
+						i = m.end() + 1
+					else:
+						i = m.end()
+						in_string = False
+						if depth == 0:
+							return i
+				else:
+					m = _STRUCTURE.search(buf, i)
+					if m is None:
+						i = len(buf)
+						continue
+					i = m.end()
+					if m.group() == '"':
+						in_string = True
+					elif m.group() in '[{':
+						depth += 1
+					else:
+						depth -= 1
+						if depth == 0:
+							return i
+			start = self.pos
+			if not self.fill():
+				return len(self.buf)
+			i -= start
+
+	def value(self, decoder):
+		first = self.peek()
+		if first and first not in '[{"':
+			self._extent()
+		try:
+			value, end = decoder.raw_decode(self.buf, self.pos)
+		except json.JSONDecodeError:
+			if not first:
+				raise
+			# cut off at the end of the buffer, or malformed: read to the end of the value and decode once more
+			self._extent()
+			value, end = decoder.raw_decode(self.buf, self.pos)
+		self.pos = end
+		return value
+
+
+def iter_json_records(fp, read_size=DEFAULT_READ_SIZE):
+	"""Yield the elements of a top-level JSON array, or each value of an NDJSON stream."""
+	reader = _ChunkReader(fp, read_size)
+	decoder = json.JSONDecoder()
+	if reader.peek() != '[':
+		while reader.peek():
+			yield reader.value(decoder)
+		return
+	reader.pos += 1
+	if reader.peek() == ']':
+		reader.pos += 1
+	else:
+		while True:
+			yield reader.value(decoder)
+			sep = reader.peek()
+			if sep not in (',', ']'):
+				raise ValueError(f'Expected "," or "]" in JSON array, got {sep or "end of input"!r}')
+			reader.pos += 1
+			if sep == ']':
+				break
+	if reader.peek():
+		raise ValueError('Unexpected data after the JSON array')
+
+
+def read_json_records(path, read_size=DEFAULT_READ_SIZE):
+	"""Open `path` (optionally gzipped) and yield its records incrementally."""
+	with open_text(path) as fp:
+		yield from iter_json_records(fp, read_size)
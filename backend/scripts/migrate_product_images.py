@@ -0,0 +1,110 @@
+"""
+Migrate product images from the fixed lego_products.pictures..pictures_4 columns into product_images.
+
+Creates the product_images table and the lower(name) index on lego_products if they are missing, then
+copies every non-empty picture column into product_images (position 0-4). Products that already have a
+row at a position are left alone, so the migration can be re-run at any time, e.g. after rows were
+written by a tool that only knows the legacy columns.
+
+With --measure, images served from public/uploads/ that have no recorded size get their width, height and
+(if missing) content hash filled in; only the image headers are decoded.
+
+Usage:
+  python backend/scripts/migrate_product_images.py [--dry-run] [--measure]
+
+DB settings come from the PG_* environment variables (or the repository .env), see db.py.
+"""
+import argparse
+import hashlib
+from pathlib import Path
+
+from psycopg2.extras import execute_values
+
+import db
+from image_store import HASH_NAME_LEN
+from product_images import backfill_from_columns
+from schema import ensure_schema
+
+PUBLIC_DIR = Path(__file__).resolve().parents[2] / 'public'
+MEASURE_BATCH = 500
+
+UNMEASURED = """
+	SELECT product_id, position, url, hash FROM product_images
+	WHERE width IS NULL AND url LIKE '/uploads/%'
+	ORDER BY product_id, position
+"""
+UPDATE_MEASURED = """
+	UPDATE product_images AS pi SET hash = v.hash, width = v.width, height = v.height
+	FROM (VALUES %s) AS v(product_id, position, hash, width, height)
+	WHERE pi.product_id = v.product_id AND pi.position = v.position
+"""
+
+
+def measure(path, known_hash):
+	from PIL import Image  # only needed for --measure
+
+	with Image.open(path) as img:
+		width, height = img.size
+	digest = known_hash
+	if digest is None:
+		h = hashlib.sha256()
+		with open(path, 'rb') as f:
+			for chunk in iter(lambda: f.read(1 << 20), b''):
+				h.update(chunk)
+		digest = h.hexdigest()[:HASH_NAME_LEN]
+	return digest, width, height
+
+
+def measure_images(conn):
+	cur = conn.cursor()
+	cur.execute(UNMEASURED)
+	pending = cur.fetchall()
+	measured, missing = [], 0
+	for product_id, position, url, known_hash in pending:
+		path = PUBLIC_DIR / url.lstrip('/')
+		try:
+			measured.append((product_id, position, *measure(path, known_hash)))
+		except (OSError, ValueError) as e:
+			missing += 1
+			print(f'Could not measure {url}: {e}')
+	for i in range(0, len(measured), MEASURE_BATCH):
+		execute_values(
+			cur, UPDATE_MEASURED, measured[i:i + MEASURE_BATCH],
+			template='(%s, %s::smallint, %s, %s::int, %s::int)', page_size=MEASURE_BATCH,
+		)
+	cur.close()
+	return len(measured), missing
+
+
+def main(dry_run=False, measure_sizes=False):
+	def migrate(conn):
+		ensure_schema(conn)
+		cur = conn.cursor()
+		copied = backfill_from_columns(cur)
+		cur.close()
+		measured = missing = 0
+		if measure_sizes:
+			measured, missing = measure_images(conn)
+		if dry_run:
+			conn.rollback()
+		else:
+			conn.commit()
+		return copied, measured, missing
+
+	try:
+		copied, measured, missing = db.run_with_retry(migrate, stage='import')
+	finally:
+		db.close_pool()
+
+	prefix = '[dry-run] would have ' if dry_run else ''
+	print(f'{prefix}copied {copied} picture column value(s) into product_images')
+	if measure_sizes:
+		print(f'{prefix}measured {measured} image(s); {missing} could not be read')
+
+
+if __name__ == '__main__':
+	p = argparse.ArgumentParser()
+	p.add_argument('--dry-run', action='store_true', help='Create missing tables/indexes, report what would be copied and roll the copy back')
+	p.add_argument('--measure', action='store_true', help='Fill in width/height/hash for local images (needs Pillow)')
+	args = p.parse_args()
+	main(dry_run=args.dry_run, measure_sizes=args.measure)
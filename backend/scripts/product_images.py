@@ -0,0 +1,120 @@
+"""
+product_images.py
+
+Normalized product images: one `product_images(product_id, position, url, hash,
+width, height)` row per image instead of the five fixed `pictures` ..
+`pictures_4` columns, so a product can have any number of images. The legacy
+columns are still written by every path (the storefront reads them) and mirror
+positions 0-4.
+
+`sync_product_images` writes a batch of `{product_id: urls}` lists with one
+upsert and one delete; positions whose URL did not change are not touched.
+`sync_from_columns` derives the rows from the legacy columns (used after bulk
+imports and by `migrate_product_images.py` to backfill). `hash` is the content
+hash carried in image_store's file names; `width`/`height` are filled in by the
+migration tool's `--measure` pass.
+"""
+
+import re
+
+from psycopg2.extras import execute_values
+
+PICTURE_COLUMNS = ('pictures', 'pictures_1', 'pictures_2', 'pictures_3', 'pictures_4')
+# image_store names files `<first 32 hex digits of sha256><ext>`
+_HASH_NAME = re.compile(r'/([0-9a-f]{32})\.[A-Za-z0-9]+$')
+_HASH_NAME_SQL = r'/([0-9a-f]{32})\.[A-Za-z0-9]+$'
+
+UPSERT_IMAGES = """
+	INSERT INTO product_images AS pi (product_id, position, url, hash)
+	SELECT v.product_id, v.position, v.url, v.hash
+	FROM (VALUES %s) AS v(product_id, position, url, hash)
+	JOIN lego_products p ON p.id = v.product_id
+	ON CONFLICT (product_id, position) DO UPDATE SET
+		url = EXCLUDED.url, hash = EXCLUDED.hash, width = NULL, height = NULL
+	WHERE pi.url IS DISTINCT FROM EXCLUDED.url
+	RETURNING pi.product_id
+"""
+_UPSERT_TEMPLATE = '(%s, %s::smallint, %s::text, %s::text)'
+
+DELETE_EXTRA_IMAGES = """
+	DELETE FROM product_images AS pi
+	USING (VALUES %s) AS v(product_id, image_count)
+	WHERE pi.product_id = v.product_id AND pi.position >= v.image_count
+	RETURNING pi.product_id
+"""
+_DELETE_TEMPLATE = '(%s, %s::int)'
+
+# legacy columns -> rows; `%(ids)s` limits it to some products (NULL = all)
+_COLUMN_IMAGES = f"""
+	SELECT p.id AS product_id, (s.slot - 1)::smallint AS position, s.url,
+		substring(s.url from '{_HASH_NAME_SQL}') AS hash
+	FROM lego_products p
+	CROSS JOIN LATERAL unnest(ARRAY[{', '.join('p.' + c for c in PICTURE_COLUMNS)}]) WITH ORDINALITY AS s(url, slot)
+	WHERE s.url IS NOT NULL AND (%(ids)s::text[] IS NULL OR p.id = ANY(%(ids)s::text[]))
+"""
+BACKFILL_FROM_COLUMNS = f"""
+	INSERT INTO product_images (product_id, position, url, hash)
+	{_COLUMN_IMAGES}
+	ON CONFLICT (product_id, position) DO NOTHING
+"""
+SYNC_FROM_COLUMNS = f"""
+	WITH src AS ({_COLUMN_IMAGES}),
+	upserted AS (
+		INSERT INTO product_images AS pi (product_id, position, url, hash)
+		SELECT product_id, position, url, hash FROM src
+		ON CONFLICT (product_id, position) DO UPDATE SET
+			url = EXCLUDED.url, hash = EXCLUDED.hash, width = NULL, height = NULL
+		WHERE pi.url IS DISTINCT FROM EXCLUDED.url
+		RETURNING 1
+	),
+	removed AS (
+		DELETE FROM product_images AS pi
+		WHERE pi.product_id = ANY(%(ids)s::text[])
+		  AND NOT EXISTS (SELECT 1 FROM src WHERE src.product_id = pi.product_id AND src.position = pi.position)
+		RETURNING 1
+	)
+	SELECT (SELECT count(*) FROM upserted), (SELECT count(*) FROM removed)
+"""
+
+
+def url_hash(url):
+	match = _HASH_NAME.search(url or '')
+	return match.group(1) if match else None
+
+
+def sync_product_images(cur, updates):
+	"""Write `{product_id: urls}` into product_images; unknown product ids are ignored.
+
+	Each product ends up with exactly `urls` at positions 0..n-1. Returns the ids of
+	the products whose images changed."""
+	if not updates:
+		return set()
+	values = [
+		(str(pid), position, url, url_hash(url))
+		for pid, urls in updates.items()
+		for position, url in enumerate(urls)
+	]
+	changed = set()
+	if values:
+		rows = execute_values(cur, UPSERT_IMAGES, values, template=_UPSERT_TEMPLATE, page_size=len(values), fetch=True)
+		changed.update(r[0] for r in rows)
+	counts = [(str(pid), len(urls)) for pid, urls in updates.items()]
+	rows = execute_values(cur, DELETE_EXTRA_IMAGES, counts, template=_DELETE_TEMPLATE, page_size=len(counts), fetch=True)
+	changed.update(r[0] for r in rows)
+	return changed
+
+
+def sync_from_columns(cur, ids):
+	"""Make product_images of `ids` match their legacy picture columns.
+
+	Returns `(upserted, removed)` row counts."""
+	if not ids:
+		return 0, 0
+	cur.execute(SYNC_FROM_COLUMNS, {'ids': [str(i) for i in ids]})
+	return cur.fetchone()
+
+
+def backfill_from_columns(cur):
+	"""Copy legacy picture columns into product_images where no row exists yet; returns the count."""
+	cur.execute(BACKFILL_FROM_COLUMNS, {'ids': None})
+	return cur.rowcount
@@ -0,0 +1,200 @@
+"""
+run_report.py
+
+Instrumentation for the pipeline scripts.
+
+A `RunReport` records, for each stage, its wall time, outcome and counters
+(rows, images, bytes written, errors skipped, ...). While it is active it also
+aggregates call counts and time per DB statement class (`SELECT`, `INSERT`,
+`COPY`, `EXECUTE <name>`, ...) for every statement run through a `db`
+connection, both per stage and for the whole run. `write` saves it all as JSON.
+
+With `profile=True` the run is recorded with cProfile and tracemalloc; each
+stage entry then also carries the peak traced Python allocation while it ran,
+and the report lists the top allocation sites. cProfile only sees the thread
+that activated the report and tracemalloc keeps one process-wide peak, so a
+profiled pipeline runs its stages one at a time on that thread
+(`run_stages(..., workers=1)`). A stage that overlapped another one anyway is
+marked `tracemalloc_peak_approximate`: its peak may include the other's
+allocations.
+
+	report = RunReport(profile=True)
+	with report.activate():
+		with run_report.stage('ingest'):
+			...
+			run_report.count('rows', n)
+	report.write('run.json')
+
+The module-level `stage`/`count` helpers are no-ops when no report is active,
+so instrumented code runs unchanged without one.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import db
+
+TOP_ALLOCATIONS = 15
+
+_active = None
+
+
+def _now():
+	return time.strftime('%Y-%m-%dT%H:%M:%S%z')
+
+
+class RunReport:
+	def __init__(self, profile=False):
+		self.profile = profile
+		self.started_at = None
+		self.finished_at = None
+		self.seconds = None
+		self.status = None
+		self.stages = []
+		self.counters = {}
+		self.statements = {}
+		self.allocations = []
+		self.profiler = None
+		self._running = {}
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	@contextlib.contextmanager
+	def activate(self):
+		"""Make this the active report for the duration of the block."""
+		global _active
+		previous, _active = _active, self
+		db.set_statement_observer(self._observe_statement)
+		self.started_at = _now()
+		started = time.perf_counter()
+		if self.profile:
+			tracemalloc.start()
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+		try:
+			yield self
+			self.status = 'ok'
+		except BaseException as e:
+			self.status = f'failed: {type(e).__name__}: {e}'
+			raise
+		finally:
+			if self.profile:
+				self.profiler.disable()
+				snapshot = tracemalloc.take_snapshot()
+				tracemalloc.stop()
+				self.allocations = [
+					{'where': str(stat.traceback[0]), 'bytes': stat.size, 'blocks': stat.count}
+					for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+				]
+			self.seconds = round(time.perf_counter() - started, 4)
+			self.finished_at = _now()
+			db.set_statement_observer(previous._observe_statement if previous else None)
+			_active = previous
+
+	@contextlib.contextmanager
+	def stage(self, name):
+		entry = {'name': name, 'started_at': _now(), 'seconds': None, 'status': 'running', 'counters': {}, 'statements': {}}
+		with self._lock:
+			self.stages.append(entry)
+			if self.profile:
+				# the peak is process-wide: only reset it when no other stage is being measured
+				if self._running:
+					for other in (entry, *self._running.values()):
+						other['tracemalloc_peak_approximate'] = True
+				else:
+					tracemalloc.reset_peak()
+			self._running[id(entry)] = entry
+		outer = getattr(self._local, 'stage', None)
+		self._local.stage = entry
+		started = time.perf_counter()
+		try:
+			yield entry
+			entry['status'] = 'ok'
+		except BaseException as e:
+			entry['status'] = 'failed'
+			entry['error'] = f'{type(e).__name__}: {e}'
+			raise
+		finally:
+			entry['seconds'] = round(time.perf_counter() - started, 4)
+			with self._lock:
+				if self.profile:
+					entry['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+				del self._running[id(entry)]
+			self._local.stage = outer
+
+	def count(self, key, n=1):
+		entry = getattr(self._local, 'stage', None)
+		counters = entry['counters'] if entry is not None else self.counters
+		with self._lock:
+			counters[key] = counters.get(key, 0) + n
+
+	def _observe_statement(self, kind, seconds):
+		entry = getattr(self._local, 'stage', None)
+		with self._lock:
+			targets = (self.statements, entry['statements']) if entry is not None else (self.statements,)
+			for target in targets:
+				stats = target.setdefault(kind, {'count': 0, 'seconds': 0.0})
+				stats['count'] += 1
+				stats['seconds'] += seconds
+
+	def as_dict(self):
+		def _rounded(statements):
+			return {k: {'count': v['count'], 'seconds': round(v['seconds'], 4)} for k, v in sorted(statements.items())}
+
+		stages = [dict(s, statements=_rounded(s['statements'])) for s in self.stages]
+		report = {
+			'started_at': self.started_at,
+			'finished_at': self.finished_at,
+			'seconds': self.seconds,
+			'status': self.status,
+			'argv': sys.argv,
+			'stages': stages,
+			'counters': dict(self.counters),
+			'statements': _rounded(self.statements),
+		}
+		if self.profile:
+			report['top_allocations'] = self.allocations
+		return report
+
+	def write(self, path):
+		tmp = f'{path}.tmp'
+		with open(tmp, 'w', encoding='utf-8') as f:
+			json.dump(self.as_dict(), f, indent=2)
+		os.replace(tmp, path)
+
+	def write_profile(self, path):
+		if self.profiler is not None:
+			self.profiler.dump_stats(path)
+
+	def summary(self):
+		"""One line per stage: name, status and duration, slowest first."""
+		lines = []
+		for s in sorted(self.stages, key=lambda s: -(s['seconds'] or 0)):
+			counters = ', '.join(f'{k}={v}' for k, v in s['counters'].items())
+			lines.append(f"  {s['name']:<10} {s['status']:<7} {s['seconds'] or 0:>8.2f}s  {counters}")
+		return '\n'.join(lines)
+
+
+def active():
+	return _active
+
+
+@contextlib.contextmanager
+def stage(name):
+	"""Record `name` as a stage of the active report (no-op without one)."""
+	if _active is None:
+		yield None
+		return
+	with _active.stage(name) as entry:
+		yield entry
+
+
+def count(key, n=1):
+	if _active is not None:
+		_active.count(key, n)
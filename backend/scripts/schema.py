@@ -0,0 +1,178 @@
+"""
+schema.py
+
+DDL for the `lego_products` table shared by the Python scripts.
+
+Change tracking: every row carries `updated_at`, a `row_version` drawn from
+`lego_products_row_version_seq` and `row_xid`, the id of the transaction that
+last wrote it. A `BEFORE UPDATE` trigger bumps all three whenever an UPDATE
+(or `ON CONFLICT DO UPDATE`) actually changes a row, so every writer is tracked,
+including the admin routes and one-off scripts. Sequence values are taken in one order and committed
+in another, so delta exports do not use `row_version` as a watermark: they
+record the transaction snapshot they read from, and the next delta selects the
+rows whose `row_xid` that snapshot did not see, which includes transactions
+that were still running at the time. Deleted products leave a tombstone in
+`lego_products_deleted` (written by a trigger, whatever issued the DELETE),
+tagged the same way.
+
+Images: `product_images` holds one row per image (see product_images.py); the
+`pictures`..`pictures_4` columns are kept as a mirror of its first five
+positions. Name lookups go through the `lower(name)` expression index.
+
+Prices: `price_shipping_included` keeps the text from the source; writers also
+store the parsed amount in the indexed NUMERIC `price` column, and
+`catalog_facets` holds the precomputed filter counts (see catalog_facets.py).
+"""
+
+ROW_VERSION_SEQ = 'lego_products_row_version_seq'
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS lego_products (
+	id TEXT PRIMARY KEY,
+	name TEXT,
+	pictures TEXT,
+	pictures_1 TEXT,
+	pictures_2 TEXT,
+	pictures_3 TEXT,
+	pictures_4 TEXT,
+	description TEXT,
+	price_shipping_included TEXT,
+	lego_pieces INTEGER
+);
+"""
+
+CHANGE_TRACKING = f"""
+CREATE SEQUENCE IF NOT EXISTS {ROW_VERSION_SEQ};
+ALTER TABLE lego_products ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE lego_products ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT nextval('{ROW_VERSION_SEQ}');
+CREATE INDEX IF NOT EXISTS lego_products_row_version_idx ON lego_products (row_version);
+"""
+
+DELTA_TRACKING = """
+ALTER TABLE lego_products ADD COLUMN IF NOT EXISTS row_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS lego_products_row_xid_idx ON lego_products (row_xid);
+CREATE TABLE IF NOT EXISTS lego_products_deleted (
+	id TEXT PRIMARY KEY,
+	deleted_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+	row_xid xid8 NOT NULL DEFAULT pg_current_xact_id()
+);
+CREATE INDEX IF NOT EXISTS lego_products_deleted_row_xid_idx ON lego_products_deleted (row_xid);
+CREATE OR REPLACE FUNCTION lego_products_record_deletes() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO lego_products_deleted (id) SELECT id FROM deleted_rows
+	ON CONFLICT (id) DO UPDATE SET deleted_at = now(), row_xid = pg_current_xact_id();
+	RETURN NULL;
+END
+$$;
+DROP TRIGGER IF EXISTS lego_products_record_deletes ON lego_products;
+CREATE TRIGGER lego_products_record_deletes AFTER DELETE ON lego_products
+	REFERENCING OLD TABLE AS deleted_rows FOR EACH STATEMENT EXECUTE FUNCTION lego_products_record_deletes();
+"""
+
+TOUCH_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION lego_products_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+	NEW.updated_at := now();
+	NEW.row_version := nextval('{ROW_VERSION_SEQ}');
+	NEW.row_xid := pg_current_xact_id();
+	RETURN NEW;
+END
+$$;
+DROP TRIGGER IF EXISTS lego_products_touch ON lego_products;
+CREATE TRIGGER lego_products_touch BEFORE UPDATE ON lego_products
+	FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION lego_products_touch();
+"""
+
+PRODUCT_IMAGES = """
+CREATE TABLE IF NOT EXISTS product_images (
+	product_id TEXT NOT NULL REFERENCES lego_products (id) ON DELETE CASCADE,
+	position SMALLINT NOT NULL,
+	url TEXT NOT NULL,
+	hash TEXT,
+	width INTEGER,
+	height INTEGER,
+	PRIMARY KEY (product_id, position)
+);
+CREATE INDEX IF NOT EXISTS product_images_hash_idx ON product_images (hash);
+CREATE INDEX IF NOT EXISTS lego_products_lower_name_idx ON lego_products (lower(name));
+"""
+
+TYPED_PRICE = """
+ALTER TABLE lego_products ADD COLUMN IF NOT EXISTS price NUMERIC(12, 2);
+CREATE INDEX IF NOT EXISTS lego_products_price_idx ON lego_products (price);
+CREATE INDEX IF NOT EXISTS lego_products_lego_pieces_idx ON lego_products (lego_pieces);
+CREATE TABLE IF NOT EXISTS catalog_facets (
+	facet TEXT NOT NULL,
+	bucket TEXT NOT NULL,
+	position INTEGER NOT NULL,
+	lower_bound NUMERIC,
+	upper_bound NUMERIC,
+	product_count INTEGER NOT NULL,
+	refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+	PRIMARY KEY (facet, bucket)
+);
+"""
+
+
+def _table_exists(cur, name):
+	cur.execute('SELECT to_regclass(%s) IS NOT NULL', (name,))
+	return cur.fetchone()[0]
+
+
+def _column_exists(cur, column):
+	cur.execute(
+		"SELECT 1 FROM information_schema.columns WHERE table_name = 'lego_products' AND column_name = %s", (column,)
+	)
+	return cur.fetchone() is not None
+
+
+def _trigger_exists(cur, name):
+	cur.execute(
+		"SELECT 1 FROM pg_trigger WHERE tgrelid = 'lego_products'::regclass AND tgname = %s", (name,)
+	)
+	return cur.fetchone() is not None
+
+
+def ensure_change_tracking(conn):
+	cur = conn.cursor()
+	# ALTER TABLE takes an exclusive lock even when nothing changes; skip it on migrated tables
+	if not _column_exists(cur, 'row_version'):
+		cur.execute(CHANGE_TRACKING)
+	if not _column_exists(cur, 'row_xid'):
+		cur.execute(DELTA_TRACKING)
+	if not _trigger_exists(cur, 'lego_products_touch'):
+		cur.execute(TOUCH_TRIGGER)
+	conn.commit()
+	cur.close()
+
+
+def ensure_product_images(conn):
+	cur = conn.cursor()
+	if not _table_exists(cur, 'product_images'):
+		cur.execute(PRODUCT_IMAGES)
+	conn.commit()
+	cur.close()
+
+
+def ensure_typed_price(conn):
+	cur = conn.cursor()
+	# the price column and catalog_facets are created together
+	if not _table_exists(cur, 'catalog_facets'):
+		cur.execute(TYPED_PRICE)
+	conn.commit()
+	cur.close()
+
+
+def ensure_schema(conn):
+	"""Bring an existing lego_products table up to date (change tracking, product_images, typed price)."""
+	ensure_change_tracking(conn)
+	ensure_product_images(conn)
+	ensure_typed_price(conn)
+
+
+def create_table_if_not_exists(conn):
+	cur = conn.cursor()
+	cur.execute(CREATE_TABLE)
+	conn.commit()
+	cur.close()
+	ensure_schema(conn)
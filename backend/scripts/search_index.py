@@ -0,0 +1,292 @@
+"""
+search_index.py
+
+Prebuilt product search over `name` and `description`.
+
+`build_index` tokenizes every product once (case-folded runs of letters and
+digits) and writes a compact binary index that `SearchIndex` memory-maps and
+queries in place, so a search is a few binary searches and posting-list merges
+instead of a scan over every product:
+
+  header     magic, format version, section counts and byte offsets
+  ids        product ids (UTF-8), addressed by document number
+  terms      every distinct token, sorted, for exact and prefix lookup
+  postings   per term, the sorted document numbers holding it, each tagged
+             with the fields it occurs in (name and/or description)
+  sets       sorted (set number, document) pairs for the 4-6 digit set
+             numbers found in names, as `catalog_facets` counts them
+
+All integers are little-endian uint32. A query matches the products that
+contain every query token, as a whole word or as a prefix ("ferr" finds
+"ferrari", "4214" finds "42143"). Whole-word and name matches rank above prefix
+and description matches, and a token that is a product's set number ranks
+highest.
+
+  python backend/scripts/search_index.py --index public/catalog/search.idx ferrari 42143
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+
+from catalog_export import DEFAULT_CHUNK_SIZE, iter_records
+
+MAGIC = b'LGSX'
+FORMAT_VERSION = 1
+# magic, version, docs, terms, set pairs, then the byte offsets of the 7 arrays / blobs
+_HEADER = struct.Struct('<4sIIII7Q')
+_TOKEN = re.compile(r'[^\W_]+')
+_SET_NUMBER = re.compile(r'\b(\d{4,6})\b')
+
+FIELD_NAME = 1
+FIELD_DESCRIPTION = 2
+_FIELD_BITS = 2
+# score of a query token by how it matched
+_SCORE_SET = 8
+_SCORE_NAME = 4
+_SCORE_DESCRIPTION = 2
+_SCORE_PREFIX = 1
+
+DEFAULT_QUERY = 'SELECT id, name, description FROM lego_products ORDER BY id'
+DEFAULT_LIMIT = 20
+
+
+def tokenize(text):
+	"""Case-folded runs of letters and digits in `text`."""
+	if not text:
+		return []
+	return _TOKEN.findall(str(text).casefold())
+
+
+def set_numbers(name):
+	return {int(n) for n in _SET_NUMBER.findall(str(name or ''))}
+
+
+def _u32(values):
+	packed = array('I', values)
+	if sys.byteorder != 'little':
+		packed.byteswap()
+	return packed.tobytes()
+
+
+def _blob(strings):
+	"""`(offsets, blob)` for a list of strings stored back to back as UTF-8."""
+	offsets = [0]
+	parts = []
+	for s in strings:
+		data = s.encode('utf-8')
+		parts.append(data)
+		offsets.append(offsets[-1] + len(data))
+	return _u32(offsets), b''.join(parts)
+
+
+def build_index(records, out_path):
+	"""Index `(id, name, description)` rows and write the index to `out_path`.
+
+	Returns `(documents, terms)` counts. The file is replaced atomically, so
+	readers that mapped the previous index keep a consistent view."""
+	ids = []
+	postings = {}
+	sets = []
+	for doc, (product_id, name, description) in enumerate(records):
+		ids.append(str(product_id))
+		fields = {}
+		for field, text in ((FIELD_NAME, name), (FIELD_DESCRIPTION, description)):
+			for token in tokenize(text):
+				fields[token] = fields.get(token, 0) | field
+		for token, mask in fields.items():
+			postings.setdefault(token, []).append(doc << _FIELD_BITS | mask)
+		sets.extend((number, doc) for number in set_numbers(name))
+	# sorted by UTF-8 bytes, the order the reader's binary search compares in
+	terms = sorted(postings, key=lambda t: t.encode('utf-8'))
+	sets.sort()
+	id_offsets, id_blob = _blob(ids)
+	term_offsets, term_blob = _blob(terms)
+	posting_offsets = [0]
+	entries = array('I')
+	for term in terms:
+		entries.extend(postings[term])
+		posting_offsets.append(len(entries))
+	if sys.byteorder != 'little':
+		entries.byteswap()
+	sections = [
+		id_offsets, id_blob, term_offsets, term_blob,
+		_u32(posting_offsets), entries.tobytes(), _u32(v for pair in sets for v in pair),
+	]
+	offsets = []
+	position = _HEADER.size
+	for section in sections:
+		# keep every array 4-byte aligned so it can be cast in place
+		position += -position % 4
+		offsets.append(position)
+		position += len(section)
+	out_path = Path(out_path)
+	out_path.parent.mkdir(parents=True, exist_ok=True)
+	tmp = out_path.with_name(out_path.name + '.tmp')
+	with open(tmp, 'wb') as f:
+		f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(ids), len(terms), len(sets), *offsets))
+		for offset, section in zip(offsets, sections):
+			f.write(b'\0' * (offset - f.tell()))
+			f.write(section)
+	os.replace(tmp, out_path)
+	return len(ids), len(terms)
+
+
+class SearchIndex:
+	"""A memory-mapped index written by `build_index`."""
+
+	def __init__(self, path):
+		self.path = str(path)
+		with open(self.path, 'rb') as f:
+			self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		view = memoryview(self._mmap)
+		magic, version, self.documents, self.terms, pairs, *offsets = _HEADER.unpack_from(view)
+		if magic != MAGIC or version != FORMAT_VERSION:
+			raise ValueError(f'{self.path} is not a version {FORMAT_VERSION} search index')
+		if sys.byteorder != 'little':
+			raise RuntimeError('search indexes are little-endian; this platform cannot map them in place')
+		ends = offsets[1:] + [len(view)]
+
+		def _u32s(i, count):
+			return view[offsets[i]:offsets[i] + 4 * count].cast('I')
+
+		self._id_offsets = _u32s(0, self.documents + 1)
+		self._id_blob = view[offsets[1]:ends[1]]
+		self._term_offsets = _u32s(2, self.terms + 1)
+		self._term_blob = view[offsets[3]:ends[3]]
+		self._posting_offsets = _u32s(4, self.terms + 1)
+		self._postings = _u32s(5, self._posting_offsets[self.terms])
+		self._sets = _u32s(6, 2 * pairs)
+		self._views = [view, self._id_offsets, self._id_blob, self._term_offsets, self._term_blob,
+			self._posting_offsets, self._postings, self._sets]
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		for view in reversed(self._views):
+			view.release()
+		self._mmap.close()
+
+	def product_id(self, doc):
+		return bytes(self._id_blob[self._id_offsets[doc]:self._id_offsets[doc + 1]]).decode('utf-8')
+
+	def _term(self, i):
+		return bytes(self._term_blob[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+	def _lower_bound(self, key):
+		lo, hi = 0, self.terms
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self._term(mid) < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	def _entries(self, i):
+		return self._postings[self._posting_offsets[i]:self._posting_offsets[i + 1]]
+
+	def _matching_terms(self, key):
+		"""`[(term index, exact)]` of the terms equal to or starting with `key`."""
+		matches = []
+		i = self._lower_bound(key)
+		while i < self.terms:
+			term = self._term(i)
+			if not term.startswith(key):
+				break
+			matches.append((i, term == key))
+			i += 1
+		return matches
+
+	def _token_scores(self, token, terms, candidates=None):
+		"""`{doc: score}` of the documents matching one query token.
+
+		With `candidates` only those documents are looked up, by binary search in
+		each posting list, instead of walking the lists."""
+		scores = {}
+		for i, exact in terms:
+			entries = self._entries(i)
+			if candidates is None:
+				hits = entries
+			else:
+				hits = []
+				for doc in candidates:
+					k = bisect.bisect_left(entries, doc << _FIELD_BITS)
+					if k < len(entries) and entries[k] >> _FIELD_BITS == doc:
+						hits.append(entries[k])
+			for entry in hits:
+				if exact:
+					score = _SCORE_NAME if entry & FIELD_NAME else _SCORE_DESCRIPTION
+				else:
+					score = _SCORE_PREFIX
+				doc = entry >> _FIELD_BITS
+				if score > scores.get(doc, 0):
+					scores[doc] = score
+		if token.isdigit() and 4 <= len(token) <= 6:
+			number = int(token)
+			j = bisect.bisect_left(range(len(self._sets) // 2), number, key=lambda k: self._sets[2 * k])
+			while 2 * j < len(self._sets) and self._sets[2 * j] == number:
+				doc = self._sets[2 * j + 1]
+				if candidates is None or doc in candidates:
+					scores[doc] = _SCORE_SET
+				j += 1
+		return scores
+
+	def search(self, query, limit=DEFAULT_LIMIT):
+		"""Product ids matching every token of `query`, best first, as `[(id, score)]`."""
+		tokens = []
+		for token in dict.fromkeys(tokenize(query)):
+			terms = self._matching_terms(token.encode('utf-8'))
+			cost = sum(self._posting_offsets[i + 1] - self._posting_offsets[i] for i, _exact in terms)
+			tokens.append((cost, token, terms))
+		if not tokens:
+			return []
+		# the most selective token first; the others only check its matches
+		tokens.sort(key=lambda t: t[0])
+		matched = None
+		for cost, token, terms in tokens:
+			# a binary search costs ~log2(cost) reads; walk the lists unless that is cheaper
+			probe = matched is not None and len(matched) * len(terms) * max(1, cost.bit_length()) < cost
+			scores = self._token_scores(token, terms, candidates=matched if probe else None)
+			if matched is None:
+				matched = scores
+			else:
+				matched = {doc: score + scores[doc] for doc, score in matched.items() if doc in scores}
+			if not matched:
+				return []
+		ranked = sorted(matched.items(), key=lambda item: (-item[1], item[0]))
+		return [(self.product_id(doc), score) for doc, score in ranked[:limit]]
+
+
+def build_from_db(conn, out_path, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Build the index from lego_products; returns `(documents, terms)`."""
+	records = iter_records(conn, DEFAULT_QUERY, chunk_size=chunk_size, cursor_name='lego_products_search')
+	return build_index(((r['id'], r['name'], r['description']) for r in records), out_path)
+
+
+if __name__ == '__main__':
+	p = argparse.ArgumentParser(description='Query a prebuilt product search index')
+	p.add_argument('--index', required=True, help='Index file written by the export pipeline')
+	p.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help=f'Results per query (default: {DEFAULT_LIMIT})')
+	p.add_argument('queries', nargs='+', help='Queries to run')
+	args = p.parse_args()
+	with SearchIndex(args.index) as index:
+		print(f'{args.index}: {index.documents} products, {index.terms} terms')
+		for query in args.queries:
+			started = time.perf_counter()
+			results = index.search(query, limit=args.limit)
+			elapsed = time.perf_counter() - started
+			print(f'{query!r}: {len(results)} results in {elapsed * 1e6:.0f}us')
+			for product_id, score in results:
+				print(f'  {score:3d}  {product_id}')
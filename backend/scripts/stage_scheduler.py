@@ -0,0 +1,112 @@
+"""
+stage_scheduler.py
+
+Run pipeline stages concurrently, in dependency order.
+
+Each `Stage` names the stages whose output it consumes. `run_stages` starts
+every stage whose dependencies have finished on a thread pool, so independent
+stages (e.g. the DB upsert and the image extraction) overlap and the pipeline
+takes about as long as its slowest chain instead of the sum of all stages.
+A stage function receives the dict of results of the stages finished so far.
+
+Stages left out of the run (`--only`/`--skip`, or disabled by options) count as
+satisfied dependencies. When a stage fails, the stages that depend on it are
+not started; unrelated stages still run to completion, and the first error is
+raised once everything has settled. Each stage runs as a `run_report` stage.
+With `workers=1` the stages run one at a time on the calling thread, which is
+what a profiled run needs (see `run_report.py`).
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import run_report
+
+DEFAULT_STAGE_WORKERS = 4
+
+
+class Stage:
+	"""A named unit of work; `fn(results)` runs once every stage in `deps` has finished."""
+
+	def __init__(self, name, fn, deps=()):
+		self.name = name
+		self.fn = fn
+		self.deps = tuple(deps)
+
+
+def select_stages(stages, only=None, skip=None, names=None):
+	"""Return the stages to run given `--only`/`--skip` name lists.
+
+	`names` lists every valid stage name, including stages the current options disable."""
+	names = names or [s.name for s in stages]
+	for name in (only or []) + (skip or []):
+		if name not in names:
+			raise ValueError(f'Unknown stage {name!r} (expected one of {", ".join(names)})')
+	return [s for s in stages if (not only or s.name in only) and s.name not in (skip or [])]
+
+
+def parse_stage_list(value):
+	return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _run(stage, results):
+	with run_report.stage(stage.name):
+		return stage.fn(results)
+
+
+class _InlinePool:
+	"""Stands in for the thread pool: runs each stage on the calling thread when it is submitted."""
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		pass
+
+	def submit(self, fn, *args):
+		fut = Future()
+		try:
+			fut.set_result(fn(*args))
+		except Exception as e:
+			fut.set_exception(e)
+		return fut
+
+
+def run_stages(stages, workers=DEFAULT_STAGE_WORKERS):
+	"""Run `stages` respecting their dependencies; returns `{name: result}`."""
+	selected = {s.name for s in stages}
+	pending = list(stages)
+	results = {}
+	done = set()
+	blocked = set()
+	errors = []
+	pool = _InlinePool() if workers <= 1 else ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stage')
+	with pool:
+		running = {}
+		while pending or running:
+			for stage in list(pending):
+				deps = [d for d in stage.deps if d in selected]
+				if any(d in blocked for d in deps):
+					print(f'Skipping stage {stage.name}: a stage it depends on failed')
+					blocked.add(stage.name)
+					pending.remove(stage)
+				elif all(d in done for d in deps):
+					running[pool.submit(_run, stage, dict(results))] = stage
+					pending.remove(stage)
+			if not running:
+				if pending:
+					raise ValueError(f'Stage dependencies form a cycle: {", ".join(s.name for s in pending)}')
+				break
+			finished, _ = wait(running, return_when=FIRST_COMPLETED)
+			for fut in finished:
+				stage = running.pop(fut)
+				err = fut.exception()
+				if err is not None:
+					print(f'Stage {stage.name} failed: {err}')
+					errors.append(err)
+					blocked.add(stage.name)
+					continue
+				results[stage.name] = fut.result()
+				done.add(stage.name)
+	if errors:
+		raise errors[0]
+	return results
@@ -0,0 +1,114 @@
+"""
+sync_plan.py
+
+Diff incoming product data against what `lego_products` already holds, so that
+a routine re-import writes only the rows that actually changed.
+
+The current state is read with one bulk query into `{id: row hash}`, where
+`row_hash` hashes the compared columns rendered as a COPY text line (see
+`bulk_load.copy_value`). `SyncPlan` hashes each incoming row the same way and
+sorts it into an insert (unknown id), an update (different hash) or an
+unchanged row, which is dropped before anything is staged. With `prune=True`
+the ids the import never mentioned become deletes. The plan prints as a
+summary plus the ids involved, which is what `--dry-run` shows.
+
+The merge statements keep their own `IS DISTINCT FROM` guards, so a row that
+changed between loading the state and writing is still handled correctly; the
+plan only saves the writes that would have been no-ops.
+
+	plan = SyncPlan.load(cur)
+	bulk_upsert_frames(conn, (plan.diff(frame) for frame in frames))
+"""
+
+import hashlib
+
+from psycopg2 import sql
+
+from bulk_load import UPSERT_COLUMNS, copy_value
+
+
+def row_hash(values):
+	"""Hash a sequence of column values; None is NULL, everything else compares as text."""
+	# escaped like a COPY line, so no value can pass for NULL or for a column boundary
+	text = '\t'.join(copy_value(v) for v in values)
+	return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_state(cur, columns=UPSERT_COLUMNS):
+	"""`{id: row_hash(columns)}` for every product, read with a single query."""
+	cur.execute("SELECT to_regclass('lego_products')")
+	if cur.fetchone()[0] is None:
+		return {}
+	cur.execute(sql.SQL('SELECT id, {} FROM lego_products').format(
+		sql.SQL(', ').join(map(sql.Identifier, columns))))
+	return {row[0]: row_hash(row[1:]) for row in cur}
+
+
+class SyncPlan:
+	"""Inserts, updates and (with `prune`) deletes needed to bring `state` up to date."""
+
+	def __init__(self, state, columns=UPSERT_COLUMNS, prune=False):
+		self.state = state
+		self.columns = tuple(columns)
+		self.prune = prune
+		self.changes = {}
+		self.unchanged = 0
+		self.seen = set()
+
+	@classmethod
+	def load(cls, cur, columns=UPSERT_COLUMNS, prune=False):
+		return cls(load_state(cur, columns), columns, prune=prune)
+
+	def plan(self, product_id, values):
+		"""Record an incoming row; True when it has to be written."""
+		digest = row_hash(values)
+		current = self.state.get(product_id)
+		self.seen.add(product_id)
+		if current == digest:
+			self.unchanged += 1
+			return False
+		self.changes.setdefault(product_id, 'insert' if current is None else 'update')
+		# a later duplicate of this id is compared with what this row will write
+		self.state[product_id] = digest
+		return True
+
+	def diff(self, frame):
+		"""Plan a DataFrame of product rows; returns only the rows that need writing."""
+		rows = frame[['id', *self.columns]].astype(object)
+		rows = rows.where(rows.notna(), None)
+		keep = [self.plan(product_id, values) for product_id, *values in rows.itertuples(index=False, name=None)]
+		return frame[keep]
+
+	@property
+	def inserts(self):
+		return [pid for pid, kind in self.changes.items() if kind == 'insert']
+
+	@property
+	def updates(self):
+		return [pid for pid, kind in self.changes.items() if kind == 'update']
+
+	@property
+	def deletes(self):
+		return sorted(set(self.state) - self.seen) if self.prune else []
+
+	def apply_deletes(self, cur):
+		"""Delete the products the import did not mention (only with `prune`); returns the count."""
+		deletes = self.deletes
+		if not deletes:
+			return 0
+		cur.execute('DELETE FROM lego_products WHERE id = ANY(%s)', (deletes,))
+		return cur.rowcount
+
+	def summary(self):
+		text = f'{len(self.inserts)} inserts, {len(self.updates)} updates, {self.unchanged} unchanged'
+		if self.prune:
+			text += f', {len(self.deletes)} deletes'
+		return text
+
+	def print(self, prefix='[dry-run] ', limit=20):
+		print(f'{prefix}Sync plan: {self.summary()}')
+		for kind, ids in (('insert', self.inserts), ('update', self.updates), ('delete', self.deletes)):
+			for product_id in ids[:limit]:
+				print(f'{prefix}  {kind} id={product_id}')
+			if len(ids) > limit:
+				print(f'{prefix}  ... and {len(ids) - limit} more to {kind}')
@@ -0,0 +1,93 @@
+"""
+synthetic_workbook.py
+
+Generate catalog spreadsheets of any size for benchmarking the import pipeline.
+
+The workbook has the headers the real supplier sheets use (`id`, `name`,
+`description`, `price_shipping_included`, `lego_pieces`) and `images` small
+PNGs embedded in the `pictures` column, spread evenly over the rows (several
+per row when there are more images than rows). Every image has distinct
+content, so the content-addressed store really writes each one. The workbook is
+written in openpyxl's write-only mode, so generating large sheets needs little
+memory. Output is deterministic for a given `seed`.
+
+Usage:
+  python backend/scripts/synthetic_workbook.py --rows 10000 --images 2000 --out /tmp/catalog.xlsx
+"""
+
+import argparse
+import io
+import random
+
+try:
+	from openpyxl import Workbook
+	from openpyxl.drawing.image import Image as XLImage
+except ImportError:
+	raise SystemExit('Please install openpyxl: pip install openpyxl')
+
+try:
+	from PIL import Image
+except ImportError:
+	raise SystemExit('Please install Pillow: pip install pillow')
+
+HEADERS = ('id', 'name', 'description', 'price_shipping_included', 'lego_pieces', 'pictures')
+PICTURES_COLUMN = 'F'
+THEMES = ('Technic', 'Star Wars', 'Marvel', 'City', 'Creator', 'Ideas', 'Icons', 'Speed Champions')
+DEFAULT_IMAGE_SIZE = 64
+
+
+def synthetic_rows(rows, seed=0):
+	"""Yield `rows` product rows in HEADERS order (without the picture cell)."""
+	rng = random.Random(seed)
+	for i in range(rows):
+		theme = THEMES[i % len(THEMES)]
+		set_number = 10000 + i
+		name = f'LEGO {theme} {set_number} Synthetic Set {i}'
+		description = f'{name}: ' + ' '.join(rng.choice(('bricks', 'minifigure', 'vehicle', 'castle', 'display', 'model'))
+			for _ in range(12))
+		price = f'{rng.uniform(5, 800):.2f}$'
+		yield (name, name, description, price, rng.randint(20, 9000))
+
+
+def synthetic_png(index, size=DEFAULT_IMAGE_SIZE):
+	# the index is encoded in the pixels so no two images hash the same
+	img = Image.new('RGB', (size, size), ((index * 37) % 256, (index * 91) % 256, (index * 53) % 256))
+	img.putpixel((0, 0), (index & 0xFF, (index >> 8) & 0xFF, (index >> 16) & 0xFF))
+	buf = io.BytesIO()
+	img.save(buf, format='PNG')
+	return buf.getvalue()
+
+
+def image_rows(rows, images):
+	"""Return the 0-based data row each image is anchored to."""
+	if rows <= 0:
+		return []
+	return [i * rows // images if images <= rows else i % rows for i in range(images)]
+
+
+def generate_workbook(out_path, rows, images=0, image_size=DEFAULT_IMAGE_SIZE, seed=0, sheet_title='Sheet1'):
+	"""Write a synthetic catalog to `out_path`; returns `(rows, images)` written."""
+	images = images if rows else 0
+	wb = Workbook(write_only=True)
+	ws = wb.create_sheet(sheet_title)
+	ws.append(list(HEADERS))
+	for row in synthetic_rows(rows, seed=seed):
+		ws.append(list(row) + [None])
+	for index, row_idx in enumerate(image_rows(rows, images)):
+		img = XLImage(io.BytesIO(synthetic_png(index, image_size)))
+		img.anchor = f'{PICTURES_COLUMN}{row_idx + 2}'  # +1 for the header, +1 for 1-based rows
+		ws.add_image(img)
+	wb.save(out_path)
+	return rows, images
+
+
+if __name__ == '__main__':
+	p = argparse.ArgumentParser(description='Generate a synthetic lego_products workbook')
+	p.add_argument('--rows', type=int, required=True, help='Number of product rows')
+	p.add_argument('--images', type=int, default=0, help='Number of embedded images (default: 0)')
+	p.add_argument('--image-size', type=int, default=DEFAULT_IMAGE_SIZE, help='Edge length of the PNGs in px (default: 64)')
+	p.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+	p.add_argument('--out', required=True, help='Where to write the .xlsx')
+	args = p.parse_args()
+	rows, images = generate_workbook(args.out, args.rows, args.images, image_size=args.image_size, seed=args.seed)
+	print(f'Wrote {args.out}: {rows} rows, {images} images')
@@ -5,72 +5,62 @@ This script scans public/uploads/products/<product_name>/ for image files and wr
 image URLs into pictures, pictures_1, ... pictures_4 columns by matching the folder name to
 the `name` column in the `lego_products` table (case-insensitive).
 
+All product names are loaded once and matched in memory; every picture update is applied in a
+single batched statement inside one transaction (see folder_images.py), and products whose
+pictures already match their folder are left out of it. A manifest in the uploads directory
+records what was already synced, so only folders that changed are re-processed.
+
 Usage:
-  python backend/scripts/update_db_images_by_name.py
+  python backend/scripts/update_db_images_by_name.py [--dry-run] [--full]
+  python backend/scripts/update_db_images_by_name.py --watch [--interval 30]   # keep syncing as folders change
 
-Make sure your DB settings in the script or environment variables are correct.
+DB settings come from the PG_* environment variables (or the repository .env), see db.py.
 """
-import os
-import psycopg2
+import argparse
 from pathlib import Path
 
-# DB config (pick from env or defaults)
-DB_CONFIG = {
-    'host': os.environ.get('PG_HOST', 'localhost'),
-    'port': os.environ.get('PG_PORT', '5432'),
-    'database': os.environ.get('PG_DATABASE', 'lego_store'),
-    'user': os.environ.get('PG_USER', 'postgres'),
-    'password': os.environ.get('PG_PASSWORD', 'Lego@store1234'),
-}
+import db
+from folder_images import DEFAULT_WATCH_INTERVAL, MANIFEST_NAME, sync_folder_images, watch_folder_images
+from schema import ensure_schema
 
 UPLOAD_BASE = Path(__file__).resolve().parents[2] / 'public' / 'uploads' / 'products'
 
-def find_images_for_folder(folder_path):
-    exts = {'.png', '.jpg', '.jpeg', '.webp', '.gif'}
-    files = [p for p in sorted(folder_path.iterdir()) if p.suffix.lower() in exts]
-    return [f"/uploads/products/{folder_path.name}/{p.name}" for p in files]
+def connect():
+    conn = db.connect('rescan')
+    ensure_schema(conn)
+    return conn
 
-def main():
+def main(dry_run=False, full=False):
     if not UPLOAD_BASE.exists():
         print('No uploads found at', UPLOAD_BASE)
         return
 
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-
-    for folder in UPLOAD_BASE.iterdir():
-        if not folder.is_dir():
-            continue
-        product_name = folder.name
-        urls = find_images_for_folder(folder)
-        if not urls:
-            print(f'No images in folder {folder}, skipping')
-            continue
-
-        # Find product by name (case-insensitive). Use exact match first, then ILIKE fallback.
-        cur.execute('SELECT id, name FROM lego_products WHERE name = %s', (product_name,))
-        row = cur.fetchone()
-        if not row:
-            cur.execute('SELECT id, name FROM lego_products WHERE name ILIKE %s LIMIT 1', (product_name,))
-            row = cur.fetchone()
-        if not row:
-            print(f'No product found matching name "{product_name}", skipping')
-            continue
+    def sync(conn):
+        ensure_schema(conn)
+        return sync_folder_images(conn, UPLOAD_BASE, dry_run=dry_run, manifest_path=UPLOAD_BASE / MANIFEST_NAME, full=full)
 
-        product_id = row[0]
-        values = [None] * 5
-        for i in range(min(5, len(urls))):
-            values[i] = urls[i]
+    try:
+        changed, updates, unmatched = db.run_with_retry(sync, stage='rescan')
+    finally:
+        db.close_pool()
 
-        cur.execute(
-            'UPDATE lego_products SET pictures=%s, pictures_1=%s, pictures_2=%s, pictures_3=%s, pictures_4=%s WHERE id=%s RETURNING id',
-            (*values, product_id)
-        )
-        print(f'Updated product {product_id} ({row[1]}) with {min(5,len(urls))} image(s)')
-        conn.commit()
-
-    cur.close()
-    conn.close()
+    if dry_run:
+        return
+    changed = set(changed)
+    for product_id, (name, urls) in updates.items():
+        if product_id in changed:
+            print(f'Updated product {product_id} ({name}) with {min(5, len(urls))} image(s)')
+    print(f'{len(changed)} product(s) updated, {len(updates) - len(changed)} already up to date, {len(unmatched)} folder(s) unmatched')
 
 if __name__ == '__main__':
-    main()
+    p = argparse.ArgumentParser()
+    p.add_argument('--dry-run', action='store_true', help='Print the planned updates without writing to the DB')
+    p.add_argument('--full', action='store_true', help='Re-process every folder, ignoring the scan manifest')
+    p.add_argument('--watch', action='store_true', help='Keep running and sync folders as they appear or change')
+    p.add_argument('--interval', type=float, default=DEFAULT_WATCH_INTERVAL, help='Seconds between polls in --watch mode (default: 30)')
+    args = p.parse_args()
+    if args.watch:
+        UPLOAD_BASE.mkdir(parents=True, exist_ok=True)
+        watch_folder_images(connect, UPLOAD_BASE, interval=args.interval)
+    else:
+        main(dry_run=args.dry_run, full=args.full)
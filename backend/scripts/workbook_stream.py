@@ -0,0 +1,116 @@
+"""
+workbook_stream.py
+
+Single-pass, read-only access to a product spreadsheet.
+
+`combined_script.py` used to parse the workbook twice: once with `pd.read_excel`
+for the DB rows and once with a full `load_workbook` for the embedded images.
+`WorkbookStream` opens the file once in openpyxl's read-only mode, normalizes the
+headers once and yields rows lazily, so memory stays bounded by the batch being
+processed. While rows stream past it records which product id sits on which
+sheet row; the image stage uses that map to place pictures anchored to a row,
+which it reads straight from the zip archive (see `xlsx_media.py`).
+
+`iter_chunks` hands the rows out in blocks for the vectorized column mapping
+(see `column_mapping.py`), for the single-workbook pipeline and the batch
+workers (see `batch_ingest.py`) alike.
+"""
+
+from openpyxl import load_workbook
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def normalize_header(value):
+	if value is None:
+		return None
+	return str(value).strip().replace(' ', '_').replace('\n', '_')
+
+
+def normalize_headers(values):
+	"""Normalize a header row the way `pd.read_excel` + the old column cleanup did:
+	blank headers become `Unnamed:_<n>` and repeated headers get `.1`, `.2`, ... suffixes,
+	skipping any suffixed name the row already holds, so every header is unique."""
+	raw = []
+	for idx, value in enumerate(values):
+		header = normalize_header(value)
+		raw.append(f'Unnamed:_{idx}' if header is None or header == '' else header)
+	taken = set(raw)
+	headers = []
+	seen = {}
+	for header in raw:
+		if header in seen:
+			n = seen[header]
+			while True:
+				n += 1
+				name = f'{header}.{n}'
+				if name not in taken:
+					break
+			seen[header] = n
+			taken.add(name)
+			header = name
+		else:
+			seen[header] = 0
+		headers.append(header)
+	return headers
+
+
+class WorkbookStream:
+	"""Open `xlsx_path` once and share it between the row and image stages.
+
+	Rows can only be iterated once; `drain()` finishes the pass for consumers that
+	only need the row -> id map (e.g. when DB inserts are skipped)."""
+
+	def __init__(self, xlsx_path, sheet_name=None, id_header='id'):
+		self.path = str(xlsx_path)
+		self._wb = load_workbook(self.path, read_only=True, data_only=True)
+		self._ws = self._wb[sheet_name] if sheet_name else self._wb.active
+		self.sheet_title = self._ws.title
+		self._rows = self._ws.iter_rows(values_only=True)
+		self.headers = normalize_headers(next(self._rows, ()))
+		self.id_header = normalize_header(id_header)
+		if self.id_header in self.headers:
+			self.id_col = self.headers.index(self.id_header)
+		else:
+			print(f"Warning: id header '{id_header}' not found in worksheet headers: {self.headers}")
+			self.id_col = 0
+		self.row_ids = {}
+		self.row_count = 0
+		self._consumed = False
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		self._wb.close()
+
+	def iter_chunks(self, size=DEFAULT_CHUNK_SIZE):
+		"""Yield `(sheet_row_numbers, rows)` for up to `size` non-blank data rows at a time.
+
+		Each row is a tuple of raw cell values, padded or cut to the header width."""
+		if self._consumed:
+			raise RuntimeError('WorkbookStream rows can only be iterated once')
+		self._consumed = True
+		width = len(self.headers)
+		numbers, rows = [], []
+		for row_number, values in enumerate(self._rows, start=2):
+			if all(v is None for v in values):
+				continue
+			self.row_count += 1
+			if self.id_col < len(values) and values[self.id_col] is not None:
+				self.row_ids[row_number] = str(values[self.id_col])
+			numbers.append(row_number)
+			rows.append(tuple(values[:width]) + (None,) * (width - len(values)))
+			if len(rows) >= size:
+				yield numbers, rows
+				numbers, rows = [], []
+		if rows:
+			yield numbers, rows
+
+	def drain(self):
+		if not self._consumed:
+			for _ in self.iter_chunks():
+				pass
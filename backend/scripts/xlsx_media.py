@@ -0,0 +1,164 @@
+"""
+xlsx_media.py
+
+Embedded images read straight from the xlsx package.
+
+An .xlsx file is a zip archive. The workbook part lists the sheets, each
+worksheet's relationships point at its drawing parts, and every picture in a
+drawing is an anchor (the cell it starts in) whose `r:embed` id resolves,
+through the drawing's own relationships, to a media part such as
+`xl/media/image3.jpeg`. `SheetMedia` follows that chain with `zipfile` and an
+incremental XML parse only: no workbook, cell or image object is loaded, and
+memory stays flat however many pictures the sheet holds.
+
+Entries come out as `MediaRef(row, part)` in drawing order; `open` streams a
+media part, so the stored file holds exactly the bytes Excel embedded, in their
+original format, and `ref.ext` is the part's extension for formats the bytes
+alone do not identify (see `image_store.store_image_stream`).
+
+	with SheetMedia('catalog.xlsx', 'Sheet1') as media:
+		for ref in media:
+			with media.open(ref) as src:
+				store_image_stream(src, row_ids[ref.row], upload_base, ext=ref.ext)
+"""
+
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+
+_ANCHORS = ('twoCellAnchor', 'oneCellAnchor', 'absoluteAnchor')
+
+
+def _local(tag):
+	return tag.rsplit('}', 1)[-1]
+
+
+def _attr(elem, name):
+	"""Attribute by local name, whatever namespace (transitional or strict OOXML) it is in."""
+	for key, value in elem.attrib.items():
+		if _local(key) == name:
+			return value
+	return None
+
+
+def _rels_path(part):
+	folder, name = posixpath.split(part)
+	return posixpath.join(folder, '_rels', name + '.rels')
+
+
+def read_rels(archive, part):
+	"""`{rel id: (type suffix, target part)}` of `part`; external targets are left out."""
+	path = _rels_path(part)
+	if path not in archive.NameToInfo:
+		return {}
+	rels = {}
+	with archive.open(path) as f:
+		for elem in ET.parse(f).getroot():
+			if _attr(elem, 'TargetMode') == 'External':
+				continue
+			target = _attr(elem, 'Target') or ''
+			if target.startswith('/'):
+				target = target.lstrip('/')
+			else:
+				target = posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+			rels[_attr(elem, 'Id')] = ((_attr(elem, 'Type') or '').rsplit('/', 1)[-1], target)
+	return rels
+
+
+def _workbook_part(archive):
+	for rel_type, target in read_rels(archive, '').values():
+		if rel_type == 'officeDocument':
+			return target
+	return 'xl/workbook.xml'
+
+
+def resolve_sheet(archive, sheet_name=None):
+	"""`(worksheet part, sheet title)` for `sheet_name`, or for the active sheet."""
+	workbook = _workbook_part(archive)
+	rels = read_rels(archive, workbook)
+	with archive.open(workbook) as f:
+		root = ET.parse(f).getroot()
+	sheets = [elem for elem in root.iter() if _local(elem.tag) == 'sheet']
+	if sheet_name is None:
+		views = [elem for elem in root.iter() if _local(elem.tag) == 'workbookView']
+		active = int(_attr(views[0], 'activeTab') or 0) if views else 0
+		chosen = sheets[min(active, len(sheets) - 1)] if sheets else None
+	else:
+		chosen = next((elem for elem in sheets if _attr(elem, 'name') == sheet_name), None)
+	if chosen is None:
+		raise KeyError(f'Worksheet {sheet_name} does not exist.')
+	return rels[_attr(chosen, 'id')][1], _attr(chosen, 'name')
+
+
+def iter_anchors(archive, drawing):
+	"""Yield `(1-based row or None, embed rel id)` for every picture in a drawing part."""
+	with archive.open(drawing) as f:
+		for _event, elem in ET.iterparse(f):
+			if _local(elem.tag) not in _ANCHORS:
+				continue
+			row = None
+			for child in elem:
+				if _local(child.tag) == 'from':
+					for field in child:
+						if _local(field.tag) == 'row' and field.text:
+							row = int(field.text) + 1
+			for node in elem.iter():
+				if _local(node.tag) == 'blip':
+					embed = _attr(node, 'embed')
+					if embed:
+						yield row, embed
+			elem.clear()
+
+
+class MediaRef:
+	"""An embedded picture: the sheet row it is anchored to (None if absolute) and its media part."""
+
+	__slots__ = ('row', 'part')
+
+	def __init__(self, row, part):
+		self.row = row
+		self.part = part
+
+	@property
+	def ext(self):
+		"""Lower-cased extension of the media part ('.emf', '.jpeg', ...), or None."""
+		return posixpath.splitext(self.part)[1].lower() or None
+
+
+class SheetMedia:
+	"""The pictures embedded in one worksheet of `xlsx_path` (the active one by default).
+
+	The archive stays open until `close()`; `open()` may be called from several
+	threads at once."""
+
+	def __init__(self, xlsx_path, sheet_name=None):
+		self.path = str(xlsx_path)
+		self._archive = zipfile.ZipFile(self.path)
+		try:
+			self.sheet_part, self.sheet_title = resolve_sheet(self._archive, sheet_name)
+		except BaseException:
+			self._archive.close()
+			raise
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		self._archive.close()
+
+	def __iter__(self):
+		for rel_type, drawing in read_rels(self._archive, self.sheet_part).values():
+			if rel_type != 'drawing' or drawing not in self._archive.NameToInfo:
+				continue
+			targets = read_rels(self._archive, drawing)
+			for row, embed in iter_anchors(self._archive, drawing):
+				kind, part = targets.get(embed, (None, None))
+				if kind == 'image' and part in self._archive.NameToInfo:
+					yield MediaRef(row, part)
+
+	def open(self, ref):
+		"""Binary file object streaming the media part of `ref`."""
+		return self._archive.open(ref.part)
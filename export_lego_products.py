@@ -1,27 +1,49 @@
-import pandas as pd
-import psycopg2
+"""
+Export the lego_products table to JSON.
 
-DB_CONFIG = {
-    "host": "localhost",
-    "port": "5432",
-    "database": "lego_store",
-    "user": "postgres",
-    "password": "Lego@store1234"
-}
+Rows are streamed through a server-side cursor and written incrementally (see
+backend/scripts/catalog_export.py), so memory stays flat regardless of catalog size.
 
-# Connect to PostgreSQL and fetch data
-def fetch_and_save_json():
+Usage:
+  python export_lego_products.py [--out lego_products_export.json] [--format json|ndjson] [--gzip]
+  python export_lego_products.py --delta [--compact]   # only rows changed since the last export
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend" / "scripts"))
+import db  # noqa: E402  (shared DB settings/pool, reads PG_* env vars)
+from catalog_export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, compact, export_delta, output_path, stream_export  # noqa: E402
+
+# Connect to PostgreSQL and stream the table to disk
+def fetch_and_save_json(out_path="lego_products_export.json", fmt="json", compress=False, chunk_size=DEFAULT_CHUNK_SIZE, delta=False):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        query = "SELECT * FROM lego_products;"
-        df = pd.read_sql_query(query, conn)
-        df.to_json("lego_products_export.json", orient="records", indent=2)
-        print("Data exported to lego_products_export.json")
+        if delta:
+            delta_path, count = db.run_with_retry(
+                lambda conn: export_delta(conn, output_path(out_path, compress), chunk_size=chunk_size), stage="export"
+            )
+            print(f"Delta exported to {delta_path} ({count} rows)" if delta_path else "No changes since the last export")
+            return
+        written_path, count = db.run_with_retry(
+            lambda conn: stream_export(conn, out_path, fmt=fmt, compress=compress, chunk_size=chunk_size), stage="export"
+        )
+        print(f"Data exported to {written_path} ({count} rows)")
     except Exception as e:
         print("Error:", e)
     finally:
-        if 'conn' in locals():
-            conn.close()
+        db.close_pool()
 
 if __name__ == "__main__":
-    fetch_and_save_json()
+    p = argparse.ArgumentParser(description="Export lego_products to JSON")
+    p.add_argument("--out", default="lego_products_export.json", help="Output path (default: lego_products_export.json)")
+    p.add_argument("--format", choices=EXPORT_FORMATS, default="json", help="json (compact array) or ndjson (one record per line)")
+    p.add_argument("--gzip", action="store_true", help="gzip-compress the output (appends .gz)")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows fetched per round trip")
+    p.add_argument("--delta", action="store_true", help="Only export rows changed since the last export")
+    p.add_argument("--compact", action="store_true", help="Merge pending delta files into the snapshot")
+    args = p.parse_args()
+    fetch_and_save_json(args.out, fmt=args.format, compress=args.gzip, chunk_size=args.chunk_size, delta=args.delta)
+    if args.compact:
+        count = compact(output_path(args.out, args.gzip))
+        print(f"Compacted deltas into {output_path(args.out, args.gzip)} ({count} rows)")
@@ -1,77 +1,55 @@
+"""
+Import lego_products_export.json into the lego_products table.
 
-import json
-import psycopg2
-import uuid
+The export (a JSON array or NDJSON file, optionally gzipped) is parsed incrementally and its records are
+COPYed batch by batch into a temporary staging table while the file is still being read, so memory stays
+bounded regardless of the export size. The staged rows are then merged into lego_products in the same
+transaction (changed rows updated, new rows inserted, products missing from the export deleted; see
+backend/scripts/bulk_load.py). The storefront keeps reading the previous catalog until the commit,
+so it never sees an empty or half-filled table, and unchanged rows are not rewritten.
 
-# === PostgreSQL connection configuration ===
-DB_CONFIG = {
-    "host": "localhost",
-    "port": "5432",
-    "database": "lego_store",
-    "user": "postgres",
-    "password": "Lego@store1234"  # <-- Updated password to match docker-compose.yml
-}
-
-# === Step 1: Read JSON file ===
-with open("/workspaces/store/lego_products_export.json", "r") as f:
-    products = json.load(f)
-
-# === Step 2: Connect to PostgreSQL ===
-try:
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    print("Connected to PostgreSQL successfully.")
-except Exception as e:
-    print("Database connection failed:", e)
-    exit()
-
-# === Step 3: Create table (if not exists) ===
-create_table_query = """
-CREATE TABLE IF NOT EXISTS lego_products (
-    id TEXT PRIMARY KEY,
-    name TEXT,
-    pictures TEXT,
-    pictures_1 TEXT,
-    pictures_2 TEXT,
-    pictures_3 TEXT,
-    pictures_4 TEXT,
-    description TEXT,
-    price_shipping_included TEXT,
-    lego_pieces INTEGER
-);
-"""
-cursor.execute(create_table_query)
-conn.commit()
-print("lego_products table is ready.")
-
-# === Step 4: Insert data ===
-cursor.execute("DELETE FROM lego_products;")  # Clear old data for fresh import
-insert_query = """
-    INSERT INTO lego_products (
-        id, name, pictures, pictures_1, pictures_2, pictures_3, pictures_4,
-        description, price_shipping_included, lego_pieces
-    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);
+Usage:
+  python import_lego_products.py [--input lego_products_export.json]
 """
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend" / "scripts"))
+import db  # noqa: E402  (shared DB settings, reads PG_* env vars / .env)
+from catalog_facets import parse_price, refresh_facets  # noqa: E402
+from bulk_load import DEFAULT_BATCH_SIZE, PRODUCT_COLUMNS, create_stage, merge_stage, stage_rows  # noqa: E402
+from json_stream import read_json_records  # noqa: E402
+from schema import create_table_if_not_exists  # noqa: E402
 
-for product in products:
-    # Ensure each product has a unique UUID
+DEFAULT_INPUT = Path(__file__).resolve().parent / "lego_products_export.json"
+# every column but the id is refreshed from the export
+IMPORT_UPDATE_COLUMNS = PRODUCT_COLUMNS[1:]
+
+
+def img_url(name, idx=None):
+    base = name.replace(" ", "+")
+    if idx is None:
+        return f"https://via.placeholder.com/280x280?text={base}"
+    else:
+        return f"https://via.placeholder.com/280x280?text={base}+{idx}"
+
+
+def product_row(product):
+    # Ensure each product has a UUID; derive it from the exported id so re-imports keep the same one
     product_id = product.get("id")
     try:
         uuid.UUID(product_id)
     except Exception:
-        product_id = str(uuid.uuid4())
+        product_id = str(uuid.uuid5(uuid.NAMESPACE_URL, str(product_id))) if product_id else str(uuid.uuid4())
     # Ensure image URLs are present
-    def img_url(name, idx=None):
-        base = name.replace(" ", "+")
-        if idx is None:
-            return f"https://via.placeholder.com/280x280?text={base}"
-        else:
-            return f"https://via.placeholder.com/280x280?text={base}+{idx}"
     for i in range(5):
         key = "pictures" if i == 0 else f"pictures_{i}"
         if not product.get(key) or product.get(key) == "NaN":
             product[key] = img_url(product["name"], None if i == 0 else i)
-    cursor.execute(insert_query, (
+    return (
         product_id,
         product.get("name"),
         product.get("pictures"),
@@ -81,13 +59,54 @@ for product in products:
         product.get("pictures_4"),
         product.get("description"),
         product.get("price_shipping_included"),
-        int(product.get("lego_pieces")) if product.get("lego_pieces") else None
-    ))
+        int(product.get("lego_pieces")) if product.get("lego_pieces") else None,
+        parse_price(product.get("price_shipping_included")),
+    )
+
+
+def import_products(conn, products, batch_size=DEFAULT_BATCH_SIZE):
+    # === Step 3: Create table (if not exists) ===
+    create_table_if_not_exists(conn)
+    print("lego_products table is ready.")
+
+    # === Step 4: Stage and swap in one transaction ===
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    create_stage(cursor)
+    staged = stage_rows(cursor, (product_row(p) for p in products), batch_size=batch_size)
+    inserted, updated, deleted = merge_stage(cursor, update_columns=IMPORT_UPDATE_COLUMNS, prune=True)
+    conn.commit()
+    cursor.close()
+    elapsed = time.perf_counter() - started
+    print(f"Staged {staged} rows in {elapsed:.2f}s: {inserted} inserted, {updated} updated, {deleted} deleted.")
+
+    # === Step 5: Refresh the storefront filter facets ===
+    refresh_facets(conn)
+    return staged
+
+
+def main():
+    p = argparse.ArgumentParser(description="Import a lego_products JSON export")
+    p.add_argument("--input", default=str(DEFAULT_INPUT), help="JSON array or NDJSON export to import, .gz allowed (default: lego_products_export.json)")
+    p.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per COPY batch")
+    args = p.parse_args()
+
+    # === Step 1: Connect to PostgreSQL ===
+    try:
+        conn = db.connect("import")
+        print("Connected to PostgreSQL successfully.")
+    except Exception as e:
+        print("Database connection failed:", e)
+        sys.exit(1)
+
+    try:
+        # === Step 2: Stream the JSON file (records are staged batch by batch as they are parsed) ===
+        import_products(conn, read_json_records(args.input), batch_size=args.batch_size)
+    finally:
+        # === Step 6: Close connection ===
+        conn.close()
+        print("PostgreSQL connection closed successfully.")
 
-conn.commit()
-print(f"Inserted {len(products)} rows into lego_products table.")
 
-# === Step 5: Close connection ===
-cursor.close()
-conn.close()
-print("PostgreSQL connection closed successfully.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from openpyxl import load_workbook
+
+from batch_ingest import SEQ_BITS, discover_workbooks, is_batch_source, parse_sheet, sheet_tasks
+from synthetic_workbook import generate_workbook, image_rows
+
+
+def test_is_batch_source(tmp_path):
+	assert is_batch_source(str(tmp_path))
+	assert is_batch_source('drops/*.xlsx')
+	assert is_batch_source('drops/catalog-[12].xlsx')
+	assert not is_batch_source(str(tmp_path / 'catalog.xlsx'))
+
+
+def test_discover_workbooks(tmp_path):
+	for name in ('b.xlsx', 'a.XLSM', 'sub/c.xlsx', '~$b.xlsx', 'notes.txt', 'dir.xlsx/d.xlsx'):
+		path = tmp_path / name
+		path.parent.mkdir(parents=True, exist_ok=True)
+		path.write_bytes(b'')
+
+	found = [p.relative_to(tmp_path).as_posix() for p in discover_workbooks(str(tmp_path))]
+	globbed = [p.name for p in discover_workbooks(str(tmp_path / '*.xlsx'))]
+
+	assert found == ['a.XLSM', 'b.xlsx', 'dir.xlsx/d.xlsx', 'sub/c.xlsx']
+	assert globbed == ['b.xlsx']
+
+
+def test_sheet_tasks(tmp_path):
+	path = tmp_path / 'catalog.xlsx'
+	generate_workbook(path, rows=1, sheet_title='First')
+	wb = load_workbook(path)
+	wb.create_sheet('Second')
+	wb.save(path)
+
+	assert sheet_tasks([path, path], sheet_name='First') == ([(0, str(path), 'First'), (1, str(path), 'First')], [])
+	assert sheet_tasks([path], all_sheets=True) == ([(0, str(path), 'First'), (1, str(path), 'Second')], [])
+
+
+def test_sheet_tasks_reports_unreadable_workbooks(tmp_path):
+	good = tmp_path / 'good.xlsx'
+	generate_workbook(good, rows=1, sheet_title='First')
+	corrupt = tmp_path / 'corrupt.xlsx'
+	corrupt.write_bytes(b'not a zip')
+
+	tasks, failed = sheet_tasks([corrupt, good], all_sheets=True)
+
+	assert tasks == [(0, str(good), 'First')]
+	assert [(r['workbook'], r['sheet']) for r in failed] == [(str(corrupt), None)]
+	assert failed[0]['error'].startswith('BadZipFile')
+
+
+def test_parse_sheet_spools_rows_and_stores_images(tmp_path):
+	path = tmp_path / 'catalog.xlsx'
+	generate_workbook(path, rows=6, images=3, image_size=8)
+	upload_base = tmp_path / 'uploads'
+
+	result = parse_sheet((3, str(path), None), 'id', tmp_path, upload_base)
+
+	lines = open(result['spool'], encoding='utf-8').read().splitlines()
+	assert result['rows'] == len(lines) == 6
+	assert [int(line.rsplit('\t', 1)[1]) for line in lines] == [(3 << SEQ_BITS) + i for i in range(6)]
+	assert result['rejected'].empty and result['errors'] == []
+	ids = [line.split('\t', 1)[0] for line in lines]
+	assert [product_id for product_id, _url in result['pictures']] == [ids[row] for row in image_rows(6, 3)]
+	assert result['images_written'] == 3
+	for _product_id, url in result['pictures']:
+		assert (upload_base / url.removeprefix('/uploads/products/')).is_file()
+
+
+def test_parse_sheet_dry_run_writes_no_images(tmp_path):
+	path = tmp_path / 'catalog.xlsx'
+	generate_workbook(path, rows=4, images=2, image_size=8)
+	upload_base = tmp_path / 'uploads'
+
+	result = parse_sheet((0, str(path), 'Sheet1'), 'id', tmp_path, upload_base, dry_run=True)
+
+	assert len(result['pictures']) == 2 and result['bytes_written'] == 0
+	assert not upload_base.exists()
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from bulk_load import copy_batch, copy_text, copy_value, iter_batches
+
+
+@pytest.mark.parametrize('value, expected', [
+	(None, '\\N'),
+	(float('nan'), '\\N'),
+	('plain', 'plain'),
+	('tab\there', 'tab\\there'),
+	('two\nlines', 'two\\nlines'),
+	('carriage\rreturn', 'carriage\\rreturn'),
+	('back\\slash', 'back\\\\slash'),
+	('\\N', '\\\\N'),
+	('\\\t', '\\\\\\t'),
+	(42, '42'),
+])
+def test_copy_value(value, expected):
+	assert copy_value(value) == expected
+
+
+def test_copy_text_matches_the_row_serialization():
+	rows = [
+		('a', 'tab\tname', 'line\nbreak', 3),
+		('b', 'back\\slash', None, None),
+		('c', '\\N', 'carriage\rreturn', 0),
+	]
+	frame = pd.DataFrame(rows, columns=['id', 'name', 'description', 'lego_pieces']).astype(
+		{'lego_pieces': 'Int64'}
+	)
+
+	expected = ''.join('\t'.join(copy_value(v) for v in row) + '\n' for row in rows)
+	assert copy_text(frame) == expected
+
+
+def test_copy_text_keeps_one_line_per_row():
+	frame = pd.DataFrame({'id': ['a', 'b'], 'name': ['x\ny\r\nz', '\t']})
+
+	lines = copy_text(frame).split('\n')
+
+	assert lines == ['a\tx\\ny\\r\\nz', 'b\t\\t', '']
+
+
+def test_copy_text_of_an_empty_frame():
+	assert copy_text(pd.DataFrame(columns=['id', 'name'])) == ''
+
+
+class RecordingCursor:
+	def copy_expert(self, query, file, size=8192):
+		self.query = query
+		self.data = file.read()
+
+
+def test_copy_batch_streams_escaped_rows():
+	cur = RecordingCursor()
+
+	copy_batch(cur, 'lego_products_stage', ('id', 'name'), [('a', 'x\ty'), ('b', None)])
+
+	assert cur.data == 'a\tx\\ty\nb\t\\N\n'
+	assert 'lego_products_stage' in repr(cur.query)
+
+
+def test_iter_batches():
+	assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+	assert list(iter_batches([], 2)) == []
@@ -0,0 +1,95 @@
+import io
+import json
+
+import pytest
+
+import catalog_export
+from catalog_export import DELETED_FIELD, compact, iter_records, read_json_records, write_records, write_state
+
+
+class FakeCursor:
+	def __init__(self, columns, rows):
+		self.description = [(name,) for name in columns]
+		self._rows = rows
+
+	def execute(self, query, params=None):
+		pass
+
+	def __iter__(self):
+		return iter(self._rows)
+
+	def close(self):
+		pass
+
+
+class FakeConnection:
+	def __init__(self, columns, rows):
+		self._cursor = FakeCursor(columns, rows)
+
+	def cursor(self, name=None):
+		return self._cursor
+
+
+def _export(path, records, deltas):
+	with open(path, 'w', encoding='utf-8') as fp:
+		write_records(records, fp, 'ndjson')
+	names = []
+	for n, delta in enumerate(deltas, 1):
+		name = f'{path.name}.delta-{n:06d}.ndjson'
+		with open(path.with_name(name), 'w', encoding='utf-8') as fp:
+			write_records(delta, fp, 'ndjson')
+		names.append(name)
+	write_state(path, {'format': 'ndjson', 'snapshot': '10:10:', 'delta_seq': len(names), 'deltas': names})
+
+
+def test_iter_records_leaves_out_bookkeeping_columns():
+	conn = FakeConnection(['id', 'row_xid', 'name'], [('a', 7, 'A'), ('b', 8, 'B')])
+
+	assert list(iter_records(conn)) == [{'id': 'a', 'name': 'A'}, {'id': 'b', 'name': 'B'}]
+
+
+@pytest.mark.parametrize('fmt', catalog_export.EXPORT_FORMATS)
+def test_write_records_round_trips(tmp_path, fmt):
+	records = [{'id': 'a', 'price': 1}, {'id': 'b', 'price': None}]
+	path = tmp_path / 'export.json'
+	with open(path, 'w', encoding='utf-8') as fp:
+		assert write_records(records, fp, fmt) == 2
+
+	assert list(read_json_records(path)) == records
+
+
+def test_write_records_rejects_unknown_format():
+	with pytest.raises(ValueError):
+		write_records([], io.StringIO(), 'csv')
+
+
+def test_compact_applies_updates_creates_and_deletes(tmp_path):
+	path = tmp_path / 'export.json'
+	_export(path, [{'id': 'a', 'v': 1}, {'id': 'b', 'v': 1}, {'id': 'c', 'v': 1}], [
+		[{'id': 'b', 'v': 2}, {'id': 'd', 'v': 1}, {'id': 'c', DELETED_FIELD: True}],
+		[{'id': 'd', DELETED_FIELD: True}, {'id': 'e', 'v': 1}],
+	])
+
+	assert compact(path) == 3
+
+	assert list(read_json_records(path)) == [{'id': 'a', 'v': 1}, {'id': 'b', 'v': 2}, {'id': 'e', 'v': 1}]
+	assert not list(tmp_path.glob('*.delta-*'))
+	assert json.loads((tmp_path / 'export.json.state.json').read_text())['deltas'] == []
+
+
+def test_compact_keeps_a_product_recreated_after_its_delete(tmp_path):
+	path = tmp_path / 'export.json'
+	_export(path, [{'id': 'a', 'v': 1}], [[{'id': 'a', DELETED_FIELD: True}], [{'id': 'a', 'v': 2}]])
+
+	compact(path)
+
+	assert list(read_json_records(path)) == [{'id': 'a', 'v': 2}]
+
+
+def test_delta_needs_a_snapshot_state(tmp_path):
+	path = tmp_path / 'export.json'
+	path.write_text('[]\n')
+	write_state(path, {'format': 'json', 'watermark': 5, 'deltas': []})
+
+	with pytest.raises(RuntimeError, match='full export'):
+		catalog_export.export_delta(None, path)
@@ -0,0 +1,38 @@
+from decimal import Decimal
+
+import pytest
+
+from catalog_facets import PRICE_BUCKETS, _bucket_labels, parse_price
+
+
+@pytest.mark.parametrize('raw, expected', [
+	('50$', '50.00'),
+	('$1,299.99', '1299.99'),
+	('1.299,00 EUR', '1299.00'),
+	('1,299 €', '1299.00'),
+	('1.299 €', '1299.00'),
+	('12.500.000', '12500000.00'),
+	('1,299,000', '1299000.00'),
+	('12,5', '12.50'),
+	('12,50 €', '12.50'),
+	('12.5', '12.50'),
+	('12.50', '12.50'),
+	('0.999', '1.00'),
+	('1.2999', '1.30'),
+	('-1.299', '-1299.00'),
+	(49.999, '50.00'),
+	(1299, '1299.00'),
+	(Decimal('1.299'), '1.30'),
+])
+def test_parse_price(raw, expected):
+	assert parse_price(raw) == Decimal(expected)
+
+
+@pytest.mark.parametrize('raw', [None, True, float('nan'), '', 'free', 'N/A', '1.2.3', '99999999999', 1e20])
+def test_parse_price_without_a_usable_amount(raw):
+	assert parse_price(raw) is None
+
+
+def test_bucket_labels():
+	assert _bucket_labels(PRICE_BUCKETS) == ['0-25', '25-50', '50-100', '100-200', '200-500', '500+']
+	assert _bucket_labels((0,)) == ['0+']
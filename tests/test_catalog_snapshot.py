@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import json
+
+import pytest
+
+import catalog_snapshot
+from catalog_snapshot import ID_SHARD_CHARS, MANIFEST_NAME, etag, id_shard, prune_versions, read_manifest, write_snapshot
+
+
+class FakeCursor:
+	def __init__(self, rows):
+		self.description = [('id',), ('name',)]
+		self._rows = rows
+
+	def execute(self, query, params=None):
+		pass
+
+	def __iter__(self):
+		return iter(self._rows)
+
+	def close(self):
+		pass
+
+
+class FakeConnection:
+	def __init__(self, rows):
+		self.rows = rows
+
+	def cursor(self, name=None):
+		return FakeCursor(self.rows)
+
+
+@pytest.fixture(autouse=True)
+def gzip_only(monkeypatch):
+	# the manifests must not depend on whether brotli happens to be installed
+	monkeypatch.setattr(catalog_snapshot, 'brotli', None)
+
+
+def _products(n):
+	return [(f'p{i:03d}', f'Set {i}') for i in range(n)]
+
+
+def test_etag_and_id_shard():
+	assert etag(b'abc') == '"' + hashlib.sha256(b'abc').hexdigest()[:32] + '"'
+	assert id_shard(42) == id_shard('42') == hashlib.sha256(b'42').hexdigest()[:ID_SHARD_CHARS]
+
+
+def test_snapshot_files_match_the_manifest(tmp_path):
+	manifest = write_snapshot(FakeConnection(_products(25)), tmp_path, page_size=10)
+
+	assert manifest['changed'] and manifest['rows'] == 25
+	root = tmp_path / manifest['version']
+	assert [(p['rows'], p['first_id'], p['last_id']) for p in manifest['pages']] == [
+		(10, 'p000', 'p009'), (10, 'p010', 'p019'), (5, 'p020', 'p024'),
+	]
+	entries = manifest['pages'] + list(manifest['id_shards']['shards'].values())
+	for entry in entries:
+		data = (root / entry['path']).read_bytes()
+		assert entry['etag'] == etag(data) and entry['bytes'] == len(data)
+		assert gzip.decompress((root / entry['encodings']['gzip']['path']).read_bytes()) == data
+	ids = {}
+	for shard, entry in manifest['id_shards']['shards'].items():
+		records = json.loads((root / entry['path']).read_text())
+		assert {id_shard(pid) for pid in records} == {shard}
+		ids.update(records)
+	assert ids['p007'] == {'id': 'p007', 'name': 'Set 7'}
+	assert len(ids) == 25
+	assert json.loads((root / MANIFEST_NAME).read_text()) == read_manifest(tmp_path)
+
+
+def test_unchanged_catalog_keeps_its_version(tmp_path):
+	first = write_snapshot(FakeConnection(_products(5)), tmp_path)
+	again = write_snapshot(FakeConnection(_products(5)), tmp_path)
+	changed = write_snapshot(FakeConnection(_products(6)), tmp_path)
+
+	assert not again['changed'] and again['version'] == first['version']
+	assert changed['changed'] and changed['etag'] != first['etag']
+	assert read_manifest(tmp_path)['version'] == changed['version']
+	assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == sorted([first['version'], changed['version']])
+
+
+def test_prune_versions_keeps_the_newest(tmp_path):
+	for name in ('20260101T000000000000Z', '20260102T000000000000Z', '20260103T000000000000Z', '.tmp-x'):
+		(tmp_path / name).mkdir()
+	(tmp_path / MANIFEST_NAME).write_text('{}')
+
+	assert prune_versions(tmp_path, keep=2) == ['20260101T000000000000Z']
+	assert sorted(p.name for p in tmp_path.iterdir()) == [
+		'.tmp-x', '20260102T000000000000Z', '20260103T000000000000Z', MANIFEST_NAME,
+	]
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import pandas as pd
+
+from bulk_load import PRODUCT_COLUMNS
+from column_mapping import ColumnMapping, RejectReport
+
+
+def _frame(headers, rows, first_row=2):
+	return pd.DataFrame.from_records(rows, columns=headers, index=range(first_row, first_row + len(rows)))
+
+
+def test_aliases_are_coalesced_left_to_right():
+	headers = ['ID', 'Name', 'pictures', 'pictures.1', 'price+shipping_included', 'Price', 'LEGO_pieces']
+	frame = _frame(headers, [
+		('1', 'Ferrari', '/a.png', '/b.png', '1.299 €', None, 1677),
+		('2', 'Bugatti', None, None, '  ', '$379.99', '3599'),
+	])
+
+	batch = ColumnMapping(headers).apply(frame)
+
+	assert list(batch.rows.columns) == list(PRODUCT_COLUMNS)
+	assert batch.tuples() == [
+		('1', 'Ferrari', '/a.png', '/b.png', None, None, None, None, '1.299 €', 1677, Decimal('1299.00')),
+		('2', 'Bugatti', None, None, None, None, None, None, '$379.99', 3599, Decimal('379.99')),
+	]
+	assert batch.rejected.empty
+
+
+def test_id_header_takes_precedence_and_missing_ids_get_a_uuid():
+	headers = ['Name', 'sku']
+	frame = _frame(headers, [('Ferrari', 'F-42143'), ('Bugatti', None), ('nan', ' ')])
+
+	batch = ColumnMapping(headers, id_header='sku').apply(frame)
+
+	ids = list(batch.rows['id'])
+	assert ids[0] == 'F-42143'
+	assert ids[1] == 'Bugatti'
+	assert len(ids[2]) == 36 and ids[2] != ids[1]
+
+
+def test_invalid_piece_counts_are_rejected_with_their_sheet_row():
+	headers = ['id', 'name', 'lego_pieces']
+	frame = _frame(headers, [('a', 'A', '12'), ('b', 'B', '-1'), ('c', 'C', '1.5'), ('d', 'D', 'many'), ('e', 'E', '')])
+
+	batch = ColumnMapping(headers).apply(frame)
+
+	assert list(batch.rows['id']) == ['a', 'e']
+	assert list(batch.rows.index) == [2, 6]
+	assert batch.rejected[['row', 'id', 'column', 'value']].values.tolist() == [
+		[3, 'b', 'lego_pieces', '-1'],
+		[4, 'c', 'lego_pieces', '1.5'],
+		[5, 'd', 'lego_pieces', 'many'],
+	]
+
+
+def test_reject_report_writes_csv(tmp_path):
+	headers = ['id', 'lego_pieces']
+	report = RejectReport()
+	report.add(ColumnMapping(headers).apply(_frame(headers, [('a', 'x')])).rejected, workbook='w.xlsx', sheet='S')
+	report.add(ColumnMapping(headers).apply(_frame(headers, [('b', '1')])).rejected, workbook='w.xlsx', sheet='S')
+	path = tmp_path / 'rejects.csv'
+
+	report.write(path)
+
+	assert report.count == 1
+	assert path.read_text().splitlines() == [
+		'workbook,sheet,row,id,column,value,reason',
+		'w.xlsx,S,2,a,lego_pieces,x,not a whole number >= 0',
+	]
@@ -0,0 +1,35 @@
+import combined_script
+
+
+def _stages(*argv):
+	args = combined_script.build_parser().parse_args(list(argv))
+	args.batch = False
+	return {stage.name: stage for stage in combined_script.pipeline_stages(args)}
+
+
+def test_catalog_readers_wait_for_every_write():
+	stages = _stages('--xlsx', 'catalog.xlsx', '--update-db')
+
+	for name in ('export', 'snapshot', 'search'):
+		assert {'ingest', 'pictures', 'rescan', 'facets'} <= set(stages[name].deps)
+
+
+def _args(*argv):
+	return combined_script.build_parser().parse_args(list(argv))
+
+
+def test_options_before_and_after_the_subcommand():
+	for argv in (('--xlsx', 'c.xlsx', '--id-header', 'Name', 'ingest'), ('ingest', '--xlsx', 'c.xlsx', '--id-header', 'Name')):
+		args = _args(*argv)
+		assert (args.command, args.xlsx, args.id_header) == ('ingest', 'c.xlsx', 'Name')
+
+
+def test_subcommand_keeps_root_defaults():
+	args = _args('export')
+
+	assert args.export_path == 'lego_products_export.json'
+	assert args.dry_run is False
+	assert args.batch_size == combined_script.DEFAULT_BATCH_SIZE
+
+	args = _args('--batch-size', '7', 'import-json', '--input', 'x.json')
+	assert (args.batch_size, args.input) == (7, 'x.json')
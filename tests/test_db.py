@@ -0,0 +1,152 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import psycopg2
+import psycopg2.errorcodes
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+import db
+
+
+class FakeConnection:
+	closed = 0
+	info = SimpleNamespace(transaction_status=psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+	def close(self):
+		self.closed = 1
+
+
+@pytest.fixture
+def fake_connect(monkeypatch):
+	monkeypatch.setattr(psycopg2.pool.psycopg2, 'connect', lambda *args, **kwargs: FakeConnection())
+
+
+def test_exhausted_pool_waits_for_a_connection(fake_connect):
+	pool = db.BlockingPool(1, 2, timeout=5)
+	held = [pool.getconn(), pool.getconn()]
+	got = []
+	waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+	waiter.start()
+	time.sleep(0.1)
+	assert not got
+
+	pool.putconn(held[0])
+	waiter.join(5)
+
+	assert got == [held[0]]
+
+
+def test_exhausted_pool_times_out(fake_connect):
+	pool = db.BlockingPool(1, 1, timeout=0.05)
+	pool.getconn()
+
+	with pytest.raises(psycopg2.pool.PoolError, match='PG_POOL_SIZE'):
+		pool.getconn()
+	assert not db.is_transient(psycopg2.pool.PoolError('x'))
+
+
+def test_discarded_connections_free_their_slot(fake_connect):
+	pool = db.BlockingPool(1, 1, timeout=0.05)
+	pool.putconn(pool.getconn(), close=True)
+
+	assert pool.getconn() is not None
+
+
+@pytest.mark.parametrize('query, kind', [
+	('SELECT 1', 'SELECT'),
+	('  (select id from t) union (select 2)', 'SELECT'),
+	('EXECUTE upsert_product (%s, %s)', 'EXECUTE upsert_product'),
+	('PREPARE lookup(text) AS SELECT 1', 'PREPARE lookup'),
+	(b'COPY lego_products FROM STDIN', 'COPY'),
+	('', 'EMPTY'),
+])
+def test_statement_class(query, kind):
+	assert db.statement_class(query) == kind
+
+
+def test_stage_timeout(monkeypatch):
+	monkeypatch.delenv('PG_STATEMENT_TIMEOUT_RESCAN', raising=False)
+	assert db.stage_timeout('rescan') == db.STAGE_TIMEOUTS['rescan']
+	assert db.stage_timeout(None) is None
+	monkeypatch.setenv('PG_STATEMENT_TIMEOUT_RESCAN', '0')
+	assert db.stage_timeout('rescan') == '0'
+
+
+class FakePgError(psycopg2.Error):
+	def __init__(self, pgcode=None):
+		super().__init__('boom')
+		self._code = pgcode
+
+	@property
+	def pgcode(self):
+		return self._code
+
+
+def test_transient_errors():
+	assert db.is_transient(psycopg2.OperationalError('server closed the connection'))
+	assert db.is_transient(FakePgError(psycopg2.errorcodes.SERIALIZATION_FAILURE))
+	assert not db.is_transient(FakePgError(psycopg2.errorcodes.UNIQUE_VIOLATION))
+	assert not db.is_transient(psycopg2.ProgrammingError('syntax error'))
+	assert db.is_transient(psycopg2.errors.SerializationFailure('could not serialize access'))
+	assert db.is_transient(psycopg2.errors.AdminShutdown('terminating connection'))
+
+
+@pytest.mark.parametrize('error', [
+	psycopg2.errors.QueryCanceled('canceling statement due to statement timeout'),
+	psycopg2.errors.DiskFull('could not extend file'),
+	psycopg2.errors.OutOfMemory('out of memory'),
+	psycopg2.errors.LockNotAvailable('could not obtain lock'),
+	FakePgError(psycopg2.errorcodes.QUERY_CANCELED),
+])
+def test_failing_statements_are_not_retried(monkeypatch, error):
+	monkeypatch.setattr(db.time, 'sleep', lambda seconds: None)
+	calls = []
+
+	def timed_out():
+		calls.append(1)
+		raise error
+
+	assert not db.is_transient(error)
+	with pytest.raises(type(error)):
+		db._retrying(timed_out, 'test')
+	assert len(calls) == 1
+
+
+def test_retrying_repeats_only_transient_errors(monkeypatch):
+	monkeypatch.setattr(db.time, 'sleep', lambda seconds: None)
+	calls = []
+
+	def flaky():
+		calls.append(1)
+		if len(calls) < 3:
+			raise psycopg2.OperationalError('connection reset')
+		return 'ok'
+
+	assert db._retrying(flaky, 'test') == 'ok'
+	assert len(calls) == 3
+
+	def broken():
+		calls.append(1)
+		raise FakePgError(psycopg2.errorcodes.UNIQUE_VIOLATION)
+
+	calls.clear()
+	with pytest.raises(FakePgError):
+		db._retrying(broken, 'test')
+	assert len(calls) == 1
+
+
+def test_retrying_gives_up_after_the_last_attempt(monkeypatch):
+	monkeypatch.setattr(db.time, 'sleep', lambda seconds: None)
+	calls = []
+
+	def down():
+		calls.append(1)
+		raise psycopg2.OperationalError('could not connect')
+
+	with pytest.raises(psycopg2.OperationalError):
+		db._retrying(down, 'test', attempts=3)
+	assert len(calls) == 3
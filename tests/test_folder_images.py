@@ -0,0 +1,127 @@
+import os
+
+from folder_images import (
+	NameIndex, forget_stale_matches, load_manifest, picture_slots, picture_values, plan_updates, save_manifest,
+	scan_changed_folders,
+)
+from sync_plan import row_hash
+
+
+def _row(product_id, name, urls=()):
+	# a row of the index query: id, name, the five picture columns, product_images urls
+	return (product_id, name, *picture_slots(list(urls)), list(urls))
+
+
+def test_picture_slots_fill_the_five_columns():
+	urls = [f'/u/{i}.png' for i in range(7)]
+
+	assert picture_slots(urls[:2]) == ['/u/0.png', '/u/1.png', None, None, None]
+	assert picture_slots(urls) == urls[:5]
+	assert picture_values(urls[:2]) == ['/u/0.png', '/u/1.png', None, None, None, '/u/0.png', '/u/1.png']
+
+
+def test_folders_resolve_exactly_first_then_case_folded():
+	index = NameIndex([_row('1', 'Ferrari'), _row('2', 'ferrari'), _row('3', 'STRASSE'), _row('4', None)])
+
+	assert index.resolve('ferrari') == ('2', 'ferrari')
+	assert index.resolve('Ferrari') == ('1', 'Ferrari')
+	assert index.resolve('FERRARI') == ('1', 'Ferrari')
+	assert index.resolve('Straße') == ('3', 'STRASSE')
+	assert index.resolve('Bugatti') is None
+
+
+def test_plan_updates_lets_the_last_folder_win():
+	index = NameIndex([_row('1', 'Ferrari'), _row('2', 'Bugatti')])
+	folders = [('Ferrari', ['/a.png']), ('ferrari', ['/b.png']), ('Porsche', ['/c.png'])]
+
+	updates, unmatched = plan_updates(folders, index)
+
+	assert updates == {'1': ('Ferrari', ['/b.png'])}
+	assert unmatched == ['Porsche']
+
+
+
+def _folder(base, name, files):
+	folder = base / name
+	folder.mkdir(parents=True, exist_ok=True)
+	for file in files:
+		(folder / file).write_bytes(b'')
+	return folder
+
+
+def _bump_mtime(folder):
+	stat = folder.stat()
+	os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_scan_lists_image_folders(tmp_path):
+	_folder(tmp_path, 'Ferrari', ['b.png', 'a.JPG', 'notes.txt'])
+	_folder(tmp_path, 'Empty', ['notes.txt'])
+	_folder(tmp_path, '_blobs', ['ab.png'])
+
+	changed, seen = scan_changed_folders(tmp_path, {})
+
+	assert seen == {'Ferrari', 'Empty'}
+	assert [(name, urls, stamp['files']) for name, urls, stamp in changed] == [
+		('Ferrari', ['/uploads/products/Ferrari/a.JPG', '/uploads/products/Ferrari/b.png'], ['a.JPG', 'b.png']),
+	]
+
+
+def test_scan_skips_matched_folders_until_their_files_change(tmp_path):
+	ferrari = _folder(tmp_path, 'Ferrari', ['a.png'])
+	_folder(tmp_path, 'Unknown', ['a.png'])
+	manifest = {name: dict(stamp, product_id='1') for name, _urls, stamp in scan_changed_folders(tmp_path, {})[0]}
+	del manifest['Unknown']['product_id']
+
+	# unmatched folders are retried every time
+	assert [name for name, *_ in scan_changed_folders(tmp_path, manifest)[0]] == ['Unknown']
+
+	# touched, same files: only the stamp moves
+	_bump_mtime(ferrari)
+	assert [name for name, *_ in scan_changed_folders(tmp_path, manifest)[0]] == ['Unknown']
+	assert manifest['Ferrari']['mtime_ns'] == ferrari.stat().st_mtime_ns
+
+	(ferrari / 'b.png').write_bytes(b'')
+	_bump_mtime(ferrari)
+	assert [name for name, *_ in scan_changed_folders(tmp_path, manifest)[0]] == ['Ferrari', 'Unknown']
+
+
+class IndexCursor:
+	def __init__(self, rows):
+		self.rows = rows
+
+	def execute(self, query, params=None):
+		self.ids = params[0]
+
+	def fetchall(self):
+		return [row for row in self.rows if row[0] in self.ids]
+
+
+def test_matches_whose_product_lost_its_pictures_are_forgotten():
+	pictures = row_hash(picture_values(['/a.png']))
+	manifest = {
+		'Kept': {'product_id': '1', 'pictures': pictures},
+		'Cleared': {'product_id': '2', 'pictures': pictures},
+		'Recreated': {'product_id': '3', 'pictures': pictures},
+		'Old format': {'product_id': '1'},
+		'Unmatched': {'hash': 'x'},
+	}
+	cur = IndexCursor([_row('1', 'Kept', ['/a.png']), _row('2', 'Cleared')])
+
+	assert forget_stale_matches(cur, manifest) == 3
+
+	assert cur.ids == ['1', '2', '3']
+	assert [name for name, entry in manifest.items() if entry.get('product_id')] == ['Kept']
+
+
+def test_manifest_round_trip(tmp_path):
+	path = tmp_path / '.scan-manifest.json'
+	folders = {'Ferrari': {'mtime_ns': 1, 'files': ['a.png'], 'hash': 'x', 'product_id': '1'}}
+
+	save_manifest(path, folders)
+
+	assert load_manifest(path) == folders
+	assert load_manifest(tmp_path / 'missing.json') == {}
+	assert load_manifest(None) == {}
+	path.write_text('{not json')
+	assert load_manifest(path) == {}
@@ -0,0 +1,85 @@
+import hashlib
+import io
+
+from image_store import BLOB_DIRNAME, map_bounded, sniff_extension, store_image_stream
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 40
+# an EMF record starts with type 1 (EMR_HEADER), which no magic number matches
+EMF = b'\x01\x00\x00\x00\x6c\x00\x00\x00' + b'\x20' * 100
+
+
+def test_sniff_extension():
+	assert sniff_extension(PNG) == '.png'
+	assert sniff_extension(b'\xff\xd8\xff\xe0rest') == '.jpg'
+	assert sniff_extension(b'RIFF\0\0\0\0WEBPVP8 ') == '.webp'
+	assert sniff_extension(EMF) == '.bin'
+	assert sniff_extension(EMF, default='.emf') == '.emf'
+
+
+def test_stored_bytes_are_content_addressed(tmp_path):
+	url, written, size = store_image_stream(io.BytesIO(PNG), 'P1', tmp_path, chunk_size=7)
+
+	name = hashlib.sha256(PNG).hexdigest()[:32] + '.png'
+	assert url == f'/uploads/products/P1/{name}'
+	assert (written, size) == (True, len(PNG))
+	assert (tmp_path / 'P1' / name).read_bytes() == PNG
+	assert (tmp_path / BLOB_DIRNAME / name[:2] / name).read_bytes() == PNG
+
+
+def test_unknown_formats_keep_their_part_extension(tmp_path):
+	url, _written, _size = store_image_stream(io.BytesIO(EMF), 'P1', tmp_path, ext='.emf')
+
+	assert url.endswith('.emf')
+	assert (tmp_path / 'P1' / url.rsplit('/', 1)[1]).read_bytes() == EMF
+
+
+def test_sniffed_format_wins_over_the_part_extension(tmp_path):
+	url, _written, _size = store_image_stream(io.BytesIO(PNG), 'P1', tmp_path, ext='.jpeg')
+
+	assert url.endswith('.png')
+
+
+def test_restoring_the_same_image_changes_nothing(tmp_path):
+	store_image_stream(io.BytesIO(PNG), 'P1', tmp_path)
+	_url, written, _size = store_image_stream(io.BytesIO(PNG), 'P1', tmp_path)
+	_url, shared, _size = store_image_stream(io.BytesIO(PNG), 'P2', tmp_path)
+
+	assert (written, shared) == (False, True)
+	assert len(list((tmp_path / BLOB_DIRNAME).rglob('*.png'))) == 1
+	assert not list((tmp_path / BLOB_DIRNAME).glob('.tmp-*'))
+
+
+def test_dry_run_writes_nothing(tmp_path):
+	_url, written, _size = store_image_stream(io.BytesIO(PNG), 'P1', tmp_path, dry_run=True)
+
+	assert written
+	assert not any(tmp_path.iterdir())
+
+
+def test_map_bounded_reports_errors_per_item():
+	def fn(n):
+		if n == 3:
+			raise ValueError('bad image')
+		return n * 2
+
+	for workers in (1, 4):
+		results = {idx: (result, err) for idx, result, err in map_bounded(fn, range(6), workers=workers, max_pending=2)}
+		assert {idx: r for idx, (r, err) in results.items() if err is None} == {0: 0, 1: 2, 2: 4, 4: 8, 5: 10}
+		assert isinstance(results[3][1], ValueError)
+
+
+def test_map_bounded_pulls_items_lazily():
+	pulled = []
+
+	def items():
+		for n in range(100):
+			pulled.append(n)
+			yield n
+
+	results = map_bounded(lambda n: n, items(), workers=4, max_pending=3)
+	first = next(results)
+
+	# only the items in flight (plus the one waiting for a slot) have been read
+	assert first[2] is None
+	assert len(pulled) <= 4
+	assert sorted(idx for idx, _r, _e in [first, *results]) == list(range(100))
@@ -0,0 +1,53 @@
+import hashlib
+import io
+
+from PIL import Image
+
+from image_variants import generate_variants, variant_path
+
+
+def _png(color, size=(64, 32)):
+	buf = io.BytesIO()
+	Image.new('RGB', size, color).save(buf, format='PNG')
+	return buf.getvalue()
+
+
+def _pixel(path):
+	with Image.open(path) as im:
+		return im.convert('RGB').getpixel((0, 0))
+
+
+def _write(path, data):
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_bytes(data)
+	return path
+
+
+def test_same_name_different_content_gets_own_variants(tmp_path):
+	red = _write(tmp_path / 'A' / 'front.png', _png((255, 0, 0)))
+	blue = _write(tmp_path / 'B' / 'front.png', _png((0, 0, 255)))
+
+	created, skipped = generate_variants([red, blue], widths=(16,), workers=1)
+
+	assert (created, skipped) == (2, 0)
+	assert _pixel(variant_path(red, 16, 'webp'))[0] > 200
+	assert _pixel(variant_path(blue, 16, 'webp'))[2] > 200
+
+
+def test_content_addressed_duplicates_are_encoded_once(tmp_path):
+	data = _png((0, 255, 0))
+	name = hashlib.sha256(data).hexdigest()[:32] + '.png'
+	first = _write(tmp_path / 'A' / name, data)
+	second = _write(tmp_path / 'B' / name, data)
+
+	created, skipped = generate_variants([first, second], widths=(16,), workers=1)
+
+	assert (created, skipped) == (1, 0)
+	assert variant_path(second, 16, 'webp').read_bytes() == variant_path(first, 16, 'webp').read_bytes()
+
+
+def test_existing_variants_are_skipped(tmp_path):
+	src = _write(tmp_path / 'A' / 'front.png', _png((255, 0, 0)))
+	generate_variants([src], widths=(16, 32), workers=1)
+
+	assert generate_variants([src], widths=(16, 32), workers=1) == (0, 2)
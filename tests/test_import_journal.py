@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from import_journal import ImportJournal, journal_name
+
+
+@pytest.fixture
+def workbook(tmp_path):
+	path = tmp_path / 'catalog.xlsx'
+	path.write_bytes(b'workbook bytes')
+	return path
+
+
+def _journal(workbook, resume=False):
+	return ImportJournal.for_workbook(workbook, workbook.parent / '.import-journal', sheet='Sheet1', resume=resume)
+
+
+def test_journal_name_depends_on_every_input():
+	names = {journal_name('abc', 'Sheet1', 'id'), journal_name('abd', 'Sheet1', 'id'),
+		journal_name('abc', 'Sheet2', 'id'), journal_name('abc', 'Sheet1', 'Name'), journal_name('abc', None, 'id')}
+	assert len(names) == 5
+
+
+def test_resume_restores_checkpoints(workbook):
+	journal = _journal(workbook)
+	journal.rows_committed(5000)
+	journal.image_stored(0, 'p1', '/uploads/products/p1/a.png')
+	journal.stage_done('ingest')
+	journal.close()
+
+	resumed = _journal(workbook, resume=True)
+
+	assert resumed.resumed
+	assert resumed.rows_done == 5000
+	assert resumed.images == {0: ('p1', '/uploads/products/p1/a.png')}
+	assert resumed.is_done('ingest') and not resumed.is_done('images')
+	resumed.close()
+
+
+def test_without_resume_the_journal_starts_over(workbook):
+	journal = _journal(workbook)
+	journal.rows_committed(10)
+	journal.close()
+
+	fresh = _journal(workbook)
+	fresh.close()
+
+	assert not fresh.resumed and fresh.rows_done == 0
+	assert [json.loads(line)['event'] for line in fresh.path.read_text().splitlines()] == ['start']
+
+
+def test_a_torn_last_line_is_dropped(workbook):
+	journal = _journal(workbook)
+	journal.rows_committed(10)
+	journal.close()
+	with open(journal.path, 'a', encoding='utf-8') as f:
+		f.write('{"event": "rows", "do')
+
+	resumed = _journal(workbook, resume=True)
+	resumed.rows_committed(20)
+	resumed.close()
+
+	lines = [json.loads(line) for line in journal.path.read_text().splitlines()]
+	assert [rec.get('done') for rec in lines] == [None, 10, 20]
+
+
+def test_a_changed_workbook_is_not_resumed(workbook):
+	journal = _journal(workbook)
+	path = journal.path
+	journal.rows_committed(10)
+	journal.close()
+	# same name on disk, other contents: only the journal for the old bytes holds checkpoints
+	header = json.loads(path.read_text().splitlines()[0])
+	header['sha256'] = 'f' * 64
+	path.write_text(json.dumps(header) + '\n' + '{"event": "rows", "done": 10}\n')
+
+	resumed = ImportJournal(path, dict(header, sha256='0' * 64), resume=True)
+	resumed.close()
+
+	assert not resumed.resumed and resumed.rows_done == 0
+
+
+def test_remove_deletes_the_journal(workbook):
+	journal = _journal(workbook)
+	journal.rows_committed(10)
+
+	journal.remove()
+
+	assert not journal.path.exists()
+	fresh = _journal(workbook, resume=True)
+	assert not fresh.resumed
+	fresh.close()
@@ -0,0 +1,89 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from json_stream import iter_json_records, read_json_records
+
+READ_SIZES = [1, 2, 3, 5, 16, 1 << 16]
+
+RECORDS = [
+	{'id': 'P1', 'name': 'Ferrari [42143] {Technic}', 'price': 449.99, 'pieces': 3778},
+	{'id': 'P2', 'name': 'Quote " and backslash \\ and \\"', 'price': None, 'tags': ['a', 'b]', '{c']},
+	{'id': 'P3', 'name': 'Ünïcode ✓  ', 'nested': {'deep': [[1, 2.5e-3], {'x': True, 'y': False}]}},
+	{'id': 'P4', 'name': '', 'price': -0.5},
+]
+
+
+class CountingReader(io.StringIO):
+	def __init__(self, text):
+		super().__init__(text)
+		self.reads = 0
+
+	def read(self, size=-1):
+		self.reads += 1
+		return super().read(size)
+
+
+def _records(text, read_size):
+	return list(iter_json_records(io.StringIO(text), read_size=read_size))
+
+
+@pytest.mark.parametrize('read_size', READ_SIZES)
+@pytest.mark.parametrize('layout', ['compact', 'pretty', 'ndjson'])
+def test_records_round_trip(layout, read_size):
+	if layout == 'compact':
+		text = json.dumps(RECORDS, separators=(',', ':'), ensure_ascii=False)
+	elif layout == 'pretty':
+		text = json.dumps(RECORDS, indent=2)
+	else:
+		text = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in RECORDS)
+
+	assert _records(text, read_size) == RECORDS
+
+
+@pytest.mark.parametrize('read_size', READ_SIZES)
+@pytest.mark.parametrize('text, expected', [
+	('[2.5]', [2.5]),
+	('[1, -20, 3.25e+2, true, false, null]', [1, -20, 325.0, True, False, None]),
+	('12345\n-6.5\ntrue\nnull\n"text"\n', [12345, -6.5, True, None, 'text']),
+	('  123456789  ', [123456789]),
+	('[]', []),
+	(' [ ] ', []),
+	('', []),
+])
+def test_scalars_are_not_cut_at_chunk_edges(text, expected, read_size):
+	assert _records(text, read_size) == expected
+
+
+@pytest.mark.parametrize('read_size', READ_SIZES)
+@pytest.mark.parametrize('text', [
+	'[{"id": 1} {"id": 2}]',
+	'[{"id": 1},',
+	'[{"id": 1}, 2.5.1]',
+	'[{"id": tru}]',
+	'{"id": 1',
+	'[1] 2',
+])
+def test_malformed_input_raises(text, read_size):
+	with pytest.raises(ValueError):
+		_records(text, read_size)
+
+
+def test_malformed_record_fails_without_reading_the_rest():
+	good = json.dumps({'id': 'P', 'name': 'x' * 50})
+	text = '[{"id": "bad", "price": 1.2.3},' + ','.join([good] * 2000) + ']'
+	fp = CountingReader(text)
+
+	with pytest.raises(ValueError):
+		list(iter_json_records(fp, read_size=64))
+	assert fp.reads < 5
+
+
+def test_reads_gzip(tmp_path):
+	path = tmp_path / 'export.json.gz'
+	with gzip.open(path, 'wt', encoding='utf-8') as f:
+		json.dump(RECORDS, f)
+
+	assert list(read_json_records(path, read_size=7)) == RECORDS
@@ -0,0 +1,34 @@
+import hashlib
+import io
+
+import pytest
+
+import product_images
+from image_store import store_image_stream
+from product_images import url_hash
+
+
+@pytest.mark.parametrize('url, expected', [
+	('/uploads/products/1/' + 'ab' * 16 + '.png', 'ab' * 16),
+	('/uploads/products/1/' + 'ab' * 16 + '.jpeg', 'ab' * 16),
+	('/uploads/products/1/' + 'AB' * 16 + '.png', None),
+	('/uploads/products/1/' + 'ab' * 15 + '.png', None),
+	('/uploads/products/1/' + 'ab' * 16, None),
+	('/uploads/products/1/photo.png', None),
+	('', None),
+	(None, None),
+])
+def test_url_hash(url, expected):
+	assert url_hash(url) == expected
+
+
+def test_url_hash_reads_the_names_image_store_writes(tmp_path):
+	data = b'not really an image'
+	url, _written, _size = store_image_stream(io.BytesIO(data), 'p1', tmp_path, ext='.emf')
+
+	assert url_hash(url) == hashlib.sha256(data).hexdigest()[:32]
+
+
+def test_sql_and_python_patterns_agree():
+	# the SQL backfill extracts the hash with the same expression as url_hash
+	assert product_images._HASH_NAME_SQL == product_images._HASH_NAME.pattern
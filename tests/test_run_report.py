@@ -0,0 +1,60 @@
+import threading
+
+from run_report import RunReport
+import run_report
+
+
+def _allocate(n):
+	return bytearray(n)
+
+
+def test_serial_stage_peaks_are_measured_separately():
+	report = RunReport(profile=True)
+	with report.activate():
+		with run_report.stage('big'):
+			data = _allocate(4 << 20)
+			del data
+		with run_report.stage('small'):
+			data = _allocate(1 << 10)
+			del data
+
+	big, small = report.stages
+	assert big['tracemalloc_peak_bytes'] >= 4 << 20
+	assert small['tracemalloc_peak_bytes'] < 1 << 20
+	assert 'tracemalloc_peak_approximate' not in big
+	assert 'tracemalloc_peak_approximate' not in small
+
+
+def test_overlapping_stages_are_marked_approximate():
+	report = RunReport(profile=True)
+	inside = threading.Event()
+	release = threading.Event()
+
+	def other():
+		with run_report.stage('images'):
+			inside.set()
+			release.wait(5)
+
+	with report.activate():
+		thread = threading.Thread(target=other)
+		thread.start()
+		inside.wait(5)
+		with run_report.stage('ingest'):
+			release.set()
+		thread.join()
+
+	assert all(s['tracemalloc_peak_approximate'] for s in report.stages)
+
+
+def test_counters_go_to_the_current_stage():
+	report = RunReport()
+	with report.activate():
+		run_report.count('runs')
+		with run_report.stage('ingest'):
+			run_report.count('rows', 3)
+			run_report.count('rows', 2)
+
+	assert report.counters == {'runs': 1}
+	assert report.stages[0]['counters'] == {'rows': 5}
+	assert report.status == 'ok'
+	assert run_report.active() is None
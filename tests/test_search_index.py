@@ -0,0 +1,83 @@
+import pytest
+
+from search_index import SearchIndex, build_index, set_numbers, tokenize
+
+PRODUCTS = [
+	('1', 'LEGO Technic 42143 Ferrari Daytona SP3', 'A supercar with a V12 engine'),
+	('2', 'LEGO Technic Bugatti Chiron (42083)', 'Ferrari rival from Molsheim'),
+	('3', 'LEGO Speed Champions Ferrari 812', None),
+	('4', 'Café Corner', 'Modular building, façade in ÉCRU'),
+	('5', 'Set 42143 spare parts', ''),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+	path = tmp_path / 'search.idx'
+	assert build_index(PRODUCTS, path) == (5, len({t for p in PRODUCTS for f in p[1:] for t in tokenize(f)}))
+	with SearchIndex(path) as index:
+		yield index
+
+
+@pytest.mark.parametrize('text, expected', [
+	('LEGO Technic 42143', ['lego', 'technic', '42143']),
+	('Daytona-SP3 (V12)', ['daytona', 'sp3', 'v12']),
+	('snake_case', ['snake', 'case']),
+	('Café ÉCRU Straße', ['café', 'écru', 'strasse']),
+	('', []),
+	(None, []),
+])
+def test_tokenize(text, expected):
+	assert tokenize(text) == expected
+
+
+def test_set_numbers():
+	assert set_numbers('GT4 (42176) and 75192, not 123 or 1234567') == {42176, 75192}
+	assert set_numbers(None) == set()
+
+
+def test_whole_word_name_matches_rank_above_description_matches(index):
+	assert index.search('ferrari') == [('1', 4), ('3', 4), ('2', 2)]
+
+
+def test_every_token_must_match(index):
+	assert index.search('ferrari technic') == [('1', 8), ('2', 6)]
+	assert index.search('ferrari modular') == []
+	assert index.search('zzz') == []
+	assert index.search('  ') == []
+
+
+def test_prefixes_match_with_a_lower_score(index):
+	assert index.search('ferr') == [('1', 1), ('2', 1), ('3', 1)]
+	assert index.search('FAÇADE') == [('4', 2)]
+
+
+def test_set_numbers_rank_highest(index):
+	assert index.search('42143') == [('1', 8), ('5', 8)]
+	assert index.search('42083') == [('2', 8)]
+	assert index.search('4214') == [('1', 1), ('5', 1)]
+
+
+def test_limit_and_product_ids(index):
+	assert index.search('lego', limit=2) == [('1', 4), ('2', 4)]
+	assert [index.product_id(doc) for doc in range(index.documents)] == ['1', '2', '3', '4', '5']
+
+
+def test_rejects_other_files(tmp_path):
+	path = tmp_path / 'junk.idx'
+	path.write_bytes(b'\0' * 128)
+
+	with pytest.raises(ValueError):
+		SearchIndex(path)
+
+
+def test_probing_few_candidates_matches_walking_the_lists(tmp_path):
+	# one rare token against a common one makes the search binary-search the long list
+	products = [(str(i), f'LEGO City {i}', 'rare gem' if i % 500 == 7 else 'common') for i in range(3000)]
+	path = tmp_path / 'search.idx'
+	build_index(products, path)
+
+	with SearchIndex(path) as index:
+		results = index.search('lego rare', limit=100)
+
+	assert results == [(str(i), 6) for i in range(7, 3000, 500)]
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from stage_scheduler import Stage, run_stages, select_stages
+
+
+def _recorder(log, name, result=None):
+	def fn(results):
+		log.append((name, sorted(results)))
+		return result if result is not None else name
+	return fn
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_stages_run_after_their_dependencies(workers):
+	log = []
+	stages = [
+		Stage('export', _recorder(log, 'export'), deps=('ingest', 'rescan')),
+		Stage('rescan', _recorder(log, 'rescan'), deps=('ingest', 'images')),
+		Stage('images', _recorder(log, 'images')),
+		Stage('ingest', _recorder(log, 'ingest')),
+	]
+
+	results = run_stages(stages, workers=workers)
+
+	assert results == {name: name for name in ('export', 'rescan', 'images', 'ingest')}
+	order = [name for name, _seen in log]
+	assert order.index('rescan') > max(order.index('ingest'), order.index('images'))
+	assert order[-1] == 'export'
+	assert dict(log)['export'] == ['images', 'ingest', 'rescan']
+
+
+def test_one_worker_runs_on_the_calling_thread():
+	threads = []
+	stages = [Stage(name, lambda results: threads.append(threading.get_ident())) for name in ('a', 'b')]
+
+	run_stages(stages, workers=1)
+
+	assert threads == [threading.get_ident()] * 2
+
+
+def test_unselected_dependencies_count_as_satisfied():
+	stages = [Stage('export', lambda results: 'done', deps=('ingest',))]
+
+	assert run_stages(stages) == {'export': 'done'}
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_failure_blocks_dependents_only(workers):
+	log = []
+
+	def boom(results):
+		raise RuntimeError('ingest failed')
+
+	stages = [
+		Stage('ingest', boom),
+		Stage('export', _recorder(log, 'export'), deps=('ingest',)),
+		Stage('images', _recorder(log, 'images')),
+	]
+
+	with pytest.raises(RuntimeError, match='ingest failed'):
+		run_stages(stages, workers=workers)
+	assert [name for name, _seen in log] == ['images']
+
+
+def test_cycle_is_reported():
+	stages = [Stage('a', lambda r: None, deps=('b',)), Stage('b', lambda r: None, deps=('a',))]
+
+	with pytest.raises(ValueError, match='cycle'):
+		run_stages(stages)
+
+
+def test_select_stages():
+	stages = [Stage(name, None) for name in ('ingest', 'images', 'export')]
+	names = ('ingest', 'images', 'export', 'facets')
+
+	assert [s.name for s in select_stages(stages, only=['export', 'facets'], names=names)] == ['export']
+	assert [s.name for s in select_stages(stages, skip=['images'], names=names)] == ['ingest', 'export']
+	with pytest.raises(ValueError, match='Unknown stage'):
+		select_stages(stages, only=['nope'], names=names)
@@ -0,0 +1,84 @@
+from decimal import Decimal
+
+import pandas as pd
+
+from bulk_load import PRODUCT_COLUMNS, UPSERT_COLUMNS
+from column_mapping import ColumnMapping
+from sync_plan import SyncPlan, row_hash
+
+
+def _db_row(name, description=None, price_text=None, pieces=None, price=None):
+	# the UPSERT_COLUMNS values as psycopg2 returns them
+	return (name, description, price_text, pieces, price)
+
+
+def _frame(rows):
+	headers = ['id', 'name', 'description', 'price_shipping_included', 'lego_pieces']
+	return ColumnMapping(headers).apply(pd.DataFrame.from_records(rows, columns=headers)).rows
+
+
+def test_row_hash_tells_null_from_text():
+	assert row_hash([None]) != row_hash(['\\N']) != row_hash([''])
+	assert row_hash(['a', 'b']) != row_hash(['a\tb'])
+	assert row_hash([1, Decimal('2.50')]) == row_hash(['1', '2.50'])
+
+
+def test_diff_keeps_only_rows_that_need_writing():
+	state = {
+		'same': row_hash(_db_row('Ferrari', None, '1.299 €', 1677, Decimal('1299.00'))),
+		'changed': row_hash(_db_row('Bugatti', None, '379$', 3599, Decimal('379.00'))),
+		'gone': row_hash(_db_row('Old')),
+	}
+	plan = SyncPlan(state, prune=True)
+	frame = _frame([
+		('same', 'Ferrari', None, '1.299 €', '1677'),
+		('changed', 'Bugatti', None, '399$', '3599'),
+		('new', 'Porsche', 'GT3', None, None),
+	])
+
+	written = plan.diff(frame)
+
+	assert list(written['id']) == ['changed', 'new']
+	assert list(written.columns) == list(PRODUCT_COLUMNS)
+	assert plan.inserts == ['new']
+	assert plan.updates == ['changed']
+	assert plan.deletes == ['gone']
+	assert plan.summary() == '1 inserts, 1 updates, 1 unchanged, 1 deletes'
+
+
+def test_duplicate_ids_compare_with_the_earlier_row():
+	plan = SyncPlan({})
+	frame = _frame([('a', 'A', None, None, None), ('a', 'A', None, None, None), ('a', 'B', None, None, None)])
+
+	written = plan.diff(frame)
+
+	assert len(written) == 2
+	assert plan.inserts == ['a']
+	assert plan.unchanged == 1
+
+
+def test_deletes_need_prune():
+	plan = SyncPlan({'gone': row_hash(_db_row('Old'))})
+	plan.diff(_frame([]))
+
+	assert plan.deletes == []
+	assert plan.apply_deletes(None) == 0
+	assert 'deletes' not in plan.summary()
+
+
+def test_print_limits_the_listed_ids(capsys):
+	plan = SyncPlan({})
+	plan.diff(_frame([(str(i), 'x', None, None, None) for i in range(5)]))
+
+	plan.print(limit=2)
+
+	assert capsys.readouterr().out.splitlines() == [
+		'[dry-run] Sync plan: 5 inserts, 0 updates, 0 unchanged',
+		'[dry-run]   insert id=0',
+		'[dry-run]   insert id=1',
+		'[dry-run]   ... and 3 more to insert',
+	]
+
+
+def test_columns_default_to_the_upserted_ones():
+	assert SyncPlan({}).columns == UPSERT_COLUMNS
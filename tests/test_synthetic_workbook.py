@@ -0,0 +1,30 @@
+import hashlib
+
+from column_mapping import ColumnMapping, iter_mapped
+from synthetic_workbook import HEADERS, generate_workbook, image_rows, synthetic_png, synthetic_rows
+from workbook_stream import WorkbookStream
+
+
+def test_rows_are_reproducible_per_seed():
+	assert list(synthetic_rows(5, seed=1)) == list(synthetic_rows(5, seed=1))
+	assert list(synthetic_rows(5, seed=1)) != list(synthetic_rows(5, seed=2))
+
+
+def test_images_are_distinct_and_spread_over_the_rows():
+	assert len({hashlib.sha256(synthetic_png(i, 4)).digest() for i in range(300)}) == 300
+	assert image_rows(10, 4) == [0, 2, 5, 7]
+	assert image_rows(3, 5) == [0, 1, 2, 0, 1]
+	assert image_rows(0, 5) == []
+
+
+def test_generated_workbook_maps_without_rejects(tmp_path):
+	path = tmp_path / 'catalog.xlsx'
+	assert generate_workbook(path, rows=50, images=5, image_size=4) == (50, 5)
+
+	with WorkbookStream(path) as stream:
+		assert stream.headers == list(HEADERS)
+		batches = [batch for batch, _consumed in iter_mapped(stream, ColumnMapping(stream.headers), chunk_size=20)]
+
+	assert [len(batch) for batch in batches] == [20, 20, 10]
+	assert all(batch.rejected.empty for batch in batches)
+	assert all(batch.rows['price'].notna().all() for batch in batches)
@@ -0,0 +1,56 @@
+import pytest
+from openpyxl import Workbook
+
+from workbook_stream import WorkbookStream, normalize_headers
+
+
+@pytest.mark.parametrize('values, expected', [
+	(['id', 'name'], ['id', 'name']),
+	([' LEGO pieces ', 'price\nshipping'], ['LEGO_pieces', 'price_shipping']),
+	(['id', None, ''], ['id', 'Unnamed:_1', 'Unnamed:_2']),
+	(['pictures', 'pictures', 'pictures'], ['pictures', 'pictures.1', 'pictures.2']),
+	(['a', 'a', 'a.1'], ['a', 'a.2', 'a.1']),
+	(['a.1', 'a', 'a'], ['a.1', 'a', 'a.2']),
+	([42, 42], ['42', '42.1']),
+])
+def test_normalize_headers(values, expected):
+	assert normalize_headers(values) == expected
+
+
+@pytest.fixture
+def workbook(tmp_path):
+	wb = Workbook()
+	ws = wb.active
+	ws.title = 'Products'
+	ws.append(['Name', 'id', 'pieces'])
+	ws.append(['Ferrari', 42143, 1677])
+	ws.append([None, None, None])
+	ws.append(['No id', None])
+	ws.append(['Bugatti', 'B-1', 3599, 'extra'])
+	path = tmp_path / 'catalog.xlsx'
+	wb.save(path)
+	return path
+
+
+def test_chunks_skip_blank_rows_and_record_row_ids(workbook):
+	with WorkbookStream(workbook) as stream:
+		chunks = list(stream.iter_chunks(2))
+
+		assert stream.sheet_title == 'Products'
+		# the header row spans the sheet's widest row
+		assert stream.headers == ['Name', 'id', 'pieces', 'Unnamed:_3']
+		assert chunks == [
+			([2, 4], [('Ferrari', 42143, 1677, None), ('No id', None, None, None)]),
+			([5], [('Bugatti', 'B-1', 3599, 'extra')]),
+		]
+		assert stream.row_ids == {2: '42143', 5: 'B-1'}
+		assert stream.row_count == 3
+		with pytest.raises(RuntimeError):
+			list(stream.iter_chunks())
+
+
+def test_id_header_is_normalized_and_drain_fills_row_ids(workbook):
+	with WorkbookStream(workbook, id_header=' Name ') as stream:
+		stream.drain()
+
+		assert stream.row_ids == {2: 'Ferrari', 4: 'No id', 5: 'Bugatti'}
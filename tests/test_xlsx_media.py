@@ -0,0 +1,30 @@
+import io
+
+from PIL import Image
+
+from synthetic_workbook import generate_workbook, image_rows, synthetic_png
+from xlsx_media import SheetMedia
+
+
+def test_pictures_come_out_with_their_rows_and_bytes(tmp_path):
+	path = tmp_path / 'catalog.xlsx'
+	generate_workbook(path, rows=10, images=4, image_size=8, sheet_title='Products')
+
+	with SheetMedia(path) as media:
+		assert media.sheet_title == 'Products'
+		refs = list(media)
+		assert [ref.row for ref in refs] == [row + 2 for row in image_rows(10, 4)]
+		assert {ref.ext for ref in refs} == {'.png'}
+		for index, ref in enumerate(refs):
+			with media.open(ref) as src:
+				data = src.read()
+			with Image.open(io.BytesIO(data)) as stored, Image.open(io.BytesIO(synthetic_png(index, 8))) as original:
+				assert stored.tobytes() == original.tobytes()
+
+
+def test_sheet_without_pictures(tmp_path):
+	path = tmp_path / 'catalog.xlsx'
+	generate_workbook(path, rows=3)
+
+	with SheetMedia(path, 'Sheet1') as media:
+		assert list(media) == []